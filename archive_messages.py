@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+消息归档脚本
+把超过保留期的消息从 messages 分批移入 messages_archive（与后台定时归档相同的逻辑），
+适合首次上线时一次性搬迁大量历史数据，或由 cron 定时执行。每批独立提交，中断后重跑即可继续。
+
+用法: python archive_messages.py --days 180 --batch-size 1000 [--max-batches 100]
+"""
+import argparse
+import time
+
+from app import app
+from utils.archiver import message_archiver
+
+
+def main():
+    parser = argparse.ArgumentParser(description='归档过期消息')
+    parser.add_argument('--days', type=int, default=message_archiver.after_days, help='保留天数，早于该天数的消息被归档')
+    parser.add_argument('--batch-size', type=int, default=message_archiver.batch_size, help='每批移动的消息数')
+    parser.add_argument('--max-batches', type=int, default=None, help='最多执行的批次数（默认直到全部归档）')
+    parser.add_argument('--pause-ms', type=int, default=int(message_archiver.batch_pause * 1000), help='批次之间暂停的毫秒数')
+    args = parser.parse_args()
+
+    message_archiver.after_days = args.days
+    message_archiver.batch_size = args.batch_size
+    message_archiver.batch_pause = args.pause_ms / 1000
+
+    started = time.time()
+    print(f'归档 {message_archiver.cutoff().isoformat()} 之前的消息，每批 {args.batch_size} 条...')
+    with app.app_context():
+        moved = message_archiver.run(sleep=time.sleep, max_batches=args.max_batches)
+    print(f'✓ 完成：移入归档表 {moved} 条，共 {message_archiver.batches} 批，耗时 {time.time() - started:.1f} 秒')
+
+
+if __name__ == '__main__':
+    main()
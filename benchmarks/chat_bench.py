@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Socket.IO 聊天链路压测
+
+启动一个 app.py（默认使用临时 SQLite + fakeredis 作为本地替身，也可以指向本地 MySQL / Redis），
+由多个客户端进程模拟成千上万个 python-socketio 客户端：连接 -> 加入房间 -> 按速率发送消息，
+统计连接速率、发送吞吐、发送确认延迟和端到端投递延迟（p50/p99），结果写入 JSON，便于跨提交对比。
+
+用法:
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/chat_bench.py --clients 2000 --rooms 20 --messages 5 --output bench.json
+    python benchmarks/chat_bench.py --redis local --redis-port 6379 --database-url mysql+pymysql://...
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FAKE_REDIS_CODE = (
+    "import sys\n"
+    "from fakeredis import TcpFakeServer\n"
+    "TcpFakeServer(('127.0.0.1', int(sys.argv[1])), server_type='redis').serve_forever()\n"
+)
+
+
+def wait_for_port(host, port, timeout=60):
+    """等待端口可连接"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def http_get_json(url):
+    with urllib.request.urlopen(url, timeout=10) as resp:
+        return json.loads(resp.read().decode('utf-8'))
+
+
+def percentiles(values, scale=1000.0):
+    """延迟分位数（默认换算为毫秒）"""
+    if not values:
+        return None
+    values = sorted(values)
+
+    def pick(p):
+        return round(values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))] * scale, 3)
+
+    return {
+        'count': len(values),
+        'mean': round(sum(values) / len(values) * scale, 3),
+        'p50': pick(50),
+        'p90': pick(90),
+        'p99': pick(99),
+        'max': round(values[-1] * scale, 3)
+    }
+
+
+def seed(clients, rooms, run_tag):
+    """直接通过模型写入压测用户、房间和成员关系（避免逐个注册的 bcrypt 开销），返回 [(token, room_id)]"""
+    sys.path.insert(0, ROOT)
+    from flask import Flask
+    from config import SETTINGS
+    from models import db, User, Room, RoomMember
+
+    app = Flask('chat_bench_seed')
+    app.config['SQLALCHEMY_DATABASE_URI'] = SETTINGS['database']['url']
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        template = User(username='_', email='_')
+        template.set_password('bench-password')
+
+        users = [
+            User(username=f'bench_{run_tag}_{i}', email=f'bench_{run_tag}_{i}@bench.local',
+                 password_hash=template.password_hash)
+            for i in range(clients)
+        ]
+        db.session.add_all(users)
+        db.session.flush()
+
+        room_objs = [
+            Room(room_code=f'{run_tag}{i:04d}'[-20:], name=f'bench {run_tag} #{i}',
+                 created_by=users[i % len(users)].id, member_count=0)
+            for i in range(rooms)
+        ]
+        db.session.add_all(room_objs)
+        db.session.flush()
+
+        # 用户按轮询分配到房间
+        assignments = []
+        members = []
+        for i, user in enumerate(users):
+            room = room_objs[i % len(room_objs)]
+            room.member_count += 1
+            members.append(RoomMember(room_id=room.id, user_id=user.id,
+                                      role='admin' if room.created_by == user.id else 'member'))
+            assignments.append((user.generate_token(), room.id))
+        db.session.add_all(members)
+        db.session.commit()
+    return assignments
+
+
+async def run_clients(url, assignments, cfg, barrier):
+    """在一个事件循环中运行一组客户端，返回原始统计"""
+    import socketio
+
+    stats = {
+        'connect': [], 'connect_errors': 0, 'ack': [], 'delivery': [],
+        'send_errors': 0, 'sent_by_room': {}, 'connected_by_room': {},
+        'last_delivery': 0.0
+    }
+    clients = []
+    semaphore = asyncio.Semaphore(cfg['connect_concurrency'])
+    loop = asyncio.get_running_loop()
+
+    async def connect_one(token, room_id):
+        client = socketio.AsyncClient(reconnection=False)
+        joined = asyncio.Event()
+
+        @client.on('new_message')
+        async def on_new_message(data):
+            content = (data.get('message') or {}).get('content', '')
+            if content.startswith('bench|'):
+                now = time.time()
+                stats['delivery'].append(now - float(content.split('|')[1]))
+                stats['last_delivery'] = now
+
+        @client.on('joined_room')
+        async def on_joined_room(data):
+            joined.set()
+
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await client.connect(f'{url}?token={token}', transports=['websocket'], wait_timeout=30)
+                await client.emit('join_room', {'room_id': room_id})
+                await asyncio.wait_for(joined.wait(), 30)
+            except Exception:
+                stats['connect_errors'] += 1
+                try:
+                    await client.disconnect()
+                except Exception:
+                    pass
+                return
+            stats['connect'].append(time.perf_counter() - start)
+        clients.append((client, room_id))
+        stats['connected_by_room'][room_id] = stats['connected_by_room'].get(room_id, 0) + 1
+
+    async def send_loop(client, room_id):
+        interval = 1.0 / cfg['rate'] if cfg['rate'] > 0 else 0.0
+        if interval:
+            await asyncio.sleep(random.random() * interval)  # 错开各客户端的发送时刻
+        for seq in range(cfg['messages']):
+            sent_at = time.time()
+            try:
+                ack = await client.call('send_message', {
+                    'room_id': room_id,
+                    'content': f'bench|{sent_at}|{seq}'
+                }, timeout=60)
+                if ack and ack.get('success'):
+                    stats['ack'].append(time.time() - sent_at)
+                    stats['sent_by_room'][room_id] = stats['sent_by_room'].get(room_id, 0) + 1
+                else:
+                    stats['send_errors'] += 1
+            except Exception:
+                stats['send_errors'] += 1
+            if interval:
+                await asyncio.sleep(max(0.0, interval - (time.time() - sent_at)))
+
+    stats['connect_start'] = time.time()
+    await asyncio.gather(*(connect_one(token, room_id) for token, room_id in assignments))
+    stats['connect_end'] = time.time()
+
+    # 所有进程都连接完成后再同时开始发送
+    await loop.run_in_executor(None, barrier.wait)
+    stats['send_start'] = time.time()
+    await asyncio.gather(*(send_loop(client, room_id) for client, room_id in clients))
+    stats['send_end'] = time.time()
+    await loop.run_in_executor(None, barrier.wait)
+
+    # 等待投递排空：连续 drain 秒没有新消息即结束
+    while True:
+        last = max(stats['last_delivery'], stats['send_end'])
+        if time.time() - last >= cfg['drain']:
+            break
+        await asyncio.sleep(0.2)
+
+    await asyncio.gather(*(client.disconnect() for client, _ in clients), return_exceptions=True)
+    return stats
+
+
+def client_process(url, assignments, cfg, barrier, result_queue):
+    result_queue.put(asyncio.run(run_clients(url, assignments, cfg, barrier)))
+
+
+def summarize(parts):
+    """合并各客户端进程的原始统计"""
+    def merge_counts(key):
+        merged = {}
+        for part in parts:
+            for room_id, count in part[key].items():
+                merged[room_id] = merged.get(room_id, 0) + count
+        return merged
+
+    connect = [v for p in parts for v in p['connect']]
+    ack = [v for p in parts for v in p['ack']]
+    delivery = [v for p in parts for v in p['delivery']]
+    sent_by_room = merge_counts('sent_by_room')
+    connected_by_room = merge_counts('connected_by_room')
+
+    connect_duration = max(p['connect_end'] for p in parts) - min(p['connect_start'] for p in parts)
+    send_start = min(p['send_start'] for p in parts)
+    send_duration = max(p['send_end'] for p in parts) - send_start
+    last_delivery = max([p['last_delivery'] for p in parts] + [send_start])
+    sent = sum(sent_by_room.values())
+    # 房间广播包含发送者自己，期望投递数 = 每个房间的发送数 x 在线成员数
+    expected = sum(count * connected_by_room.get(room_id, 0) for room_id, count in sent_by_room.items())
+
+    return {
+        'connect': {
+            'connected': len(connect),
+            'errors': sum(p['connect_errors'] for p in parts),
+            'duration_s': round(connect_duration, 3),
+            'connects_per_s': round(len(connect) / connect_duration, 2) if connect_duration else None,
+            'latency_ms': percentiles(connect)
+        },
+        'send': {
+            'messages_sent': sent,
+            'errors': sum(p['send_errors'] for p in parts),
+            'duration_s': round(send_duration, 3),
+            'messages_per_s': round(sent / send_duration, 2) if send_duration else None,
+            'ack_latency_ms': percentiles(ack)
+        },
+        'delivery': {
+            'deliveries': len(delivery),
+            'expected': expected,
+            'delivery_ratio': round(len(delivery) / expected, 4) if expected else None,
+            'deliveries_per_s': round(len(delivery) / (last_delivery - send_start), 2)
+            if last_delivery > send_start else None,
+            'latency_ms': percentiles(delivery)
+        }
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Socket.IO 聊天链路压测')
+    parser.add_argument('--clients', type=int, default=500, help='模拟客户端数')
+    parser.add_argument('--rooms', type=int, default=10, help='房间数（客户端轮询分配）')
+    parser.add_argument('--messages', type=int, default=5, help='每个客户端发送的消息数')
+    parser.add_argument('--rate', type=float, default=1.0, help='每个客户端每秒发送的消息数，0 表示不限速')
+    parser.add_argument('--procs', type=int, default=max(1, min(4, os.cpu_count() or 1)), help='客户端进程数')
+    parser.add_argument('--connect-concurrency', type=int, default=100, help='每个进程同时发起的连接数')
+    parser.add_argument('--drain', type=float, default=3.0, help='发送结束后等待投递排空的静默秒数')
+    parser.add_argument('--port', type=int, default=9100, help='被测服务端口')
+    parser.add_argument('--database-url', default=None, help='数据库连接串，默认临时 SQLite 文件')
+    parser.add_argument('--redis', choices=['fake', 'local'], default='fake', help='fake: 启动 fakeredis；local: 使用已有 Redis')
+    parser.add_argument('--redis-port', type=int, default=6399)
+    parser.add_argument('--write-behind', action='store_true', help='开启消息异步批量落库（MESSAGE_WRITE_BEHIND）')
+    parser.add_argument('--output', default='bench_result.json', help='结果 JSON 路径')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='chat_bench_')
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    run_tag = str(int(time.time()))
+
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': database_url,
+        'REDIS_HOST': '127.0.0.1',
+        'REDIS_PORT': str(args.redis_port),
+        'HOST': '127.0.0.1',
+        'PORT': str(args.port),
+        'DEBUG': 'False',
+        'WORKER_ID': f'bench:{args.port}',
+        'SOCKETIO_SCALE_OUT': 'False',
+        'MESSAGE_WRITE_BEHIND': 'true' if args.write_behind else 'false'
+    })
+    os.environ.update(env)
+
+    processes = []
+    try:
+        if args.redis == 'fake':
+            processes.append(subprocess.Popen([sys.executable, '-c', FAKE_REDIS_CODE, str(args.redis_port)]))
+        if not wait_for_port('127.0.0.1', args.redis_port, timeout=20):
+            print(f'❌ Redis 未在端口 {args.redis_port} 上就绪')
+            return 1
+
+        print(f'写入压测数据: {args.clients} 个用户, {args.rooms} 个房间 ({database_url})')
+        assignments = seed(args.clients, args.rooms, run_tag)
+
+        server_log = open(os.path.join(workdir, 'server.log'), 'w')
+        processes.append(subprocess.Popen([sys.executable, 'app.py'], cwd=ROOT, env=env,
+                                          stdout=server_log, stderr=subprocess.STDOUT))
+        if not wait_for_port('127.0.0.1', args.port, timeout=60):
+            print(f'❌ 服务未在端口 {args.port} 上就绪，日志: {server_log.name}')
+            return 1
+        url = f'http://127.0.0.1:{args.port}'
+
+        cfg = {
+            'messages': args.messages,
+            'rate': args.rate,
+            'drain': args.drain,
+            'connect_concurrency': args.connect_concurrency
+        }
+        procs = max(1, min(args.procs, len(assignments)))
+        barrier = multiprocessing.Barrier(procs)
+        result_queue = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(target=client_process,
+                                    args=(url, assignments[i::procs], cfg, barrier, result_queue))
+            for i in range(procs)
+        ]
+        print(f'启动 {procs} 个客户端进程，共 {len(assignments)} 个客户端')
+        for worker in workers:
+            worker.start()
+        parts = [result_queue.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+
+        report = {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'params': {
+                'clients': args.clients,
+                'rooms': args.rooms,
+                'messages_per_client': args.messages,
+                'rate_per_client': args.rate,
+                'client_procs': procs,
+                'database': database_url.split(':', 1)[0],
+                'redis': args.redis,
+                'write_behind': args.write_behind
+            },
+            'results': summarize(parts),
+            'server': http_get_json(f'{url}/api/health')
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+        results = report['results']
+        print('=' * 50)
+        print(f"连接: {results['connect']['connected']} 个, {results['connect']['connects_per_s']} 个/秒")
+        print(f"发送: {results['send']['messages_sent']} 条, {results['send']['messages_per_s']} 条/秒")
+        latency = results['delivery']['latency_ms'] or {}
+        print(f"投递: {results['delivery']['deliveries']}/{results['delivery']['expected']}, "
+              f"p50={latency.get('p50')}ms p99={latency.get('p99')}ms")
+        print(f'结果已写入 {args.output}')
+        return 0
+    finally:
+        for proc in reversed(processes):
+            if proc.poll() is None:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
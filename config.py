@@ -1,4 +1,5 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,12 +13,34 @@ SETTINGS = {
         'secret_key': os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
     },
     'database': {
+        # 完整的 SQLAlchemy 连接串（如 sqlite:///bench.db），设置后优先于下面的 MySQL 配置，用于压测/本地替身
+        'url': os.environ.get('DATABASE_URL'),
         'mysql': {
             'host': os.environ.get('MYSQL_HOST', 'localhost'),
             'port': int(os.environ.get('MYSQL_PORT', 3306)),
             'user': os.environ.get('MYSQL_USER', 'root'),
             'password': os.environ.get('MYSQL_PASSWORD', 'password'),
             'database': os.environ.get('MYSQL_DATABASE', 'chat_db')
+        },
+        # 连接池：eventlet 下所有协程共用一个线程，连接只在执行查询 / 事务期间占用，
+        # 几十个连接即可支撑数百个并发协程；等待超时设得较短，池耗尽时尽快报错而不是整体挂起
+        'pool': {
+            'size': int(os.environ.get('DB_POOL_SIZE', 20)),
+            'max_overflow': int(os.environ.get('DB_POOL_MAX_OVERFLOW', 30)),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            # 连接最长复用时间（秒），应小于 MySQL wait_timeout 及中间代理的空闲断开时间
+            'recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+            # 取出连接前先探活，避免使用已被服务端断开的连接
+            'pre_ping': os.environ.get('DB_POOL_PRE_PING', 'True').lower() == 'true'
+        },
+        # 只读从库（逗号分隔的完整连接串），为空则全部读写都走主库
+        'replicas': {
+            'urls': [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()],
+            # 复制延迟超过该秒数的从库暂停使用
+            'max_lag': float(os.environ.get('REPLICA_MAX_LAG', 5)),
+            'check_interval': float(os.environ.get('REPLICA_CHECK_INTERVAL', 2)),
+            # 读己之写：用户写入后该秒数内的只读请求仍走主库
+            'pin_seconds': int(os.environ.get('REPLICA_PIN_SECONDS', 10))
         }
     },
     'redis': {
@@ -25,11 +48,102 @@ SETTINGS = {
         'port': int(os.environ.get('REDIS_PORT', 6379)),
         'db': int(os.environ.get('REDIS_DB', 0)),
         'password': os.environ.get('REDIS_PASSWORD', None),
-        'decode_responses': True
+        'decode_responses': True,
+        # 阻塞式连接池：连接用满时最多排队 timeout 秒，而不是立即抛出 ConnectionError
+        'pool': {
+            'max_connections': int(os.environ.get('REDIS_MAX_CONNECTIONS', 100)),
+            'timeout': float(os.environ.get('REDIS_POOL_TIMEOUT', 5)),
+            'socket_timeout': float(os.environ.get('REDIS_SOCKET_TIMEOUT', 5)),
+            'socket_connect_timeout': float(os.environ.get('REDIS_SOCKET_CONNECT_TIMEOUT', 3)),
+            # 空闲超过该秒数的连接在使用前先 PING，剔除被服务端或网络设备断开的连接
+            'health_check_interval': int(os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', 30))
+        }
+    },
+    'socketio': {
+        # 多进程/多节点部署：开启后通过 Redis 消息队列在各 worker 之间转发 emit
+        'scale_out': os.environ.get('SOCKETIO_SCALE_OUT', 'False').lower() == 'true',
+        'channel': os.environ.get('SOCKETIO_CHANNEL', 'chat-socketio'),
+        # worker 标识，用于重启时清理本 worker 遗留的连接记录；默认 主机名:端口
+        'worker_id': os.environ.get('WORKER_ID') or f"{socket.gethostname()}:{os.environ.get('PORT', 9000)}"
+    },
+    'presence': {
+        # 在线心跳：连接超过 ttl 秒未刷新即被清理（应大于 Socket.IO ping_interval + ping_timeout）
+        'ttl': int(os.environ.get('PRESENCE_TTL', 120)),
+        'heartbeat_interval': int(os.environ.get('PRESENCE_HEARTBEAT_INTERVAL', 25)),
+        'sweep_interval': int(os.environ.get('PRESENCE_SWEEP_INTERVAL', 30)),
+        'sweep_batch': int(os.environ.get('PRESENCE_SWEEP_BATCH', 500)),
+        # 上/下线变化合并广播的周期（毫秒）
+        'broadcast_interval_ms': int(os.environ.get('PRESENCE_BROADCAST_INTERVAL_MS', 250))
+    },
+    'cache': {
+        # 房间最新消息缓存窗口大小（条）与过期时间（秒）
+        'room_history_size': int(os.environ.get('ROOM_HISTORY_CACHE_SIZE', 200)),
+        'room_history_ttl': int(os.environ.get('ROOM_HISTORY_CACHE_TTL', 3600))
+    },
+    'search': {
+        # 用户搜索：每次返回的最大条数，以及相同关键词结果在 Redis 中的缓存时间（秒）
+        'user_limit': int(os.environ.get('USER_SEARCH_LIMIT', 20)),
+        'user_cache_ttl': int(os.environ.get('USER_SEARCH_CACHE_TTL', 30)),
+        # 消息搜索：只在最新的这么多条候选消息中按相关度排序
+        'message_candidates': int(os.environ.get('MESSAGE_SEARCH_CANDIDATES', 2000))
+    },
+    'message_writer': {
+        # 消息异步批量落库：开启后消息 ID 由 Redis 号段分配，写入队列后由后台任务合并为多行 INSERT
+        # 注意：所有 worker 必须同时开启或同时关闭，否则自增 ID 与号段 ID 会冲突
+        'enabled': os.environ.get('MESSAGE_WRITE_BEHIND', 'False').lower() == 'true',
+        'queue_size': int(os.environ.get('MESSAGE_WRITER_QUEUE_SIZE', 10000)),
+        'batch_size': int(os.environ.get('MESSAGE_WRITER_BATCH_SIZE', 500)),
+        'flush_interval_ms': int(os.environ.get('MESSAGE_WRITER_FLUSH_INTERVAL_MS', 5)),
+        'id_block': int(os.environ.get('MESSAGE_WRITER_ID_BLOCK', 1000)),
+        # 队列满时发送方最多等待的秒数，超时则拒绝（背压）
+        'enqueue_timeout': float(os.environ.get('MESSAGE_WRITER_ENQUEUE_TIMEOUT', 2)),
+        # 等待落库确认的最长秒数
+        'ack_timeout': float(os.environ.get('MESSAGE_WRITER_ACK_TIMEOUT', 10))
+    },
+    'archive': {
+        # 消息冷热分层：超过 after_days 天的消息由后台任务分批移入 messages_archive 归档表
+        'enabled': os.environ.get('MESSAGE_ARCHIVE_ENABLED', 'False').lower() == 'true',
+        'after_days': int(os.environ.get('MESSAGE_ARCHIVE_AFTER_DAYS', 180)),
+        'batch_size': int(os.environ.get('MESSAGE_ARCHIVE_BATCH_SIZE', 1000)),
+        # 两次归档之间的间隔（秒）与批次之间的暂停（毫秒）
+        'interval': int(os.environ.get('MESSAGE_ARCHIVE_INTERVAL', 600)),
+        'batch_pause_ms': int(os.environ.get('MESSAGE_ARCHIVE_BATCH_PAUSE_MS', 100))
+    },
+    'unread': {
+        # 未读计数：Redis 中实时计数，后台任务每 flush_interval 秒把有变化的用户批量写回 MySQL
+        'flush_interval': float(os.environ.get('UNREAD_FLUSH_INTERVAL', 5)),
+        'flush_batch': int(os.environ.get('UNREAD_FLUSH_BATCH', 500)),
+        # Redis 中计数的过期时间（秒），过期后从 MySQL 恢复
+        'ttl': int(os.environ.get('UNREAD_CACHE_TTL', 604800))
+    },
+    'read_receipts': {
+        # 已读游标：确认在 Redis 中合并，每 flush_interval 秒批量写回 MySQL
+        'flush_interval': float(os.environ.get('READ_CURSOR_FLUSH_INTERVAL', 5)),
+        'flush_batch': int(os.environ.get('READ_CURSOR_FLUSH_BATCH', 500)),
+        'ttl': int(os.environ.get('READ_CURSOR_CACHE_TTL', 604800)),
+        # 已读回执合并推送的周期（毫秒），周期内同一用户同一会话只推送最新游标
+        'receipt_interval_ms': int(os.environ.get('READ_RECEIPT_INTERVAL_MS', 1000))
+    },
+    'inbox': {
+        # 会话列表：每个用户最多保留 size 个会话，Redis 中过期后由后台任务从 MySQL 重建
+        'size': int(os.environ.get('INBOX_SIZE', 500)),
+        'ttl': int(os.environ.get('INBOX_CACHE_TTL', 604800)),
+        # 最后一条消息预览的最大字符数
+        'preview_length': int(os.environ.get('INBOX_PREVIEW_LENGTH', 100)),
+        # 后台重建：每 rebuild_interval 秒取出一批（最多 rebuild_batch 个）待重建的用户
+        'rebuild_interval': float(os.environ.get('INBOX_REBUILD_INTERVAL', 0.5)),
+        'rebuild_batch': int(os.environ.get('INBOX_REBUILD_BATCH', 100))
+    },
+    'metrics': {
+        # 延迟直方图与 /metrics 端点（Prometheus 文本格式）
+        'enabled': os.environ.get('METRICS_ENABLED', 'True').lower() == 'true'
     },
     'jwt': {
         'secret_key': os.environ.get('JWT_SECRET_KEY', 'jwt-secret-key-change-in-production'),
         'algorithm': 'HS256',
-        'expiration': 86400  # 24小时
+        'expiration': 86400,  # 24小时
+        # 进程内 token -> 用户身份缓存
+        'identity_cache_size': int(os.environ.get('IDENTITY_CACHE_SIZE', 10000)),
+        'identity_cache_ttl': int(os.environ.get('IDENTITY_CACHE_TTL', 300))  # 秒
     }
 }
@@ -182,6 +182,18 @@ export const useChatStore = defineStore('chat', () => {
     }
   }
 
+  // 按增量更新在线列表，不再每次变化都重新拉取
+  function applyPresenceDiff(data) {
+    const changed = new Set([
+      ...(data.offline || []),
+      ...(data.online || []).map(user => user.id)
+    ])
+    onlineUsers.value = [
+      ...onlineUsers.value.filter(user => !changed.has(user.id)),
+      ...(data.online || [])
+    ]
+  }
+
   function initSocketConnection(token) {
     socket.value = initSocket(token, {
       onConnect: () => {
@@ -191,11 +203,8 @@ export const useChatStore = defineStore('chat', () => {
         // 消息处理已移至 Chat.vue，这里不再处理以避免重复
         // 保留此回调以防将来需要统一处理消息
       },
-      onUserOnline: (data) => {
-        loadOnlineUsers()
-      },
-      onUserOffline: (data) => {
-        loadOnlineUsers()
+      onPresenceDiff: (data) => {
+        applyPresenceDiff(data)
       },
       onError: (error) => {
         console.error('Socket 连接错误:', error)
@@ -102,17 +102,11 @@ export function initSocket(token, callbacks = {}) {
   //   }
   // })
 
-  // 用户上线
-  socketInstance.on('user_online', (data) => {
-    if (callbacks.onUserOnline) {
-      callbacks.onUserOnline(data)
-    }
-  })
-
-  // 用户下线
-  socketInstance.on('user_offline', (data) => {
-    if (callbacks.onUserOffline) {
-      callbacks.onUserOffline(data)
+  // 好友/同房间成员上下线（服务端合并后批量推送）
+  // data: { online: [用户信息], offline: [用户ID] }
+  socketInstance.on('presence_diff', (data) => {
+    if (callbacks.onPresenceDiff) {
+      callbacks.onPresenceDiff(data)
     }
   })
 
@@ -1,10 +1,138 @@
 """
 数据库迁移脚本 - 独立运行版本
-用于添加 room_code 字段、password_hash 字段和创建 friends 表
+用于添加 room_code 字段、password_hash 字段、创建 friends 表、rooms.member_count 冗余成员数、消息历史复合索引、私聊 conversation_key
+以及消息全文索引 message_tokens、用户搜索索引 user_search_grams、从库延迟心跳表 replica_heartbeat
+和消息归档表 messages_archive
 """
 import pymysql
 import random
 from config import SETTINGS
+from utils.tokenizer import tokenize, make_grams
+
+def backfill_conversation_keys(conn, cursor, chunk_size=10000):
+    """按主键区间分批回填私聊消息的 conversation_key"""
+    cursor.execute("""
+        SELECT MIN(id), MAX(id) FROM messages
+        WHERE room_id IS NULL AND receiver_id IS NOT NULL AND conversation_key IS NULL
+    """)
+    min_id, max_id = cursor.fetchone()
+    if min_id is None:
+        print('  ✓ 没有需要回填 conversation_key 的私聊消息')
+        return
+
+    print(f'  → 正在分批回填 conversation_key（id {min_id} ~ {max_id}，每批 {chunk_size} 行）...')
+    updated = 0
+    for start in range(min_id, max_id + 1, chunk_size):
+        cursor.execute("""
+            UPDATE messages
+            SET conversation_key = CONCAT(LEAST(sender_id, receiver_id), ':', GREATEST(sender_id, receiver_id))
+            WHERE id >= %s AND id < %s
+            AND room_id IS NULL AND receiver_id IS NOT NULL AND conversation_key IS NULL
+        """, (start, start + chunk_size))
+        updated += cursor.rowcount
+        conn.commit()
+        print(f'    已处理到 id {min(start + chunk_size - 1, max_id)}，累计回填 {updated} 行')
+    print(f'  ✓ conversation_key 回填完成，共 {updated} 行')
+
+
+def get_progress(cursor, name):
+    """读取分批任务的进度（已处理到的最大 ID）"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS migration_progress (
+            name VARCHAR(64) NOT NULL PRIMARY KEY,
+            last_id BIGINT NOT NULL DEFAULT 0
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+    cursor.execute("SELECT last_id FROM migration_progress WHERE name = %s", (name,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def save_progress(cursor, name, last_id):
+    cursor.execute("""
+        INSERT INTO migration_progress (name, last_id) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE last_id = VALUES(last_id)
+    """, (name, last_id))
+
+
+def backfill_message_tokens(conn, cursor, chunk_size=5000):
+    """
+    为已有消息分批建立全文索引，每批与进度一起提交，中断后重跑从上次进度继续；
+    只回填到开始时的最大 ID，之后的新消息由服务端发送时增量写入
+    """
+    cursor.execute("SELECT MAX(id) FROM messages")
+    max_id = cursor.fetchone()[0] or 0
+    last_id = get_progress(cursor, 'message_tokens')
+    if last_id >= max_id:
+        print('  ✓ 全文索引已是最新')
+        return
+
+    print(f'  → 正在分批建立全文索引（id {last_id + 1} ~ {max_id}，每批 {chunk_size} 条）...')
+    indexed = 0
+    while last_id < max_id:
+        cursor.execute("""
+            SELECT id, content, room_id, sender_id, receiver_id FROM messages
+            WHERE id > %s AND id <= %s
+            ORDER BY id
+            LIMIT %s
+        """, (last_id, max_id, chunk_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        values = []
+        for message_id, content, room_id, sender_id, receiver_id in rows:
+            if room_id:
+                scopes = [f'r:{room_id}']
+            else:
+                scopes = sorted({f'u:{sender_id}', f'u:{receiver_id}'})
+            for token, count in tokenize(content).items():
+                for scope in scopes:
+                    values.append((token, scope, message_id, min(count, 32767)))
+        if values:
+            # INSERT IGNORE：与服务端增量写入的索引行重叠时跳过
+            cursor.executemany("""
+                INSERT IGNORE INTO message_tokens (token, scope, message_id, tf)
+                VALUES (%s, %s, %s, %s)
+            """, values)
+        last_id = rows[-1][0]
+        save_progress(cursor, 'message_tokens', last_id)
+        conn.commit()
+        indexed += len(rows)
+        print(f'    已处理到 id {last_id}，累计 {indexed} 条消息')
+    print(f'  ✓ 全文索引回填完成，共 {indexed} 条消息')
+
+
+def backfill_user_search_grams(conn, cursor, chunk_size=5000):
+    """为已有用户分批建立用户名 / 邮箱 trigram 索引，可中断续跑（新注册用户由服务端写入）"""
+    cursor.execute("SELECT MAX(id) FROM users")
+    max_id = cursor.fetchone()[0] or 0
+    last_id = get_progress(cursor, 'user_search_grams')
+    if last_id >= max_id:
+        print('  ✓ 用户搜索索引已是最新')
+        return
+
+    print(f'  → 正在分批建立用户搜索索引（id {last_id + 1} ~ {max_id}）...')
+    while last_id < max_id:
+        cursor.execute("""
+            SELECT id, username, email FROM users
+            WHERE id > %s AND id <= %s
+            ORDER BY id
+            LIMIT %s
+        """, (last_id, max_id, chunk_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        values = [(gram, user_id) for user_id, username, email in rows for gram in make_grams(username, email)]
+        if values:
+            cursor.executemany(
+                "INSERT IGNORE INTO user_search_grams (gram, user_id) VALUES (%s, %s)", values
+            )
+        last_id = rows[-1][0]
+        save_progress(cursor, 'user_search_grams', last_id)
+        conn.commit()
+        print(f'    已处理到 id {last_id}')
+    print('  ✓ 用户搜索索引回填完成')
+
 
 def migrate_database():
     """执行数据库迁移"""
@@ -29,7 +157,7 @@ def migrate_database():
         cursor = conn.cursor()
 
         # 1. 检查并添加 room_code 字段
-        print('\n[1/3] 检查 rooms 表的 room_code 字段...')
+        print('\n[1/13] 检查 rooms 表的 room_code 字段...')
         cursor.execute("""
             SELECT COUNT(*) as count
             FROM information_schema.COLUMNS
@@ -81,7 +209,7 @@ def migrate_database():
             print('  ✓ 成功添加 room_code 字段并生成房间代码')
 
         # 2. 检查并添加 password_hash 字段
-        print('\n[2/3] 检查 rooms 表的 password_hash 字段...')
+        print('\n[2/13] 检查 rooms 表的 password_hash 字段...')
         cursor.execute("""
             SELECT COUNT(*) as count
             FROM information_schema.COLUMNS
@@ -105,7 +233,7 @@ def migrate_database():
             print('  ✓ 成功添加 password_hash 字段')
 
         # 3. 检查并创建 friends 表
-        print('\n[3/3] 检查 friends 表...')
+        print('\n[3/13] 检查 friends 表...')
         cursor.execute("""
             SELECT COUNT(*) as count
             FROM information_schema.TABLES
@@ -137,6 +265,213 @@ def migrate_database():
             conn.commit()
             print('  ✓ 成功创建 friends 表')
 
+        # 4. 检查并添加 member_count 冗余字段
+        print('\n[4/13] 检查 rooms 表的 member_count 字段...')
+        cursor.execute("""
+            SELECT COUNT(*) as count
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = %s
+            AND TABLE_NAME = 'rooms'
+            AND COLUMN_NAME = 'member_count'
+        """, (mysql_config['database'],))
+
+        count = cursor.fetchone()[0]
+
+        if count > 0:
+            print('  ✓ member_count 字段已存在，跳过')
+        else:
+            print('  → 正在添加 member_count 字段...')
+            cursor.execute("""
+                ALTER TABLE rooms
+                ADD COLUMN member_count INT NOT NULL DEFAULT 0
+            """)
+            # 按现有成员关系回填成员数（单条聚合 UPDATE）
+            print('  → 正在回填现有房间的成员数...')
+            cursor.execute("""
+                UPDATE rooms r
+                LEFT JOIN (
+                    SELECT room_id, COUNT(*) AS cnt FROM room_members GROUP BY room_id
+                ) m ON m.room_id = r.id
+                SET r.member_count = COALESCE(m.cnt, 0)
+            """)
+            conn.commit()
+            print('  ✓ 成功添加 member_count 字段并回填成员数')
+
+        # 5. 检查并创建房间消息游标分页索引
+        print('\n[5/13] 检查 messages 表的 (room_id, created_at, id) 索引...')
+        cursor.execute("""
+            SELECT COUNT(*) as count
+            FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = %s
+            AND TABLE_NAME = 'messages'
+            AND INDEX_NAME = 'idx_messages_room_created_id'
+        """, (mysql_config['database'],))
+
+        count = cursor.fetchone()[0]
+
+        if count > 0:
+            print('  ✓ idx_messages_room_created_id 索引已存在，跳过')
+        else:
+            print('  → 正在创建 idx_messages_room_created_id 索引（大表可能需要较长时间）...')
+            cursor.execute("""
+                CREATE INDEX idx_messages_room_created_id
+                ON messages (room_id, created_at, id)
+            """)
+            conn.commit()
+            print('  ✓ 成功创建 idx_messages_room_created_id 索引')
+
+        # 6. 检查并添加私聊 conversation_key 字段、分批回填并创建索引
+        print('\n[6/13] 检查 messages 表的 conversation_key 字段...')
+        cursor.execute("""
+            SELECT COUNT(*) as count
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = %s
+            AND TABLE_NAME = 'messages'
+            AND COLUMN_NAME = 'conversation_key'
+        """, (mysql_config['database'],))
+
+        if cursor.fetchone()[0] > 0:
+            print('  ✓ conversation_key 字段已存在')
+        else:
+            print('  → 正在添加 conversation_key 字段...')
+            cursor.execute("""
+                ALTER TABLE messages
+                ADD COLUMN conversation_key VARCHAR(32) NULL
+            """)
+            conn.commit()
+
+        # 按主键区间分批回填，每批单独提交，中断后重跑会从未回填的行继续
+        backfill_conversation_keys(conn, cursor)
+
+        cursor.execute("""
+            SELECT COUNT(*) as count
+            FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = %s
+            AND TABLE_NAME = 'messages'
+            AND INDEX_NAME = 'idx_messages_conversation_created_id'
+        """, (mysql_config['database'],))
+
+        if cursor.fetchone()[0] > 0:
+            print('  ✓ idx_messages_conversation_created_id 索引已存在，跳过')
+        else:
+            print('  → 正在创建 idx_messages_conversation_created_id 索引...')
+            cursor.execute("""
+                CREATE INDEX idx_messages_conversation_created_id
+                ON messages (conversation_key, created_at, id)
+            """)
+            conn.commit()
+            print('  ✓ 成功创建 idx_messages_conversation_created_id 索引')
+
+        # 7. 创建消息全文索引表并回填已有消息
+        print('\n[7/13] 检查 message_tokens 全文索引表...')
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS message_tokens (
+                token VARCHAR(32) NOT NULL,
+                scope VARCHAR(24) NOT NULL,
+                message_id INT NOT NULL,
+                tf SMALLINT NOT NULL DEFAULT 1,
+                PRIMARY KEY (token, scope, message_id),
+                INDEX ix_message_tokens_message_id (message_id)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin
+        """)
+        conn.commit()
+        backfill_message_tokens(conn, cursor)
+
+        # 8. 创建用户搜索 trigram 索引表并回填已有用户
+        print('\n[8/13] 检查 user_search_grams 用户搜索索引表...')
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_search_grams (
+                gram VARCHAR(3) NOT NULL,
+                user_id INT NOT NULL,
+                PRIMARY KEY (gram, user_id),
+                INDEX ix_user_search_grams_user_id (user_id),
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin
+        """)
+        conn.commit()
+        backfill_user_search_grams(conn, cursor)
+
+        # 9. 创建从库延迟心跳表（经复制同步到从库，见 utils/replicas.py）
+        print('\n[9/13] 检查 replica_heartbeat 心跳表...')
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS replica_heartbeat (
+                id INT NOT NULL PRIMARY KEY,
+                beat_ms BIGINT NOT NULL
+            ) ENGINE=InnoDB
+        """)
+        conn.commit()
+        print('  ✓ replica_heartbeat 表已就绪')
+
+        # 10. 创建消息归档表（冷数据，列与索引同 messages，不设外键）
+        print('\n[10/13] 检查 messages_archive 归档表...')
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS messages_archive (
+                id INT NOT NULL PRIMARY KEY,
+                sender_id INT NOT NULL,
+                room_id INT NULL,
+                receiver_id INT NULL,
+                content TEXT NOT NULL,
+                message_type VARCHAR(20) DEFAULT 'text',
+                created_at DATETIME NULL,
+                conversation_key VARCHAR(32) NULL,
+                INDEX ix_messages_archive_sender_id (sender_id),
+                INDEX idx_messages_archive_room_created_id (room_id, created_at, id),
+                INDEX idx_messages_archive_conversation_created_id (conversation_key, created_at, id)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """)
+        conn.commit()
+        print('  ✓ messages_archive 表已就绪')
+
+        # 11. 创建未读计数持久化表（实时计数在 Redis，见 utils/unread.py）
+        print('\n[11/13] 检查 unread_counters 未读计数表...')
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS unread_counters (
+                user_id INT NOT NULL,
+                conversation VARCHAR(24) NOT NULL,
+                count INT NOT NULL DEFAULT 0,
+                updated_at DATETIME NULL,
+                PRIMARY KEY (user_id, conversation),
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            ) ENGINE=InnoDB
+        """)
+        conn.commit()
+        print('  ✓ unread_counters 表已就绪')
+
+        # 12. 检查 room_members 表的已读游标字段
+        print('\n[12/13] 检查 room_members 表的 last_read_message_id 字段...')
+        cursor.execute("""
+            SELECT COUNT(*)
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = %s
+            AND TABLE_NAME = 'room_members'
+            AND COLUMN_NAME = 'last_read_message_id'
+        """, (mysql_config['database'],))
+        if cursor.fetchone()[0] == 0:
+            print('  → 正在添加 last_read_message_id 字段...')
+            cursor.execute("""
+                ALTER TABLE room_members
+                ADD COLUMN last_read_message_id INT NOT NULL DEFAULT 0
+            """)
+            conn.commit()
+            print('  ✓ last_read_message_id 字段添加成功')
+        else:
+            print('  ✓ last_read_message_id 字段已存在')
+
+        # 13. 创建私聊已读游标表
+        print('\n[13/13] 检查 private_read_cursors 私聊已读游标表...')
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS private_read_cursors (
+                user_id INT NOT NULL,
+                peer_id INT NOT NULL,
+                last_read_message_id INT NOT NULL DEFAULT 0,
+                updated_at DATETIME NULL,
+                PRIMARY KEY (user_id, peer_id),
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            ) ENGINE=InnoDB
+        """)
+        conn.commit()
+        print('  ✓ private_read_cursors 表已就绪')
+
         cursor.close()
         conn.close()
 
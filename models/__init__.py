@@ -1,11 +1,21 @@
 from flask_sqlalchemy import SQLAlchemy
+from utils.replicas import RoutingSession
 
-db = SQLAlchemy()
+# RoutingSession：只读请求的查询路由到从库，见 utils/replicas.py
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 from .user import User
 from .message import Message
+from .message_archive import ArchivedMessage
 from .room import Room, RoomMember
 from .friend import Friend
+from .message_token import MessageToken
+from .user_search_gram import UserSearchGram
+from .replica_heartbeat import ReplicaHeartbeat
+from .unread_counter import UnreadCounter
+from .read_cursor import PrivateReadCursor
 
-__all__ = ['db', 'User', 'Message', 'Room', 'RoomMember', 'Friend']
+__all__ = ['db', 'User', 'Message', 'ArchivedMessage', 'Room', 'RoomMember', 'Friend', 'MessageToken',
+           'UserSearchGram', 'ReplicaHeartbeat', 'UnreadCounter',
+           'PrivateReadCursor']
 
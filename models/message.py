@@ -1,6 +1,9 @@
 from datetime import datetime
 from models import db
 
+# to_dict 的默认参数哨兵：未传入 sender 时才走 sender 关系
+_LOAD_SENDER = object()
+
 
 class Message(db.Model):
     __tablename__ = 'messages'
@@ -12,18 +15,28 @@ class Message(db.Model):
     content = db.Column(db.Text, nullable=False)
     message_type = db.Column(db.String(20), default='text')  # text, system
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    # 私聊会话标识 "较小用户ID:较大用户ID"，群聊消息为空
+    conversation_key = db.Column(db.String(32), nullable=True)
+
+    # 房间/私聊历史游标分页使用的复合索引
+    __table_args__ = (
+        db.Index('idx_messages_room_created_id', 'room_id', 'created_at', 'id'),
+        db.Index('idx_messages_conversation_created_id', 'conversation_key', 'created_at', 'id'),
+    )
 
     # 关系
     room = db.relationship('Room', backref='messages')
     # sender 关系通过 User.sent_messages 的 backref='sender' 自动创建，不需要在这里定义
     receiver = db.relationship('User', foreign_keys=[receiver_id], backref='received_messages')
 
-    def to_dict(self):
-        """转换为字典"""
+    def to_dict(self, sender=_LOAD_SENDER):
+        """转换为字典（可传入已有的 sender 字典，避免懒加载 sender 关系）"""
+        if sender is _LOAD_SENDER:
+            sender = self.sender.to_dict() if self.sender else None
         return {
             'id': self.id,
             'sender_id': self.sender_id,
-            'sender': self.sender.to_dict() if self.sender else None,
+            'sender': sender,
             'receiver_id': self.receiver_id,
             'room_id': self.room_id,
             'content': self.content,
@@ -31,6 +44,160 @@ class Message(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+    @staticmethod
+    def make_conversation_key(user_a_id, user_b_id):
+        """生成私聊会话标识，按用户 ID 排序保证双方一致（与 Redis 私聊缓存 key 规则相同）"""
+        a, b = sorted([int(user_a_id), int(user_b_id)])
+        return f'{a}:{b}'
+
+    @staticmethod
+    def serialize_many(messages):
+        """
+        批量序列化消息：一次 IN 查询取回本页全部发送者，
+        不触碰 sender 懒加载关系，避免一页 N 条消息产生 N+1 次查询
+        """
+        from models.user import User
+        sender_ids = {m.sender_id for m in messages}
+        senders = {}
+        if sender_ids:
+            senders = {u.id: u.to_dict() for u in User.query.filter(User.id.in_(sender_ids))}
+        return [m.to_dict(sender=senders.get(m.sender_id)) for m in messages]
+
+    # =========================
+    # 跨热表 / 归档表读取
+    # =========================
+    # scope 为房间或会话条件，如 {'room_id': 1} / {'conversation_key': '1:2'}，对两张表都可用 filter_by
+    # 归档任务按 (created_at, id) 从早到晚搬迁，归档表中的消息都早于热表，因此向前翻页时先热表后归档表，向后反之
+
+    @staticmethod
+    def tiers():
+        """按从新到旧排列的存储层：热表，以及有数据时的归档表"""
+        from models.message_archive import ArchivedMessage, archive_in_use
+        return (Message, ArchivedMessage) if archive_in_use() else (Message,)
+
+    @staticmethod
+    def _find_anchor(scope, message_id):
+        """游标消息所在的层与 created_at，不存在（或不属于该房间/会话）返回 (None, None)"""
+        for index, model in enumerate(Message.tiers()):
+            created_at = db.session.query(model.created_at)\
+                .filter_by(id=message_id, **scope)\
+                .scalar()
+            if created_at is not None:
+                return index, created_at
+        return None, None
+
+    @staticmethod
+    def anchor_time(scope, message_id):
+        """游标消息的 created_at（必须属于 scope 指定的房间/会话），不存在返回 None"""
+        return Message._find_anchor(scope, message_id)[1]
+
+    @staticmethod
+    def _keyset_query(model, scope, anchor_time, anchor_id, before):
+        query = model.query.filter_by(**scope)
+        if before:
+            # 比游标更早的消息：(created_at, id) < (anchor_time, anchor_id)
+            return query.filter(
+                (model.created_at < anchor_time) |
+                ((model.created_at == anchor_time) & (model.id < anchor_id))
+            ).order_by(model.created_at.desc(), model.id.desc())
+        # 比游标更新的消息：(created_at, id) > (anchor_time, anchor_id)
+        return query.filter(
+            (model.created_at > anchor_time) |
+            ((model.created_at == anchor_time) & (model.id > anchor_id))
+        ).order_by(model.created_at.asc(), model.id.asc())
+
+    @staticmethod
+    def keyset_page(scope, per_page, before_id=None, after_id=None):
+        """
+        游标（keyset）分页，依赖 (room_id / conversation_key, created_at, id) 复合索引，
+        每层都是一次索引范围扫描；当前层不够一页时跨到相邻层继续取。
+        返回 (按时间正序的消息对象列表, 是否还有更多)；游标消息不属于该房间/会话时返回 None
+        """
+        tiers = Message.tiers()
+        anchor_id = before_id or after_id
+        tier_index, anchor_time = Message._find_anchor(scope, anchor_id)
+        if anchor_time is None:
+            return None
+
+        before = bool(before_id)
+        # 向前翻：从游标所在层往更旧的层；向后翻：从游标所在层往更新的层
+        models = tiers[tier_index:] if before else tiers[tier_index::-1]
+        rows = []
+        for model in models:
+            # 多取一条用于判断是否还有更多
+            remaining = per_page + 1 - len(rows)
+            if remaining <= 0:
+                break
+            rows.extend(Message._keyset_query(model, scope, anchor_time, anchor_id, before).limit(remaining).all())
+
+        rows.sort(key=lambda m: (m.created_at, m.id), reverse=before)
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        if before:
+            rows.reverse()
+        return rows, has_more
+
+    @staticmethod
+    def latest(scope, limit, offset=0):
+        """最新的 limit 条消息（跳过 offset 条），按时间倒序，热表不够时从归档表补齐"""
+        tiers = Message.tiers()
+        rows = []
+        for index, model in enumerate(tiers):
+            query = model.query.filter_by(**scope)
+            if index > 0:
+                if rows:
+                    # 已经读到热表末尾，归档表从头开始
+                    offset = 0
+                else:
+                    # 热表整体都在 offset 之内，扣除热表行数后再到归档表中跳过
+                    offset = max(0, offset - Message.query.filter_by(**scope).count())
+            rows.extend(query.order_by(model.created_at.desc(), model.id.desc())
+                        .offset(offset)
+                        .limit(limit - len(rows))
+                        .all())
+            if len(rows) >= limit:
+                break
+        return rows
+
+    @staticmethod
+    def load_many(message_ids):
+        """按 ID 批量加载消息（热表未找到的再查归档表），返回 {id: 消息对象}"""
+        found = {}
+        for model in Message.tiers():
+            missing = [mid for mid in message_ids if mid not in found]
+            if not missing:
+                break
+            found.update({m.id: m for m in model.query.filter(model.id.in_(missing))})
+        return found
+
+    @staticmethod
+    def iter_export(scope, after=None, batch_size=1000):
+        """
+        按 (created_at, id) 正序逐条产出消息字典（先归档表后热表），用于流式导出：
+        yield_per 使用服务端游标分批取行，发送者随消息 JOIN 取回（流式读取期间同一连接不能再发查询），
+        内存占用与历史长度无关。after 为断点续传的 (created_at, id)，不含该条消息。
+        """
+        from models.user import User
+        senders = {}
+        for model in reversed(Message.tiers()):
+            # filter_by 作用于最近一次 join 的实体，需放在 join 之前
+            query = db.session.query(model, User)\
+                .filter_by(**scope)\
+                .join(User, User.id == model.sender_id)
+            if after:
+                after_time, after_id = after
+                query = query.filter(
+                    (model.created_at > after_time) |
+                    ((model.created_at == after_time) & (model.id > after_id))
+                )
+            query = query.order_by(model.created_at.asc(), model.id.asc()).yield_per(batch_size)
+
+            for message, sender in query:
+                sender_dict = senders.get(sender.id)
+                if sender_dict is None:
+                    sender_dict = senders[sender.id] = sender.to_dict()
+                yield message.to_dict(sender=sender_dict)
+
     def __repr__(self):
         return f'<Message {self.id}>'
 
@@ -0,0 +1,74 @@
+import time
+
+from sqlalchemy import func
+
+from models import db
+from models.message import Message
+
+
+class ArchivedMessage(db.Model):
+    """
+    消息归档表（冷数据）：超过保留期的消息由归档任务从 messages 分批移入，列与索引和 messages 一致，
+    不再有外键约束；历史接口在热表不够一页时继续从这里读取，见 Message.keyset_page / Message.latest
+    """
+    __tablename__ = 'messages_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    sender_id = db.Column(db.Integer, nullable=False, index=True)
+    room_id = db.Column(db.Integer, nullable=True)
+    receiver_id = db.Column(db.Integer, nullable=True)
+    content = db.Column(db.Text, nullable=False)
+    message_type = db.Column(db.String(20), default='text')
+    created_at = db.Column(db.DateTime)
+    conversation_key = db.Column(db.String(32), nullable=True)
+
+    __table_args__ = (
+        db.Index('idx_messages_archive_room_created_id', 'room_id', 'created_at', 'id'),
+        db.Index('idx_messages_archive_conversation_created_id', 'conversation_key', 'created_at', 'id'),
+    )
+
+    sender = db.relationship('User', primaryjoin='foreign(ArchivedMessage.sender_id) == User.id', viewonly=True)
+
+    to_dict = Message.to_dict
+
+    def __repr__(self):
+        return f'<ArchivedMessage {self.id}>'
+
+
+# 进程内缓存的"归档表是否有数据"：一旦为真不再改变；为假时每次检查 Redis 中由归档任务发布的标记，
+# 其他 worker 刚开始归档时本进程也能立即读到归档表；Redis 标记缺失（如被清空）时每 ARCHIVE_STATE_TTL 秒回查一次数据库
+_archive_state = {'in_use': False, 'checked_at': 0.0}
+ARCHIVE_STATE_TTL = 60
+
+
+def archive_in_use():
+    """归档表是否有数据"""
+    from utils.redis_client import redis_client
+
+    if _archive_state['in_use']:
+        return True
+    try:
+        if redis_client.is_archive_in_use():
+            _archive_state['in_use'] = True
+            return True
+    except Exception as e:
+        print(f'读取归档标记失败: {str(e)}')
+    now = time.monotonic()
+    if now - _archive_state['checked_at'] > ARCHIVE_STATE_TTL:
+        _archive_state['checked_at'] = now
+        try:
+            in_use = db.session.query(func.max(ArchivedMessage.id)).scalar() is not None
+        except Exception:
+            # 尚未执行迁移时归档表不存在
+            in_use = False
+        if in_use:
+            mark_archive_in_use()
+    return _archive_state['in_use']
+
+
+def mark_archive_in_use():
+    """标记归档表已有数据并发布到 Redis（归档任务在搬迁提交之前调用）"""
+    from utils.redis_client import redis_client
+
+    redis_client.set_archive_in_use()
+    _archive_state['in_use'] = True
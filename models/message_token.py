@@ -0,0 +1,141 @@
+import math
+
+from models import db
+from utils.tokenizer import tokenize, is_cjk
+
+
+class MessageToken(db.Model):
+    """
+    消息全文检索倒排索引：(词元, 可见范围, 消息ID) -> 词频
+    可见范围 scope：群聊消息为 r:{room_id}；私聊消息为双方各一条 u:{user_id}，
+    搜索时只需按"当前用户所在房间 + u:{自己}"过滤，主键前缀 (token, scope) 即是一次索引范围扫描。
+    message_id 不设外键：消息归档到 messages_archive 后索引保留，仍可搜索。
+    """
+    __tablename__ = 'message_tokens'
+    # 与 migrate_db 建表一致：二进制排序，避免 あい / アイ 等按不区分大小写 / 假名的规则视为同一主键
+    __table_args__ = {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_bin'}
+
+    token = db.Column(db.String(32), primary_key=True)
+    scope = db.Column(db.String(24), primary_key=True)
+    message_id = db.Column(db.Integer, primary_key=True, index=True)
+    tf = db.Column(db.SmallInteger, nullable=False, default=1)
+
+    @staticmethod
+    def room_scope(room_id):
+        return f'r:{room_id}'
+
+    @staticmethod
+    def user_scope(user_id):
+        return f'u:{user_id}'
+
+    @staticmethod
+    def rows_for(message_id, content, room_id=None, sender_id=None, receiver_id=None):
+        """生成一条消息的索引行（dict 列表，供多行 INSERT 使用）"""
+        tokens = tokenize(content)
+        if not tokens:
+            return []
+        if room_id:
+            scopes = [MessageToken.room_scope(room_id)]
+        else:
+            scopes = sorted({MessageToken.user_scope(sender_id), MessageToken.user_scope(receiver_id)})
+        return [
+            {'token': token, 'scope': scope, 'message_id': message_id, 'tf': min(count, 32767)}
+            for scope in scopes
+            for token, count in tokens.items()
+        ]
+
+    @staticmethod
+    def index_messages(rows, chunk_size=1000):
+        """
+        在当前事务中为一批消息写入索引（与消息在同一事务提交），按 chunk_size 行一条多行 INSERT
+        rows: 含 id / content / room_id / sender_id / receiver_id 的字典列表
+        """
+        index_rows = []
+        for row in rows:
+            index_rows.extend(MessageToken.rows_for(
+                row['id'], row['content'], row.get('room_id'), row.get('sender_id'), row.get('receiver_id')
+            ))
+        table = MessageToken.__table__
+        for start in range(0, len(index_rows), chunk_size):
+            db.session.execute(table.insert().values(index_rows[start:start + chunk_size]))
+        return len(index_rows)
+
+    @staticmethod
+    def search(query_text, scopes, page=1, per_page=20, conversation_key=None, max_terms=16, max_candidates=2000,
+               before_id=None):
+        """
+        在给定可见范围内检索，返回 (按相关度排序的消息ID列表, 本窗口是否还有下一页, next_before_id)
+        排序：命中的查询词元数 -> 词频之和 -> 消息新旧；至少命中 60% 的查询词元
+        conversation_key：只在与某个用户的私聊中检索
+        max_candidates：每次只在最新的这么多条候选消息（窗口）中排序，查询代价与常用词的命中总量无关；
+        窗口被截断时 next_before_id 为窗口中最旧的消息 ID，以 before_id 传回即可检索更早的窗口，否则为 None
+        """
+        from sqlalchemy import func, desc, or_, select
+
+        terms = list(tokenize(query_text))[:max_terms]
+        if not terms or not scopes:
+            return [], False, None
+
+        if len(terms) == 1 and len(terms[0]) == 1 and is_cjk(terms[0]):
+            # 单个汉字：按 bigram 前缀匹配（索引只保存相邻两字）
+            term_filter = (MessageToken.token == terms[0]) | MessageToken.token.like(f'{terms[0]}%')
+            driving_filter = term_filter
+            min_match = 1
+        else:
+            term_filter = MessageToken.token.in_(terms)
+            min_match = max(1, math.ceil(len(terms) * 0.6))
+            # 命中至少 min_match 个词元的消息一定包含最稀有的 len(terms) - min_match + 1 个词元之一，
+            # 只用这些词元驱动候选集
+            rare = MessageToken._rarest(terms, scopes, len(terms) - min_match + 1, max_candidates)
+            driving_filter = MessageToken.token.in_(rare)
+
+        # 候选：按 message_id 倒序取最新的 max_candidates 条（主键 (token, scope, message_id) 上的范围扫描）
+        candidates = db.session.query(MessageToken.message_id)\
+            .filter(driving_filter, MessageToken.scope.in_(scopes))
+        if before_id:
+            candidates = candidates.filter(MessageToken.message_id < before_id)
+        if conversation_key:
+            from models.message import Message
+            # 会话内的消息可能在热表或归档表中
+            candidates = candidates.filter(or_(*[
+                MessageToken.message_id.in_(select(model.id).where(model.conversation_key == conversation_key))
+                for model in Message.tiers()
+            ]))
+        candidate_ids = [message_id for (message_id,) in candidates.distinct()
+                         .order_by(MessageToken.message_id.desc()).limit(max_candidates)]
+        if not candidate_ids:
+            return [], False, None
+        next_before_id = candidate_ids[-1] if len(candidate_ids) >= max_candidates else None
+
+        matched = func.count().label('matched')
+        score = func.sum(MessageToken.tf).label('score')
+        rows = db.session.query(MessageToken.message_id, matched, score)\
+            .filter(term_filter, MessageToken.scope.in_(scopes), MessageToken.message_id.in_(candidate_ids))\
+            .group_by(MessageToken.message_id)\
+            .having(func.count() >= min_match)\
+            .order_by(desc('matched'), desc('score'), MessageToken.message_id.desc())\
+            .offset((page - 1) * per_page)\
+            .limit(per_page + 1)\
+            .all()
+        has_more = len(rows) > per_page
+        return [row.message_id for row in rows[:per_page]], has_more, next_before_id
+
+    @staticmethod
+    def _rarest(terms, scopes, count, cap):
+        """在可见范围内命中最少的 count 个词元（每个词元最多数到 cap 行，一条 UNION ALL 查询）"""
+        from sqlalchemy import func, literal, select, union_all
+
+        if count >= len(terms):
+            return terms
+        probes = []
+        for index, term in enumerate(terms):
+            hits = select(MessageToken.message_id)\
+                .where(MessageToken.token == term, MessageToken.scope.in_(scopes))\
+                .limit(cap).subquery()
+            probes.append(select(literal(index).label('term'), func.count().label('hits')).select_from(hits))
+        frequency = dict(db.session.execute(union_all(*probes)).all())
+        order = sorted(range(len(terms)), key=lambda index: frequency.get(index, 0))
+        return [terms[index] for index in order[:count]]
+
+    def __repr__(self):
+        return f'<MessageToken {self.token} {self.scope} {self.message_id}>'
@@ -0,0 +1,18 @@
+from datetime import datetime
+from models import db
+
+
+class PrivateReadCursor(db.Model):
+    """
+    私聊已读游标：user_id 已读到与 peer_id 私聊中的第 last_read_message_id 条消息
+    （群聊的已读游标在 RoomMember.last_read_message_id），由 utils/read_cursors.py 批量写入
+    """
+    __tablename__ = 'private_read_cursors'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    peer_id = db.Column(db.Integer, primary_key=True)
+    last_read_message_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<PrivateReadCursor {self.user_id}->{self.peer_id}={self.last_read_message_id}>'
@@ -0,0 +1,15 @@
+from models import db
+
+
+class ReplicaHeartbeat(db.Model):
+    """
+    复制延迟心跳：主库定期写入当前时间（毫秒），从库读到的值与当前时间之差即复制延迟
+    只有 id=1 一行，见 utils/replicas.py
+    """
+    __tablename__ = 'replica_heartbeat'
+
+    id = db.Column(db.Integer, primary_key=True)
+    beat_ms = db.Column(db.BigInteger, nullable=False)
+
+    def __repr__(self):
+        return f'<ReplicaHeartbeat {self.beat_ms}>'
@@ -13,6 +13,8 @@ class Room(db.Model):
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # 冗余的成员数，加入/退出房间时同步维护，避免列表接口逐个房间 COUNT(*)
+    member_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     # 关系
     members = db.relationship('RoomMember', backref='room', lazy='dynamic', cascade='all, delete-orphan')
@@ -28,7 +30,7 @@ class Room(db.Model):
             'room_type': self.room_type,
             'created_by': self.created_by,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'member_count': self.members.count()
+            'member_count': self.member_count or 0
         }
 
     def __repr__(self):
@@ -43,6 +45,8 @@ class RoomMember(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
     role = db.Column(db.String(20), default='member')  # admin, member
+    # 已读游标：最近一次已读的消息 ID，由 utils/read_cursors.py 合并后批量写入
+    last_read_message_id = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     # 唯一约束：一个用户在一个房间只能有一条记录
     __table_args__ = (db.UniqueConstraint('room_id', 'user_id', name='unique_room_user'),)
@@ -54,7 +58,8 @@ class RoomMember(db.Model):
             'room_id': self.room_id,
             'user_id': self.user_id,
             'joined_at': self.joined_at.isoformat() if self.joined_at else None,
-            'role': self.role
+            'role': self.role,
+            'last_read_message_id': self.last_read_message_id or 0
         }
 
     def __repr__(self):
@@ -0,0 +1,19 @@
+from datetime import datetime
+from models import db
+
+
+class UnreadCounter(db.Model):
+    """
+    未读计数的持久化副本：实时计数在 Redis（unread:{user_id}），由后台任务批量写回，
+    Redis 数据丢失或过期后从这里恢复，见 utils/unread.py
+    conversation：房间为 r:{room_id}，私聊为 u:{对方用户ID}
+    """
+    __tablename__ = 'unread_counters'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    conversation = db.Column(db.String(24), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<UnreadCounter {self.user_id} {self.conversation}={self.count}>'
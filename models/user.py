@@ -1,8 +1,12 @@
 from datetime import datetime
 from models import db
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
 from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 from config import SETTINGS
+from utils.identity_cache import identity_cache
+from utils.redis_client import redis_client
 
 
 class User(db.Model):
@@ -36,14 +40,35 @@ class User(db.Model):
         }
         return jwt.encode(payload, SETTINGS['jwt']['secret_key'], algorithm=SETTINGS['jwt']['algorithm'])
     
+    # 身份缓存中保存的列（不包含 password_hash，需要时再按需加载）
+    _SNAPSHOT_COLUMNS = ('id', 'username', 'email', 'created_at', 'updated_at')
+
     @staticmethod
     def verify_token(token):
-        """验证JWT token"""
+        """验证JWT token（优先命中进程内身份缓存，避免每次请求都查库）"""
         try:
+            cached = identity_cache.get(token)
+            if cached:
+                return User._from_snapshot(cached[1])
+
             payload = jwt.decode(token, SETTINGS['jwt']['secret_key'], algorithms=[SETTINGS['jwt']['algorithm']])
-            return User.query.get(payload['user_id'])
+            user = User.query.get(payload['user_id'])
+            if user:
+                identity_cache.put(token, user.id, payload['exp'], user._snapshot())
+            return user
         except:
             return None
+
+    def _snapshot(self):
+        """导出用于身份缓存的列快照"""
+        return {name: getattr(self, name) for name in self._SNAPSHOT_COLUMNS}
+
+    @staticmethod
+    def _from_snapshot(snapshot):
+        """由快照还原为当前 session 中的持久化对象（merge load=False 不会发出 SELECT）"""
+        user = User(**snapshot)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
     
     def to_dict(self):
         """转换为字典"""
@@ -57,3 +82,13 @@ class User(db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_user_caches(mapper, connection, target):
+    """用户信息变更/删除后失效身份缓存和 Redis 资料缓存"""
+    identity_cache.invalidate_user(target.id)
+    try:
+        redis_client.invalidate_user_profile(target.id)
+    except Exception as e:
+        print(f'失效用户资料缓存失败: {str(e)}')
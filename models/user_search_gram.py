@@ -0,0 +1,130 @@
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import aliased
+
+from models import db
+from models.user import User
+from utils.tokenizer import GRAM_SIZE, make_grams
+
+# 单次查询最多使用的 gram 数（取关键词中均匀分布的若干个，其余由回表校验保证正确性）
+MAX_QUERY_GRAMS = 6
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class UserSearchGram(db.Model):
+    """
+    用户名 / 邮箱的三元组（trigram）倒排索引，用于子串搜索
+    主键 (gram, user_id)：按 gram 取候选用户是一次索引范围扫描，与用户总量无关
+    """
+    __tablename__ = 'user_search_grams'
+    # 与 migrate_db 建表一致：二进制排序，gram 区分大小写 / 假名，不会出现主键冲突
+    __table_args__ = {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_bin'}
+
+    gram = db.Column(db.String(GRAM_SIZE), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True, index=True)
+
+    @staticmethod
+    def search(keyword, limit=20):
+        """
+        搜索用户，返回 User 列表：前缀匹配（走 username / email 索引）排在前面，子串匹配（走 trigram 索引，
+        关键词短于 GRAM_SIZE 时为子串扫描）在后
+        """
+        pattern = _escape_like(keyword)
+
+        users = []
+        seen = set()
+        for column in (User.username, User.email):
+            if len(users) >= limit:
+                break
+            rows = User.query.filter(column.like(f'{pattern}%', escape='\\'))\
+                .order_by(column)\
+                .limit(limit)\
+                .all()
+            for u in rows:
+                if u.id not in seen and len(users) < limit:
+                    seen.add(u.id)
+                    users.append(u)
+
+        if len(users) < limit:
+            substring = User.username.like(f'%{pattern}%', escape='\\') | User.email.like(f'%{pattern}%', escape='\\')
+            if len(keyword) >= GRAM_SIZE:
+                users.extend(UserSearchGram._substring_matches(keyword, substring, seen, limit - len(users)))
+            else:
+                # 关键词短于一个 gram，无法使用 trigram 索引，回落到子串扫描（凑够 limit 条即停止）
+                query = User.query.filter(substring)
+                if seen:
+                    query = query.filter(User.id.notin_(seen))
+                users.extend(query.order_by(User.username).limit(limit - len(users)).all())
+
+        return users
+
+    @staticmethod
+    def _substring_matches(keyword, substring, exclude, limit):
+        """
+        按 user_id 分批取 gram 候选并回表校验（gram 命中不代表连续子串命中），
+        直到凑够 limit 个子串匹配或候选取完，结果按用户名排序
+        """
+        batch_size = limit * 3
+        matched = []
+        after_id = 0
+        while len(matched) < limit:
+            candidate_ids = UserSearchGram._candidates(keyword, exclude, batch_size, after_id)
+            if candidate_ids:
+                matched.extend(User.query.filter(User.id.in_(candidate_ids), substring).all())
+            if len(candidate_ids) < batch_size:
+                break
+            after_id = candidate_ids[-1]
+        matched.sort(key=lambda u: u.username)
+        return matched[:limit]
+
+    @staticmethod
+    def _candidates(keyword, exclude, limit, after_id=0):
+        """
+        同时包含关键词所有（抽样的）gram 的用户 ID（大于 after_id，按 ID 升序）
+        以第一个 gram 驱动、其余 gram 按主键逐个连接，凑够 limit 个即停止，不做全量聚合
+        """
+        grams = sorted(make_grams(keyword))
+        if len(grams) > MAX_QUERY_GRAMS:
+            step = (len(grams) - 1) / (MAX_QUERY_GRAMS - 1)
+            grams = [grams[round(i * step)] for i in range(MAX_QUERY_GRAMS)]
+
+        base = aliased(UserSearchGram)
+        query = db.session.query(base.user_id).filter(base.gram == grams[0], base.user_id > after_id)
+        for gram in grams[1:]:
+            other = aliased(UserSearchGram)
+            query = query.join(other, (other.user_id == base.user_id) & (other.gram == gram))
+        if exclude:
+            query = query.filter(base.user_id.notin_(exclude))
+        return [user_id for (user_id,) in query.order_by(base.user_id).limit(limit)]
+
+    def __repr__(self):
+        return f'<UserSearchGram {self.gram} {self.user_id}>'
+
+
+def _write_grams(connection, user_id, grams):
+    table = UserSearchGram.__table__
+    connection.execute(table.delete().where(table.c.user_id == user_id))
+    if grams:
+        connection.execute(table.insert(), [{'gram': g, 'user_id': user_id} for g in grams])
+
+
+@event.listens_for(User, 'after_insert')
+def _index_new_user(mapper, connection, target):
+    """注册时在同一事务中写入搜索索引"""
+    _write_grams(connection, target.id, make_grams(target.username, target.email))
+
+
+@event.listens_for(User, 'after_update')
+def _reindex_user(mapper, connection, target):
+    """用户名 / 邮箱变更时重建该用户的搜索索引"""
+    state = inspect(target)
+    if state.attrs.username.history.has_changes() or state.attrs.email.history.has_changes():
+        _write_grams(connection, target.id, make_grams(target.username, target.email))
+
+
+@event.listens_for(User, 'before_delete')
+def _unindex_user(mapper, connection, target):
+    table = UserSearchGram.__table__
+    connection.execute(table.delete().where(table.c.user_id == target.id))
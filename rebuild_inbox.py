@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+会话列表重建脚本
+从 MySQL 重新计算用户的会话列表与最后一条消息预览并合并到 Redis（只合并更新的值，可在服务运行时执行），
+适合首次上线或 Redis 数据丢失后预热；未重建的用户会在登录或首次访问 /api/inbox/ 时由后台任务重建。
+
+用法: python rebuild_inbox.py [--user-id 1] [--batch-size 500]
+"""
+import argparse
+import time
+
+from app import app
+from models import db
+from models.user import User
+from utils.inbox import inbox
+
+
+def main():
+    parser = argparse.ArgumentParser(description='重建会话列表')
+    parser.add_argument('--user-id', type=int, default=None, help='只重建指定用户（默认全部用户）')
+    parser.add_argument('--batch-size', type=int, default=500, help='每批读取的用户数')
+    args = parser.parse_args()
+
+    started = time.time()
+    with app.app_context():
+        if args.user_id:
+            print(f'✓ 用户 {args.user_id}：{inbox.rebuild(args.user_id)} 个会话')
+            return
+
+        last_id = 0
+        users = 0
+        while True:
+            user_ids = [uid for (uid,) in db.session.query(User.id).filter(User.id > last_id)
+                        .order_by(User.id).limit(args.batch_size)]
+            if not user_ids:
+                break
+            for user_id in user_ids:
+                inbox.rebuild(user_id)
+            users += len(user_ids)
+            last_id = user_ids[-1]
+            db.session.remove()
+            print(f'  → 已重建 {users} 个用户（id ≤ {last_id}）')
+    print(f'✓ 完成：重建 {users} 个用户的会话列表，耗时 {time.time() - started:.1f} 秒')
+
+
+if __name__ == '__main__':
+    main()
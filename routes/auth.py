@@ -2,6 +2,8 @@ from flask import Blueprint, request, jsonify
 from models import db
 from models.user import User
 from utils.redis_client import redis_client
+from utils.replicas import replica_router
+from utils.inbox import inbox
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
@@ -36,6 +38,8 @@ def register():
         
         db.session.add(user)
         db.session.commit()
+        # 新用户复制到从库之前，其只读请求（含 token 校验）走主库
+        replica_router.pin_primary(user.id)
         
         # 生成 token
         token = user.generate_token()
@@ -70,6 +74,12 @@ def login():
         if not user or not user.check_password(password):
             return jsonify({'error': '用户名或密码错误'}), 401
         
+        # 会话列表不在 Redis 中时提前登记后台重建，客户端打开会话列表前即可完成预热
+        try:
+            inbox.ensure_ready(user.id)
+        except Exception as e:
+            print(f'登记会话列表重建失败: {str(e)}')
+        
         # 生成 token
         token = user.generate_token()
         
@@ -0,0 +1,38 @@
+from flask import Blueprint, request, jsonify
+from models.user import User
+from utils.inbox import inbox
+from utils.replicas import replica_router
+
+inbox_bp = Blueprint('inbox', __name__, url_prefix='/api/inbox')
+
+
+def get_current_user(request):
+    """从请求头获取当前用户"""
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    if not token:
+        return None
+    return User.verify_token(token)
+
+
+@inbox_bp.route('/', methods=['GET'])
+@replica_router.read_only
+def get_inbox():
+    """
+    会话列表：房间与私聊按最后活跃时间倒序，每项带最后一条消息预览和未读数
+    - offset / limit：分页（limit 最大 100）
+    - rebuilding：列表正在后台重建，本次只返回已缓存的内容
+    """
+    try:
+        user = get_current_user(request)
+        if not user:
+            return jsonify({'error': '未认证'}), 401
+
+        offset = max(0, request.args.get('offset', 0, type=int))
+        limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+
+        page = inbox.get_page(user.id, offset=offset, limit=limit)
+        page.update({'offset': offset, 'limit': limit})
+        return jsonify(page), 200
+
+    except Exception as e:
+        return jsonify({'error': f'获取会话列表失败: {str(e)}'}), 500
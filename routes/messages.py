@@ -0,0 +1,80 @@
+from flask import Blueprint, request, jsonify
+from models.user import User
+from models.room import RoomMember
+from models.message import Message
+from models.message_token import MessageToken
+from utils.replicas import replica_router
+from config import SETTINGS
+
+messages_bp = Blueprint('messages', __name__, url_prefix='/api/messages')
+
+
+def get_current_user(request):
+    """从请求头获取当前用户"""
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    if not token:
+        return None
+    return User.verify_token(token)
+
+
+@messages_bp.route('/search', methods=['GET'])
+@replica_router.read_only
+def search_messages():
+    """
+    全文搜索当前用户可见的消息（所在房间的群聊 + 自己的私聊）
+    - q：关键词（中文按相邻两字切分，英文/数字按单词）
+    - room_id：只搜某个房间；user_id：只搜与某个用户的私聊
+    - page / per_page：分页，结果按相关度排序
+    - before_id：只在更早的消息中检索；候选窗口被截断时响应中的 next_before_id 不为空，
+      本窗口翻完后以它作为 before_id 继续检索更早的消息
+    """
+    try:
+        user = get_current_user(request)
+        if not user:
+            return jsonify({'error': '未认证'}), 401
+
+        keyword = request.args.get('q', '').strip()
+        if not keyword:
+            return jsonify({'error': '搜索关键词不能为空'}), 400
+
+        page = max(1, request.args.get('page', 1, type=int))
+        per_page = max(1, min(request.args.get('per_page', 20, type=int), 50))
+        room_id = request.args.get('room_id', type=int)
+        target_id = request.args.get('user_id', type=int)
+        before_id = request.args.get('before_id', type=int)
+
+        conversation_key = None
+        if room_id:
+            if not RoomMember.query.filter_by(room_id=room_id, user_id=user.id).first():
+                return jsonify({'error': '不是房间成员'}), 403
+            scopes = [MessageToken.room_scope(room_id)]
+        elif target_id:
+            scopes = [MessageToken.user_scope(user.id)]
+            conversation_key = Message.make_conversation_key(user.id, target_id)
+        else:
+            room_ids = [rid for (rid,) in RoomMember.query.with_entities(RoomMember.room_id)
+                        .filter_by(user_id=user.id)]
+            scopes = [MessageToken.user_scope(user.id)] + [MessageToken.room_scope(rid) for rid in room_ids]
+
+        message_ids, has_more, next_before_id = MessageToken.search(
+            keyword, scopes, page=page, per_page=per_page, conversation_key=conversation_key,
+            max_candidates=SETTINGS['search']['message_candidates'], before_id=before_id
+        )
+
+        # 按相关度顺序返回，发送者批量加载
+        messages = []
+        if message_ids:
+            rows = list(Message.load_many(message_ids).values())
+            by_id = {m['id']: m for m in Message.serialize_many(rows)}
+            messages = [by_id[mid] for mid in message_ids if mid in by_id]
+
+        return jsonify({
+            'messages': messages,
+            'page': page,
+            'per_page': per_page,
+            'has_more': has_more,
+            'next_before_id': next_before_id
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': f'搜索消息失败: {str(e)}'}), 500
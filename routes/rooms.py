@@ -3,8 +3,12 @@ from models import db
 from models.user import User
 from models.room import Room, RoomMember
 from models.message import Message
-from utils.redis_client import redis_client
-import json
+from utils.history_cache import room_history_cache
+from utils.envelope import json_response, ndjson_response
+from utils.socket_session import socket_sessions
+from utils.replicas import replica_router
+from utils.inbox import inbox
+from utils.unread import unread_counters
 import random
 
 rooms_bp = Blueprint('rooms', __name__, url_prefix='/api/rooms')
@@ -19,6 +23,7 @@ def get_current_user(request):
 
 
 @rooms_bp.route('/', methods=['GET'])
+@replica_router.read_only
 def get_rooms():
     """获取用户所在的房间列表"""
     try:
@@ -26,9 +31,11 @@ def get_rooms():
         if not user:
             return jsonify({'error': '未认证'}), 401
 
-        # 获取用户所在的房间
-        room_members = RoomMember.query.filter_by(user_id=user.id).all()
-        rooms = [member.room for member in room_members]
+        # 获取用户所在的房间（单次 JOIN 查询，成员数读冗余字段）
+        rooms = Room.query.join(RoomMember, RoomMember.room_id == Room.id)\
+            .filter(RoomMember.user_id == user.id)\
+            .order_by(RoomMember.joined_at)\
+            .all()
 
         return jsonify({
             'rooms': [room.to_dict() for room in rooms]
@@ -69,7 +76,8 @@ def create_room():
             name=name,
             description=description,
             room_type=room_type,
-            created_by=user.id
+            created_by=user.id,
+            member_count=1  # 创建者
         )
         db.session.add(room)
         db.session.flush()  # 获取 room.id
@@ -78,6 +86,12 @@ def create_room():
         member = RoomMember(room_id=room.id, user_id=user.id, role='admin')
         db.session.add(member)
         db.session.commit()
+        replica_router.pin_primary(user.id)
+        unread_counters.on_join(room.id, user.id)
+        inbox.on_join(user.id, room.id, new_room=True)
+
+        # 同步到该用户已建立的 Socket.IO 连接会话
+        socket_sessions.add_room(user.id, room.id)
 
         return jsonify({
             'message': '房间创建成功',
@@ -121,7 +135,18 @@ def join_room():
         # 添加成员
         member = RoomMember(room_id=room_id, user_id=user.id)
         db.session.add(member)
+        # 原子自增成员数，避免并发加入时丢失更新
+        Room.query.filter_by(id=room_id).update(
+            {Room.member_count: Room.member_count + 1}, synchronize_session=False
+        )
         db.session.commit()
+        replica_router.pin_primary(user.id)
+        # 新成员立即加入扇出用的成员集合（发送消息时不再查询成员）
+        unread_counters.on_join(room_id, user.id)
+        inbox.on_join(user.id, room_id)
+
+        # 同步到该用户已建立的 Socket.IO 连接会话
+        socket_sessions.add_room(user.id, room_id)
 
         return jsonify({
             'message': '加入房间成功',
@@ -134,8 +159,13 @@ def join_room():
 
 
 @rooms_bp.route('/<int:room_id>/messages', methods=['GET'])
+@replica_router.read_only
 def get_messages(room_id):
-    """获取房间消息（分页）"""
+    """
+    获取房间消息
+    - 游标分页：before_id（向前翻历史）/ after_id（拉取更新的消息），返回 next_before_id / next_after_id
+    - 兼容旧客户端的 page 分页
+    """
     try:
         user = get_current_user(request)
         if not user:
@@ -147,28 +177,84 @@ def get_messages(room_id):
 
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 50, type=int)
+        per_page = max(1, min(per_page, 200))
+        before_id = request.args.get('before_id', type=int)
+        after_id = request.args.get('after_id', type=int)
 
-        # 先从 Redis 缓存获取最新消息
-        cached_messages = redis_client.get_cached_messages(room_id, per_page)
-
-        if cached_messages and page == 1:
-            # 第一页优先使用缓存
-            messages = [json.loads(msg) for msg in cached_messages]
+        # 优先读缓存：缓存覆盖请求窗口时直接返回，未预热时自动从 MySQL 回填
+        cached = room_history_cache.get_window(
+            room_id, per_page, page=page, before_id=before_id, after_id=after_id
+        )
+        if cached:
+            # 命中时 messages 为缓存中的原始 JSON，直接拼接进响应
+            messages, message_ids, has_more = cached
+        elif before_id or after_id:
+            # 游标分页（热表不够一页时继续读归档表）
+            result = Message.keyset_page({'room_id': room_id}, per_page, before_id=before_id, after_id=after_id)
+            if result is None:
+                return jsonify({'error': '游标消息不存在'}), 400
+            rows, has_more = result
+            messages = Message.serialize_many(rows)
+            message_ids = [m['id'] for m in messages]
         else:
-            # 从数据库查询
-            pagination = Message.query.filter_by(room_id=room_id)\
-                .order_by(Message.created_at.desc())\
-                .paginate(page=page, per_page=per_page, error_out=False)
+            # 从数据库查询（热表不够一页时从归档表补齐）
+            rows = Message.latest({'room_id': room_id}, per_page, offset=(page - 1) * per_page)
 
-            messages = [msg.to_dict() for msg in pagination.items]
+            # 批量加载发送者，整页固定 2 次查询
+            messages = Message.serialize_many(rows)
             messages.reverse()  # 按时间正序
-
-        return jsonify({
+            message_ids = [m['id'] for m in messages]
+            has_more = len(messages) == per_page
+
+        if before_id or after_id:
+            response = {
+                'messages': messages,
+                'per_page': per_page,
+                'has_more': has_more
+            }
+            if before_id:
+                response['next_before_id'] = message_ids[0] if has_more and message_ids else None
+            else:
+                response['next_after_id'] = message_ids[-1] if message_ids else after_id
+            return json_response(response)
+
+        return json_response({
             'messages': messages,
             'page': page,
-            'per_page': per_page
-        }), 200
+            'per_page': per_page,
+            # 旧客户端可由此切换到游标分页
+            'next_before_id': message_ids[0] if message_ids else None
+        })
 
     except Exception as e:
         return jsonify({'error': f'获取消息失败: {str(e)}'}), 500
 
+
+@rooms_bp.route('/<int:room_id>/messages/export', methods=['GET'])
+@replica_router.read_only
+def export_messages(room_id):
+    """
+    流式导出房间全部历史消息（NDJSON，按时间正序每行一条）
+    after_id：断点续传，从该消息之后继续导出
+    """
+    try:
+        user = get_current_user(request)
+        if not user:
+            return jsonify({'error': '未认证'}), 401
+
+        if not RoomMember.query.filter_by(room_id=room_id, user_id=user.id).first():
+            return jsonify({'error': '不是房间成员'}), 403
+
+        scope = {'room_id': room_id}
+        after_id = request.args.get('after_id', type=int)
+        after = None
+        if after_id:
+            after_time = Message.anchor_time(scope, after_id)
+            if after_time is None:
+                return jsonify({'error': '游标消息不存在'}), 400
+            after = (after_time, after_id)
+
+        return ndjson_response(Message.iter_export(scope, after=after), f'room-{room_id}-messages.ndjson')
+
+    except Exception as e:
+        return jsonify({'error': f'导出消息失败: {str(e)}'}), 500
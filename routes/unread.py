@@ -0,0 +1,87 @@
+from flask import Blueprint, request, jsonify
+from models.user import User
+from models.room import RoomMember
+from utils.unread import unread_counters
+from utils.read_cursors import read_cursors
+
+unread_bp = Blueprint('unread', __name__, url_prefix='/api/unread')
+
+
+def get_current_user(request):
+    """从请求头获取当前用户"""
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    if not token:
+        return None
+    return User.verify_token(token)
+
+
+@unread_bp.route('/', methods=['GET'])
+def get_unread():
+    """当前用户所有会话的未读数（一次 Redis 读取，与消息量无关）"""
+    try:
+        user = get_current_user(request)
+        if not user:
+            return jsonify({'error': '未认证'}), 401
+
+        return jsonify(unread_counters.get_badges(user.id)), 200
+
+    except Exception as e:
+        return jsonify({'error': f'获取未读数失败: {str(e)}'}), 500
+
+
+@unread_bp.route('/read', methods=['POST'])
+def mark_read():
+    """会话标记为已读：room_id 为群聊，user_id 为与该用户的私聊；带 message_id 时同时推进已读游标"""
+    try:
+        user = get_current_user(request)
+        if not user:
+            return jsonify({'error': '未认证'}), 401
+
+        data = request.get_json() or {}
+        room_id = data.get('room_id')
+        peer_id = data.get('user_id')
+        if not room_id and not peer_id:
+            return jsonify({'error': '必须指定房间或用户'}), 400
+        if room_id and not RoomMember.query.filter_by(room_id=room_id, user_id=user.id).first():
+            return jsonify({'error': '不是房间成员'}), 403
+
+        advanced = False
+        message_id = data.get('message_id')
+        if message_id:
+            try:
+                advanced = read_cursors.advance(user.id, message_id, room_id=room_id, peer_id=peer_id)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        cleared = unread_counters.mark_read(user.id, room_id=room_id, peer_id=peer_id)
+        return jsonify({'message': '已标记为已读', 'cleared': cleared, 'advanced': advanced}), 200
+
+    except Exception as e:
+        return jsonify({'error': f'标记已读失败: {str(e)}'}), 500
+
+
+@unread_bp.route('/receipts', methods=['GET'])
+def get_receipts():
+    """
+    已读游标：room_id 返回房间各成员已读到的消息 ID {user_id: message_id}，
+    user_id 返回对方在私聊中已读到的消息 ID
+    """
+    try:
+        user = get_current_user(request)
+        if not user:
+            return jsonify({'error': '未认证'}), 401
+
+        room_id = request.args.get('room_id', type=int)
+        peer_id = request.args.get('user_id', type=int)
+        if room_id:
+            if not RoomMember.query.filter_by(room_id=room_id, user_id=user.id).first():
+                return jsonify({'error': '不是房间成员'}), 403
+            return jsonify({'room_id': room_id, 'cursors': read_cursors.room_cursors(room_id)}), 200
+        if peer_id:
+            return jsonify({
+                'user_id': peer_id,
+                'last_read_message_id': read_cursors.private_cursor(peer_id, user.id)
+            }), 200
+        return jsonify({'error': '必须指定房间或用户'}), 400
+
+    except Exception as e:
+        return jsonify({'error': f'获取已读游标失败: {str(e)}'}), 500
@@ -3,7 +3,12 @@ from models import db
 from models.user import User
 from models.friend import Friend
 from models.message import Message
+from models.user_search_gram import UserSearchGram
+from config import SETTINGS
 from utils.redis_client import redis_client
+from utils.socket_session import user_room
+from utils.envelope import RawJSON, json_response, ndjson_response
+from utils.replicas import replica_router
 
 users_bp = Blueprint('users', __name__, url_prefix='/api/users')
 
@@ -29,17 +34,29 @@ def get_online_users():
         if not user:
             return jsonify({'error': '未认证'}), 401
 
-        online_user_ids = redis_client.get_online_users()
-        online_users = []
+        # 游标分页：cursor=0 开始，下一页带上返回的 next_cursor 与 next_offset，has_more 为 false 表示已到末尾
+        cursor = request.args.get('cursor', 0, type=int)
+        offset = max(0, request.args.get('offset', 0, type=int))
+        limit = max(1, min(request.args.get('limit', 200, type=int), 1000))
+        next_cursor, next_offset, online_user_ids, total = redis_client.scan_online_users(cursor, limit, offset)
 
-        for user_id in online_user_ids:
-            user_obj = User.query.get(user_id)
-            if user_obj:
-                online_users.append(user_obj.to_dict())
+        # 先批量读 Redis 资料缓存，未命中的用一次 IN 查询补齐并回填
+        profiles = redis_client.get_user_profiles(online_user_ids)
+        missing = [uid for uid in online_user_ids if uid not in profiles]
+        if missing:
+            loaded = {u.id: u.to_dict() for u in User.query.filter(User.id.in_(missing))}
+            redis_client.cache_user_profiles(loaded)
+            profiles.update(loaded)
+
+        online_users = [profiles[uid] for uid in online_user_ids if uid in profiles]
 
         return jsonify({
             'online_users': online_users,
-            'count': len(online_users)
+            'count': len(online_users),
+            'total': total,
+            'next_cursor': next_cursor,
+            'next_offset': next_offset,
+            'has_more': bool(next_cursor or next_offset)
         }), 200
 
     except Exception as e:
@@ -47,25 +64,34 @@ def get_online_users():
 
 
 @users_bp.route('/search', methods=['GET'])
+@replica_router.read_only
 def search_users():
-    """搜索用户"""
+    """搜索用户（前缀匹配优先，其次子串匹配；相同关键词短时间内直接返回 Redis 缓存）"""
     try:
         user = get_current_user(request)
         if not user:
             return jsonify({'error': '未认证'}), 401
 
-        keyword = request.args.get('keyword', '').strip()
+        keyword = request.args.get('keyword', '').strip()[:64]
         if not keyword:
             return jsonify({'error': '搜索关键词不能为空'}), 400
 
-        # 搜索用户名或邮箱，排除自己
-        users = User.query.filter(
-            User.id != user.id,
-            (User.username.like(f'%{keyword}%')) | (User.email.like(f'%{keyword}%'))
-        ).limit(20).all()
+        limit = SETTINGS['search']['user_limit']
+        # 缓存与搜索者无关，多取一条，排除自己后仍有 limit 条
+        results = None
+        try:
+            results = redis_client.get_user_search(keyword)
+        except Exception as e:
+            print(f'读取用户搜索缓存失败: {str(e)}')
+        if results is None:
+            results = [u.to_dict() for u in UserSearchGram.search(keyword, limit=limit + 1)]
+            try:
+                redis_client.cache_user_search(keyword, results, ttl=SETTINGS['search']['user_cache_ttl'])
+            except Exception as e:
+                print(f'写入用户搜索缓存失败: {str(e)}')
 
         return jsonify({
-            'users': [u.to_dict() for u in users]
+            'users': [u for u in results if u['id'] != user.id][:limit]
         }), 200
 
     except Exception as e:
@@ -73,6 +99,7 @@ def search_users():
 
 
 @users_bp.route('/friends', methods=['GET'])
+@replica_router.read_only
 def get_friends():
     """获取好友列表"""
     try:
@@ -109,6 +136,7 @@ def get_friends():
 
 
 @users_bp.route('/friends/requests', methods=['GET'])
+@replica_router.read_only
 def get_friend_requests():
     """获取好友请求列表（收到的请求）"""
     try:
@@ -172,6 +200,7 @@ def add_friend(friend_id):
                     # 对方已发送请求，直接接受
                     existing.status = 'accepted'
                     db.session.commit()
+                    replica_router.pin_primary(user.id, friend_id)
                     return jsonify({'message': '好友请求已接受'}), 200
 
         # 创建新的好友请求
@@ -182,6 +211,7 @@ def add_friend(friend_id):
         )
         db.session.add(friend_request)
         db.session.commit()
+        replica_router.pin_primary(user.id, friend_id)
 
         return jsonify({
             'message': '好友请求已发送',
@@ -213,16 +243,16 @@ def accept_friend_request(friend_id):
 
         friend_request.status = 'accepted'
         db.session.commit()
+        replica_router.pin_primary(user.id, friend_id)
 
         # 通过 Socket.IO 通知发送请求的用户（用户1）
         try:
             sio = get_socketio()
-            sender_socket = redis_client.get_user_socket_id(friend_id)
-            if sender_socket:
-                sio.emit('friend_request_accepted', {
-                    'friend': user.to_dict(),
-                    'message': f'{user.username} 已接受您的好友请求'
-                }, room=sender_socket)
+            # 发往对方的个人房间，对方在其他 worker 上也能收到
+            sio.emit('friend_request_accepted', {
+                'friend': user.to_dict(),
+                'message': f'{user.username} 已接受您的好友请求'
+            }, room=user_room(friend_id))
         except Exception as e:
             # Socket通知失败不影响主流程
             print(f'发送好友接受通知失败: {str(e)}')
@@ -256,6 +286,7 @@ def delete_friend(friend_id):
 
         db.session.delete(friend_relation)
         db.session.commit()
+        replica_router.pin_primary(user.id, friend_id)
 
         return jsonify({'message': '操作成功'}), 200
 
@@ -265,6 +296,7 @@ def delete_friend(friend_id):
 
 
 @users_bp.route('/private/<int:target_id>/messages', methods=['GET'])
+@replica_router.read_only
 def get_private_messages(target_id):
     """获取与指定用户的私聊消息（优先 Redis，回落 MySQL）"""
     try:
@@ -280,45 +312,64 @@ def get_private_messages(target_id):
         per_page = int(request.args.get('per_page', 50))
         per_page = max(1, min(per_page, 200))
 
-        import json
-
-        # 1) 尝试 Redis 缓存（最新在前）
+        # 1) 尝试 Redis 缓存（最新在前），缓存中的 JSON 原样拼接进响应，不解码
         cached = redis_client.get_private_messages(user.id, target_id, count=per_page)
-        messages = []
-        if cached:
-            for raw in cached:
-                try:
-                    msg = json.loads(raw)
-                    messages.append(msg)
-                except Exception:
-                    continue
-            # Redis 是新->旧，这里反转为旧->新
-            messages.reverse()
+        # Redis 是新->旧，这里反转为旧->新
+        messages = [RawJSON(raw) for raw in reversed(cached)] if cached else []
 
         # 2) 缓存为空则回落 MySQL
         if not messages:
-            query = Message.query.filter(
-                ((Message.sender_id == user.id) & (Message.receiver_id == target_id)) |
-                ((Message.sender_id == target_id) & (Message.receiver_id == user.id))
-            ).order_by(Message.created_at.desc()).limit(per_page)
-
-            db_messages = query.all()
-            db_messages.reverse()  # 旧->新
-            messages = [m.to_dict() for m in db_messages]
-
-            # 将 DB 结果回填 Redis，加速下次访问
-            for msg in messages:
-                try:
-                    redis_client.cache_private_message(user.id, target_id, json.dumps(msg, default=str))
-                except Exception:
-                    pass
-
-        return jsonify({
+            # 按会话标识走 (conversation_key, created_at, id) 索引的范围扫描，热表不够时从归档表补齐
+            # 结果会回填共享缓存，从主库读取（从库落后时缓存中会缺少最新消息）
+            conversation_key = Message.make_conversation_key(user.id, target_id)
+            with replica_router.primary():
+                db_messages = Message.latest({'conversation_key': conversation_key}, per_page)
+                db_messages.reverse()  # 旧->新
+                # 批量加载发送者，避免逐条懒加载 sender
+                messages = Message.serialize_many(db_messages)
+
+            # 将 DB 结果一次性批量回填 Redis，加速下次访问
+            try:
+                redis_client.cache_private_messages(user.id, target_id, messages)
+            except Exception:
+                pass
+
+        return json_response({
             'messages': messages,
             'target': target_user.to_dict(),
             'count': len(messages)
-        }), 200
+        })
 
     except Exception as e:
         return jsonify({'error': f'获取私聊消息失败: {str(e)}'}), 500
 
+
+@users_bp.route('/private/<int:target_id>/messages/export', methods=['GET'])
+@replica_router.read_only
+def export_private_messages(target_id):
+    """
+    流式导出与指定用户的全部私聊消息（NDJSON，按时间正序每行一条）
+    after_id：断点续传，从该消息之后继续导出
+    """
+    try:
+        user = get_current_user(request)
+        if not user:
+            return jsonify({'error': '未认证'}), 401
+
+        if not User.query.get(target_id):
+            return jsonify({'error': '目标用户不存在'}), 404
+
+        scope = {'conversation_key': Message.make_conversation_key(user.id, target_id)}
+        after_id = request.args.get('after_id', type=int)
+        after = None
+        if after_id:
+            after_time = Message.anchor_time(scope, after_id)
+            if after_time is None:
+                return jsonify({'error': '游标消息不存在'}), 400
+            after = (after_time, after_id)
+
+        a, b = sorted([user.id, target_id])
+        return ndjson_response(Message.iter_export(scope, after=after), f'private-{a}-{b}-messages.ndjson')
+
+    except Exception as e:
+        return jsonify({'error': f'导出私聊消息失败: {str(e)}'}), 500
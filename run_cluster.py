@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+多进程启动脚本
+在同一台机器上启动多个 app.py worker（端口依次递增），
+各 worker 之间通过 Redis 消息队列转发 Socket.IO 消息。
+
+Socket.IO 的长轮询（polling）传输要求同一客户端的请求始终落到同一个 worker，
+因此前面需要一个开启会话粘滞（sticky session）的反向代理，脚本启动后会打印 nginx 示例配置。
+
+用法: python run_cluster.py --workers 4 --base-port 9001
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from config import SETTINGS
+
+NGINX_TEMPLATE = """
+upstream chat_workers {{
+    ip_hash;  # 会话粘滞：同一客户端 IP 固定转发到同一个 worker
+{servers}
+}}
+
+server {{
+    listen {listen_port};
+
+    location / {{
+        proxy_pass http://chat_workers;
+        proxy_http_version 1.1;
+        proxy_set_header Upgrade $http_upgrade;
+        proxy_set_header Connection "upgrade";
+        proxy_set_header Host $host;
+        proxy_read_timeout 120s;
+    }}
+}}
+"""
+
+
+def wait_for_port(host, port, timeout=60):
+    """等待 worker 端口可连接"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.5)
+    return False
+
+
+def start_worker(index, port):
+    """启动单个 worker 进程"""
+    env = dict(os.environ)
+    env['PORT'] = str(port)
+    env['WORKER_ID'] = f'{socket.gethostname()}:{port}'
+    env['SOCKETIO_SCALE_OUT'] = 'true'
+    print(f'启动 worker {index}: 端口 {port}, WORKER_ID={env["WORKER_ID"]}')
+    return subprocess.Popen([sys.executable, 'app.py'], env=env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='启动多个 Socket.IO worker')
+    parser.add_argument('--workers', type=int, default=2, help='worker 数量')
+    parser.add_argument('--base-port', type=int, default=SETTINGS['app']['port'] + 1, help='第一个 worker 的端口')
+    parser.add_argument('--proxy-port', type=int, default=SETTINGS['app']['port'], help='nginx 示例配置中的监听端口')
+    args = parser.parse_args()
+
+    ports = [args.base_port + i for i in range(args.workers)]
+    processes = []
+
+    def shutdown(*_):
+        print('正在停止所有 worker...')
+        for proc in processes:
+            if proc.poll() is None:
+                proc.terminate()
+        for proc in processes:
+            proc.wait()
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    # 第一个 worker 负责建表，就绪后再启动其余 worker，避免并发 create_all
+    processes.append(start_worker(0, ports[0]))
+    if not wait_for_port('127.0.0.1', ports[0]):
+        print(f'❌ worker 0 未能在端口 {ports[0]} 上就绪')
+        shutdown()
+    for index, port in enumerate(ports[1:], start=1):
+        processes.append(start_worker(index, port))
+
+    servers = '\n'.join(f'    server 127.0.0.1:{port};' for port in ports)
+    print('=' * 50)
+    print(f'✅ 已启动 {len(ports)} 个 worker: {ports}')
+    print('nginx 示例配置（会话粘滞）:')
+    print(NGINX_TEMPLATE.format(servers=servers, listen_port=args.proxy_port))
+    print('=' * 50)
+    sys.stdout.flush()
+
+    # 任一 worker 退出则停止全部
+    while True:
+        for proc in processes:
+            if proc.poll() is not None:
+                print(f'❌ worker (pid={proc.pid}) 已退出，退出码 {proc.returncode}')
+                shutdown()
+        time.sleep(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+测试环境：临时 SQLite + fakeredis（独立进程监听本地端口），不依赖 MySQL / Redis 服务
+运行: pip install -r requirements.txt -r tests/requirements.txt && python -m pytest -q
+"""
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FAKE_REDIS_CODE = (
+    "import sys\n"
+    "from fakeredis import TcpFakeServer\n"
+    "TcpFakeServer(('127.0.0.1', int(sys.argv[1])), server_type='redis').serve_forever()\n"
+)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def count_queries(engine):
+    """统计块内发往数据库的 SQL 语句"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+@pytest.fixture(scope='session')
+def redis_port():
+    """启动 fakeredis 服务进程"""
+    port = free_port()
+    process = subprocess.Popen([sys.executable, '-c', FAKE_REDIS_CODE, str(port)])
+    assert wait_for_port(port), 'fakeredis 未就绪'
+    yield port
+    process.terminate()
+    process.wait()
+
+
+@pytest.fixture(scope='session')
+def app_env(redis_port, tmp_path_factory):
+    """应用进程使用的环境变量（多进程测试中传给子进程）"""
+    env = {
+        'DATABASE_URL': f"sqlite:///{tmp_path_factory.mktemp('db') / 'test.db'}",
+        'REDIS_HOST': '127.0.0.1',
+        'REDIS_PORT': str(redis_port),
+        'MYSQL_HOST': '127.0.0.1',
+        'MESSAGE_WRITE_BEHIND': 'false',
+        'SOCKETIO_SCALE_OUT': 'false'
+    }
+    os.environ.update(env)
+    return env
+
+
+@pytest.fixture(scope='session')
+def app_module(app_env):
+    """导入 app.py（配置在导入时读取环境变量）并建表"""
+    import app as app_module
+    from models import db
+    with app_module.app.app_context():
+        db.create_all()
+    preload_scripts()
+    return app_module
+
+
+def preload_scripts():
+    """
+    预先加载全部 Lua 脚本：fakeredis 的 TCP 服务在返回 NOSCRIPT 错误后会断开该连接，
+    redis-py 随后的 SCRIPT LOAD 因此失败（真实 Redis 没有这个问题）
+    """
+    from utils.redis_client import RedisClient, redis_client
+    for name in dir(RedisClient):
+        if name.endswith('_LUA'):
+            redis_client.client.script_load(getattr(RedisClient, name))
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+_names = itertools.count(1)
+
+
+@pytest.fixture
+def register(client):
+    """注册一个新用户，返回 (请求头, 用户字典)"""
+    def register_user(prefix='user'):
+        name = f'{prefix}{next(_names)}'
+        data = client.post('/api/auth/register', json={
+            'username': name, 'email': f'{name}@example.com', 'password': 'secret123'
+        }).get_json()
+        return {'Authorization': f"Bearer {data['token']}"}, data['user']
+    return register_user
@@ -0,0 +1,98 @@
+"""多 worker 部署：两个 app.py 进程共享 Redis 消息队列，消息跨进程投递"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+
+from conftest import ROOT, free_port, wait_for_port
+
+
+@pytest.fixture
+def workers(app_module, app_env, tmp_path):
+    """启动两个开启 SOCKETIO_SCALE_OUT 的 worker，返回各自的地址"""
+    processes, urls = [], []
+    for index in range(2):
+        port = free_port()
+        env = dict(os.environ, **app_env)
+        env.update(HOST='127.0.0.1', PORT=str(port), DEBUG='False',
+                   WORKER_ID=f'test-worker-{index}', SOCKETIO_SCALE_OUT='true')
+        log = open(tmp_path / f'worker{index}.log', 'w')
+        processes.append(subprocess.Popen([sys.executable, 'app.py'], cwd=ROOT, env=env,
+                                          stdout=log, stderr=subprocess.STDOUT))
+        urls.append((port, f'http://127.0.0.1:{port}'))
+    try:
+        for port, _ in urls:
+            assert wait_for_port(port, timeout=60), f'worker 未就绪，日志见 {tmp_path}'
+        yield [url for _, url in urls]
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+def register(base, name):
+    data = requests.post(f'{base}/api/auth/register', json={
+        'username': name, 'email': f'{name}@example.com', 'password': 'secret123'
+    }, timeout=10).json()
+    return data['token'], data['user']
+
+
+CLIENT_CODE = """
+import json, sys, time
+import socketio
+
+worker_a, token_a, worker_b, token_b, room_id, user_a_id = sys.argv[1:]
+room_id, user_a_id = int(room_id), int(user_a_id)
+received = {'a': [], 'b': []}
+client_a, client_b = socketio.Client(), socketio.Client()
+client_a.on('new_message', lambda data: received['a'].append(data['message']['content']))
+client_b.on('new_message', lambda data: received['b'].append(data['message']['content']))
+client_a.connect(worker_a + '?token=' + token_a, transports=['websocket'])
+client_b.connect(worker_b + '?token=' + token_b, transports=['websocket'])
+
+
+def wait_until(predicate, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline and not predicate():
+        time.sleep(0.1)
+
+
+client_a.call('join_room', {'room_id': room_id}, timeout=10)
+client_b.call('join_room', {'room_id': room_id}, timeout=10)
+client_a.call('send_message', {'content': 'room from A', 'room_id': room_id}, timeout=10)
+wait_until(lambda: 'room from A' in received['b'])
+client_b.call('send_message', {'content': 'dm from B', 'receiver_id': user_a_id}, timeout=10)
+wait_until(lambda: 'dm from B' in received['a'])
+client_a.disconnect()
+client_b.disconnect()
+print(json.dumps(received))
+"""
+
+
+def test_messages_are_delivered_across_workers(workers):
+    worker_a, worker_b = workers
+    suffix = str(int(time.time() * 1000))
+    token_a, user_a = register(worker_a, f'cla{suffix}')
+    token_b, user_b = register(worker_b, f'clb{suffix}')
+    room = requests.post(f'{worker_a}/api/rooms/', json={'name': 'cluster'},
+                         headers={'Authorization': f'Bearer {token_a}'}, timeout=10).json()['room']
+    requests.post(f'{worker_b}/api/rooms/join', json={'room_id': room['id']},
+                  headers={'Authorization': f'Bearer {token_b}'}, timeout=10)
+
+    # Socket.IO 客户端在独立进程中运行：pytest 进程已被 app 的 eventlet monkey_patch 修改，
+    # 客户端的后台线程在其中无法正常断开
+    result = subprocess.run(
+        [sys.executable, '-c', CLIENT_CODE, worker_a, token_a, worker_b, token_b,
+         str(room['id']), str(user_a['id'])],
+        capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    received = json.loads(result.stdout.strip().splitlines()[-1])
+    # A 所在 worker 发出的群聊消息到达 B 所在 worker 上的连接
+    assert 'room from A' in received['b'], received
+    # B 所在 worker 发出的私聊消息到达 A 所在 worker 上的连接
+    assert 'dm from B' in received['a'], received
@@ -0,0 +1,82 @@
+"""会话列表：请求不内联重建，最后一条消息按 (created_at, id) 选取，预览随会话过期"""
+from datetime import datetime, timedelta
+
+
+def test_rebuild_runs_in_the_background(app_module, client, register):
+    from models import db
+    from models.message import Message
+    from utils.inbox import inbox
+    from utils.redis_client import redis_client
+
+    (headers, alice), (_, bob) = register('inbox'), register('inbox')
+    now = datetime.utcnow()
+    with app_module.app.app_context():
+        # 号段分配的 ID 不与时间同序：ID 更大的消息反而更早
+        db.session.add_all([
+            Message(id=900002, sender_id=bob['id'], receiver_id=alice['id'], content='older',
+                    created_at=now - timedelta(minutes=5),
+                    conversation_key=Message.make_conversation_key(alice['id'], bob['id'])),
+            Message(id=900001, sender_id=bob['id'], receiver_id=alice['id'], content='newer', created_at=now,
+                    conversation_key=Message.make_conversation_key(alice['id'], bob['id'])),
+        ])
+        db.session.commit()
+    redis_client.client.flushdb()
+
+    rebuilds = inbox.rebuilds
+    data = client.get('/api/inbox/', headers=headers).get_json()
+    assert data['rebuilding'] is True and data['conversations'] == []
+    assert inbox.rebuilds == rebuilds
+
+    with app_module.app.app_context():
+        assert inbox.process_rebuilds() == 1
+    data = client.get('/api/inbox/', headers=headers).get_json()
+    assert data['rebuilding'] is False
+    assert [item['last_message']['content'] for item in data['conversations']] == ['newer']
+
+
+def test_previews_expire_with_the_inbox(app_module, client, register):
+    from utils.inbox import inbox
+    from utils.redis_client import redis_client
+
+    (owner_headers, owner), (member_headers, _) = register('inbox'), register('inbox')
+    room = client.post('/api/rooms/', json={'name': 'inbox'}, headers=owner_headers).get_json()['room']
+    client.post('/api/rooms/join', json={'room_id': room['id']}, headers=member_headers)
+    with app_module.app.app_context():
+        inbox.on_message({'id': 1, 'sender_id': owner['id'], 'room_id': room['id'], 'content': 'hi',
+                          'created_at': datetime.utcnow().isoformat()})
+
+    key = f"inbox:preview:r:{room['id']}"
+    assert 0 < redis_client.client.ttl(key) <= inbox.ttl
+    for headers in (owner_headers, member_headers):
+        conversations = client.get('/api/inbox/', headers=headers).get_json()['conversations']
+        assert conversations[0]['last_message']['content'] == 'hi'
+
+
+def test_member_of_empty_room_is_not_rebuilt_again(app_module, client, register):
+    from utils.inbox import inbox
+    from utils.redis_client import redis_client
+
+    headers, _ = register('inbox')
+    room = client.post('/api/rooms/', json={'name': 'empty'}, headers=headers).get_json()['room']
+    redis_client.client.flushdb()
+
+    assert client.get('/api/inbox/', headers=headers).get_json()['rebuilding'] is True
+    with app_module.app.app_context():
+        assert inbox.process_rebuilds() == 1
+    rebuilds = inbox.rebuilds
+    for _ in range(2):
+        data = client.get('/api/inbox/', headers=headers).get_json()
+        assert data['rebuilding'] is False
+        assert [(item['room']['id'], item['last_message']) for item in data['conversations']] == [(room['id'], None)]
+    assert redis_client.count_inbox_rebuilds() == 0
+    assert inbox.rebuilds == rebuilds
+
+
+def test_new_room_is_not_reported_as_rebuilding(app_module, client, register):
+    from utils.inbox import inbox
+
+    headers, user = register('inbox')
+    with app_module.app.app_context():
+        inbox.rebuild(user['id'])
+    client.post('/api/rooms/', json={'name': 'fresh'}, headers=headers)
+    assert client.get('/api/inbox/', headers=headers).get_json()['rebuilding'] is False
@@ -0,0 +1,76 @@
+"""消息归档：一个 worker 开始归档后，其他 worker 的历史查询立即带上归档表"""
+import time
+
+
+def test_archive_flag_is_shared_through_redis(app_module, monkeypatch):
+    from models.message import Message
+    from models.message_archive import ArchivedMessage, _archive_state
+    from utils.redis_client import redis_client
+
+    redis_client.client.flushdb()
+    # 本进程刚查过数据库、认为归档表为空（进程内缓存尚未过期）
+    monkeypatch.setitem(_archive_state, 'in_use', False)
+    monkeypatch.setitem(_archive_state, 'checked_at', time.monotonic())
+    with app_module.app.app_context():
+        assert Message.tiers() == (Message,)
+        # 另一个 worker 的归档任务发布了标记
+        redis_client.set_archive_in_use()
+        assert Message.tiers() == (Message, ArchivedMessage)
+
+
+def test_reads_span_hot_and_archive_tiers(app_module, client, register, monkeypatch):
+    from datetime import datetime, timedelta
+    from sqlalchemy import func
+    from models import db
+    from models.message import Message
+    from models.message_archive import ArchivedMessage, _archive_state
+    from utils.archiver import MessageArchiver
+    from utils.history_cache import room_history_cache
+    from utils.redis_client import redis_client
+
+    headers, user = register('archive')
+    room = client.post('/api/rooms/', json={'name': 'tiers'}, headers=headers).get_json()['room']
+    monkeypatch.setitem(_archive_state, 'in_use', False)
+    monkeypatch.setitem(_archive_state, 'checked_at', time.monotonic())
+    redis_client.client.flushdb()
+
+    now = datetime.utcnow()
+    with app_module.app.app_context():
+        base_id = (db.session.query(func.max(Message.id)).scalar() or 0) + 1000
+        # 按时间排列的 12 条消息：前 6 条过期；ID 与时间不同序（异步写入时可能出现）
+        id_offsets = [5, 0, 2, 9, 1, 4, 3, 7, 6, 11, 8, 10]
+        times = [now - timedelta(days=200, minutes=-i) for i in range(6)] + \
+                [now - timedelta(days=1, minutes=-i) for i in range(6)]
+        ids = [base_id + offset for offset in id_offsets]
+        db.session.add_all([
+            Message(id=message_id, sender_id=user['id'], room_id=room['id'], content=f'm{index}', created_at=created_at)
+            for index, (message_id, created_at) in enumerate(zip(ids, times))
+        ])
+        db.session.commit()
+
+        try:
+            assert MessageArchiver(after_days=180).run() == 6
+            assert sorted(m.id for m in ArchivedMessage.query.filter_by(room_id=room['id'])) == sorted(ids[:6])
+            assert Message.tiers() == (Message, ArchivedMessage)
+
+            scope = {'room_id': room['id']}
+            newest_first = list(reversed(ids))
+            assert [m.id for m in Message.latest(scope, 12)] == newest_first
+            # 偏移量越过整个热表后在归档表中继续跳过
+            assert [m.id for m in Message.latest(scope, 3, offset=7)] == newest_first[7:10]
+
+            rows, has_more = Message.keyset_page(scope, 5, before_id=ids[8])
+            assert [m.id for m in rows] == ids[3:8] and has_more
+            rows, has_more = Message.keyset_page(scope, 5, after_id=ids[2])
+            assert [m.id for m in rows] == ids[3:8] and has_more
+            rows, has_more = Message.keyset_page(scope, 5, before_id=ids[4])
+            assert [m.id for m in rows] == ids[:4] and not has_more
+
+            # 缓存回填同样跨两层读取
+            _, cached_ids, has_more = room_history_cache.get_window(room['id'], 12)
+            assert cached_ids == ids and not has_more
+        finally:
+            ArchivedMessage.query.filter_by(room_id=room['id']).delete()
+            Message.query.filter_by(room_id=room['id']).delete()
+            db.session.commit()
+            redis_client.client.flushdb()
@@ -0,0 +1,74 @@
+"""历史消息接口的查询次数与页大小无关（发送者批量加载，不逐条懒加载）"""
+import pytest
+
+from conftest import count_queries
+
+
+@pytest.fixture
+def conversation(app_module, client, register):
+    """
+    房间里 60 条消息各来自不同的发送者（逐条懒加载 sender 时查询数随页大小增长），
+    另有一段 60 条消息的私聊
+    """
+    from models import db
+    from models.user import User
+    from models.message import Message
+
+    headers, owner = register('hist')
+    peer_headers, peer = register('hist')
+    room = client.post('/api/rooms/', json={'name': 'history'}, headers=headers).get_json()['room']
+
+    with app_module.app.app_context():
+        senders = [User(username=f"{owner['username']}_s{i}", email=f"{owner['username']}_s{i}@example.com",
+                        password_hash='-') for i in range(60)]
+        db.session.add_all(senders)
+        db.session.flush()
+        for i, sender in enumerate(senders):
+            db.session.add(Message(sender_id=sender.id, room_id=room['id'], content=f'room {i}'))
+            sender_id, receiver_id = (owner['id'], peer['id']) if i % 2 else (peer['id'], owner['id'])
+            db.session.add(Message(sender_id=sender_id, receiver_id=receiver_id, content=f'dm {i}',
+                                   conversation_key=Message.make_conversation_key(owner['id'], peer['id'])))
+        db.session.commit()
+    return headers, owner, peer, room
+
+
+def page_queries(app_module, client, headers, url):
+    """清空 Redis 缓存后请求一页，返回 (消息数, 执行的 SQL 数)"""
+    from models import db
+    from utils.redis_client import redis_client
+
+    redis_client.client.flushdb()
+    with app_module.app.app_context():
+        engine = db.engine
+    with count_queries(engine) as statements:
+        response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    return len(response.get_json()['messages']), len(statements)
+
+
+def test_room_history_query_count_is_constant(app_module, client, conversation, monkeypatch):
+    from utils.history_cache import room_history_cache
+
+    headers, _, _, room = conversation
+    url = f"/api/rooms/{room['id']}/messages?per_page="
+    # 预热进程内缓存（身份缓存等），之后每页的查询数只取决于接口本身
+    page_queries(app_module, client, headers, url + '1')
+
+    # 回填缓存窗口（固定 size 条）与直接读 MySQL 两条路径
+    for cache_size in (room_history_cache.size, 0):
+        monkeypatch.setattr(room_history_cache, 'size', cache_size)
+        small = page_queries(app_module, client, headers, url + '5')
+        large = page_queries(app_module, client, headers, url + '50')
+        assert (small[0], large[0]) == (5, 50)
+        assert small[1] == large[1]
+
+
+def test_private_history_query_count_is_constant(app_module, client, conversation):
+    headers, _, peer, _ = conversation
+    url = f"/api/users/private/{peer['id']}/messages?per_page="
+    page_queries(app_module, client, headers, url + '1')
+
+    small = page_queries(app_module, client, headers, url + '5')
+    large = page_queries(app_module, client, headers, url + '50')
+    assert (small[0], large[0]) == (5, 50)
+    assert small[1] == large[1]
@@ -0,0 +1,79 @@
+"""消息全文搜索：候选集由最稀有的词元驱动并有上限，建表排序规则与 migrate_db 一致"""
+import pytest
+
+
+@pytest.fixture
+def indexed(app_module, register):
+    """房间中 30 条含 hello 的消息，其中最早的一条还含 zebra"""
+    from models import db
+    from models.message import Message
+    from models.message_token import MessageToken
+
+    _, user = register('search')
+    with app_module.app.app_context():
+        messages = [Message(sender_id=user['id'], room_id=9001,
+                            content='hello zebra' if index == 0 else f'hello number {index}')
+                    for index in range(30)]
+        db.session.add_all(messages)
+        db.session.flush()
+        MessageToken.index_messages([{'id': m.id, 'content': m.content, 'room_id': m.room_id}
+                                     for m in messages])
+        db.session.commit()
+        ids = [m.id for m in messages]
+    yield [MessageToken.room_scope(9001)], ids
+    with app_module.app.app_context():
+        MessageToken.query.filter_by(scope=MessageToken.room_scope(9001)).delete()
+        Message.query.filter_by(room_id=9001).delete()
+        db.session.commit()
+
+
+def test_rare_term_drives_candidates(app_module, indexed):
+    from models.message_token import MessageToken
+    scopes, ids = indexed
+    with app_module.app.app_context():
+        # 最早的消息不在最新 5 条 hello 中，但由 zebra 驱动的候选集能找到它
+        assert MessageToken.search('hello zebra', scopes, max_candidates=5) == ([ids[0]], False, None)
+
+
+def test_capped_candidates_continue_with_before_id(app_module, indexed):
+    from models.message_token import MessageToken
+    scopes, ids = indexed
+    with app_module.app.app_context():
+        found, has_more, next_before_id = MessageToken.search('hello', scopes, per_page=20, max_candidates=5)
+        assert sorted(found) == sorted(ids[-5:])
+        assert not has_more
+        # 窗口被截断：更早的匹配可以通过 before_id 继续取到，逐个窗口取完全部 30 条
+        assert next_before_id == ids[-5]
+        seen = list(found)
+        while next_before_id:
+            found, _, next_before_id = MessageToken.search('hello', scopes, per_page=20, max_candidates=5,
+                                                           before_id=next_before_id)
+            seen.extend(found)
+    assert sorted(seen) == sorted(ids)
+
+
+def test_search_api_reports_truncated_window(client, register, indexed, monkeypatch):
+    from config import SETTINGS
+    from models import db
+    from models.room import RoomMember
+
+    headers, user = register('search')
+    with client.application.app_context():
+        db.session.add(RoomMember(room_id=9001, user_id=user['id']))
+        db.session.commit()
+    monkeypatch.setitem(SETTINGS['search'], 'message_candidates', 5)
+    data = client.get('/api/messages/search?q=hello&room_id=9001', headers=headers).get_json()
+    assert len(data['messages']) == 5 and data['next_before_id']
+    data = client.get(f"/api/messages/search?q=hello&room_id=9001&before_id={data['next_before_id']}",
+                      headers=headers).get_json()
+    assert len(data['messages']) == 5
+
+
+def test_mysql_tables_use_binary_collation(app_module):
+    from sqlalchemy.dialects import mysql
+    from sqlalchemy.schema import CreateTable
+    from models.message_token import MessageToken
+    from models.user_search_gram import UserSearchGram
+    for model in (MessageToken, UserSearchGram):
+        ddl = str(CreateTable(model.__table__).compile(dialect=mysql.dialect()))
+        assert 'COLLATE utf8mb4_bin' in ddl, model.__tablename__
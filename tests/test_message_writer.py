@@ -0,0 +1,74 @@
+"""异步批量落库：写入任务出错后继续运行，超时的消息不会在之后悄悄落库"""
+import eventlet
+import pytest
+
+
+@pytest.fixture
+def writer(app_module):
+    from sqlalchemy import func
+    from models import db
+    from models.message import Message
+    from utils.message_writer import MessageWriter
+    from utils.redis_client import redis_client
+
+    writer = MessageWriter(enabled=True, flush_interval=0.001, ack_timeout=0.2)
+    # 与 start() 一样让号段从已有的最大 ID 之后开始（其他测试会清空 Redis）
+    with app_module.app.app_context():
+        redis_client.ensure_id_floor('messages', db.session.query(func.max(Message.id)).scalar() or 0)
+    loop = None
+
+    def start():
+        nonlocal loop
+        loop = eventlet.spawn(writer._writer_loop, app_module.sio, app_module.app)
+
+    writer.start_loop = start
+    yield writer
+    if loop is not None:
+        loop.kill()
+
+
+def send(writer, sender, receiver, content):
+    from models.message import Message
+    from utils.envelope import MessageEnvelope
+    row = writer.new_row(sender_id=sender['id'], receiver_id=receiver['id'], content=content,
+                         conversation_key=Message.make_conversation_key(sender['id'], receiver['id']))
+    writer.write(row, MessageEnvelope(Message(**row).to_dict()))
+    return row['id']
+
+
+def stored(app_module, message_id):
+    from models.message import Message
+    with app_module.app.app_context():
+        return Message.query.get(message_id) is not None
+
+
+def test_writer_loop_survives_flush_errors(app_module, writer, register, monkeypatch):
+    (_, alice), (_, bob) = register('writer'), register('writer')
+    original = writer.flush
+    calls = []
+
+    def broken_once(batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise RuntimeError('connection lost')
+        original(batch)
+
+    monkeypatch.setattr(writer, 'flush', broken_once)
+    writer.start_loop()
+    with pytest.raises(RuntimeError):
+        send(writer, alice, bob, 'lost')
+    message_id = send(writer, alice, bob, 'delivered')
+    assert stored(app_module, message_id)
+
+
+def test_timed_out_message_is_not_written_later(app_module, writer, register):
+    (_, alice), (_, bob) = register('writer'), register('writer')
+    # 写入任务尚未启动：消息一直排队直到超时
+    with pytest.raises(TimeoutError):
+        send(writer, alice, bob, 'too late')
+    cancelled_id = writer._next_id - 1
+    writer.start_loop()
+    message_id = send(writer, alice, bob, 'on time')
+    assert stored(app_module, message_id)
+    assert not stored(app_module, cancelled_id)
+    assert writer.stats()['cancelled'] == 1
@@ -0,0 +1,23 @@
+"""在线用户列表：limit 是每页的硬上限，翻页不丢用户"""
+import time
+
+
+def test_online_users_pages_respect_limit(client, register):
+    from utils.redis_client import redis_client
+
+    redis_client.client.flushdb()
+    users = [register('online') for _ in range(5)]
+    headers = users[0][0]
+    # 小集合的 ZSCAN 会忽略 COUNT 一次返回全部成员
+    redis_client.client.zadd('presence:users', {user['id']: time.time() for _, user in users})
+
+    seen, cursor, offset = [], 0, 0
+    for _ in range(10):
+        data = client.get(f'/api/users/online?cursor={cursor}&offset={offset}&limit=2', headers=headers).get_json()
+        assert len(data['online_users']) <= 2
+        seen.extend(user['id'] for user in data['online_users'])
+        if not data['has_more']:
+            break
+        cursor, offset = data['next_cursor'], data['next_offset']
+
+    assert sorted(seen) == sorted(user['id'] for _, user in users)
@@ -0,0 +1,20 @@
+"""在线状态：心跳与过期清理脚本的全部 key 由调用方传入"""
+
+
+def test_heartbeat_and_sweep(app_module):
+    from utils.redis_client import redis_client
+
+    r = redis_client.client
+    r.flushdb()
+    redis_client.presence_heartbeat('w1', [('s1', 5), ('s2', 5), ('s3', 6)], 100)
+    assert r.smembers('user:5:sockets') == {'s1', 's2'}
+    assert r.smembers('user:6:sockets') == {'s3'}
+
+    # 用户 6 的连接在清理前刷新了心跳
+    redis_client.presence_heartbeat('w1', [('s3', 6)], 300)
+    processed, offline = redis_client.presence_sweep(200)
+    assert processed == 2
+    assert offline == [5]
+    assert r.hkeys('socket:connections') == ['s3']
+    assert r.zrange('presence:users', 0, -1) == ['6']
+    assert redis_client.presence_sweep(200) == (0, [])
@@ -0,0 +1,85 @@
+"""已读游标：确认的消息必须属于该会话，不会推进的确认不查库，批量写回时坏数据只影响所在用户"""
+import pytest
+
+
+@pytest.fixture
+def room_with_message(app_module, client, register):
+    from models import db
+    from models.message import Message
+    from utils.redis_client import redis_client
+
+    redis_client.client.flushdb()
+    (owner_headers, owner), (member_headers, member) = register('cursor'), register('cursor')
+    room = client.post('/api/rooms/', json={'name': 'cursor'}, headers=owner_headers).get_json()['room']
+    client.post('/api/rooms/join', json={'room_id': room['id']}, headers=member_headers)
+    with app_module.app.app_context():
+        message = Message(sender_id=owner['id'], room_id=room['id'], content='read me')
+        db.session.add(message)
+        db.session.commit()
+        message_id = message.id
+    return room, message_id, (owner_headers, owner), (member_headers, member)
+
+
+def test_ack_must_reference_a_message_in_the_conversation(client, room_with_message):
+    room, message_id, _, (headers, _) = room_with_message
+    for bogus in (message_id + 1000, 2 ** 40, -1, 'abc'):
+        response = client.post('/api/unread/read', json={'room_id': room['id'], 'message_id': bogus}, headers=headers)
+        assert response.status_code == 400, bogus
+    data = client.post('/api/unread/read', json={'room_id': room['id'], 'message_id': message_id},
+                       headers=headers).get_json()
+    assert data['advanced'] is True
+
+
+
+def test_stale_ack_skips_the_database(app_module, room_with_message):
+    from models import db
+    from conftest import count_queries
+    from utils.read_cursors import read_cursors
+
+    room, message_id, _, (_, member) = room_with_message
+    with app_module.app.app_context():
+        assert read_cursors.advance(member['id'], message_id, room_id=room['id'])
+        with count_queries(db.engine) as statements:
+            assert not read_cursors.advance(member['id'], message_id, room_id=room['id'])
+            assert not read_cursors.advance(member['id'], message_id - 1, room_id=room['id'])
+    assert statements == []
+
+def test_flush_drops_only_the_failing_user(app_module, room_with_message, monkeypatch):
+    from models.room import RoomMember
+    from utils.read_cursors import read_cursors
+    from utils.redis_client import redis_client
+
+    room, message_id, (_, owner), (_, member) = room_with_message
+    original = read_cursors._write
+
+    def write(room_rows, private_rows):
+        if any(row['b_user_id'] == owner['id'] for row in room_rows):
+            raise RuntimeError('bad row')
+        return original(room_rows, private_rows)
+
+    monkeypatch.setattr(read_cursors, '_write', write)
+    with app_module.app.app_context():
+        for user in (owner, member):
+            read_cursors.advance(user['id'], message_id, room_id=room['id'])
+        assert read_cursors.flush() == 1
+        assert redis_client.count_read_dirty() == 0
+        assert RoomMember.query.filter_by(room_id=room['id'], user_id=member['id']).one()\
+            .last_read_message_id == message_id
+
+
+def test_flush_requeues_when_every_user_fails(app_module, room_with_message, monkeypatch):
+    from utils.read_cursors import read_cursors
+    from utils.redis_client import redis_client
+
+    room, message_id, (_, owner), (_, member) = room_with_message
+
+    def write(room_rows, private_rows):
+        raise RuntimeError('database unavailable')
+
+    monkeypatch.setattr(read_cursors, '_write', write)
+    with app_module.app.app_context():
+        for user in (owner, member):
+            read_cursors.advance(user['id'], message_id, room_id=room['id'])
+        with pytest.raises(RuntimeError):
+            read_cursors.flush()
+        assert redis_client.count_read_dirty() == 2
@@ -0,0 +1,56 @@
+"""读写分离：只读请求走从库，但回填共享缓存的查询走主库（两个 SQLite 库模拟主从）"""
+import shutil
+
+import pytest
+from sqlalchemy import create_engine
+
+
+@pytest.fixture
+def lagging_replica(app_module, register, client, tmp_path, monkeypatch):
+    """房间和成员已复制到从库，之后发送的消息只在主库（从库落后）"""
+    from models import db
+    from models.message import Message
+    from utils.redis_client import redis_client
+    from utils.replicas import replica_router
+
+    redis_client.client.flushdb()
+    headers, user = register('replica')
+    room = client.post('/api/rooms/', json={'name': 'replica'}, headers=headers).get_json()['room']
+
+    app = app_module.app
+    with app.app_context():
+        primary_path = db.engines[None].url.database
+        db.session.remove()
+        db.engines[None].dispose()
+        replica_path = tmp_path / 'replica.db'
+        shutil.copy(primary_path, replica_path)
+        db.session.add_all(Message(sender_id=user['id'], room_id=room['id'], content=f'after snapshot {index}')
+                           for index in range(3))
+        db.session.commit()
+
+    engines = db._app_engines[app]
+    engines['replica_0'] = create_engine(f'sqlite:///{replica_path}')
+    monkeypatch.setattr(replica_router, 'names', ['replica_0'])
+    monkeypatch.setattr(replica_router, '_healthy', ['replica_0'])
+    try:
+        yield headers, room
+    finally:
+        engines.pop('replica_0').dispose()
+
+
+def test_reads_are_routed_to_the_replica(client, lagging_replica, monkeypatch):
+    from utils.history_cache import room_history_cache
+    headers, room = lagging_replica
+    # 不走缓存时历史直接从（落后的）从库读取
+    monkeypatch.setattr(room_history_cache, 'size', 0)
+    data = client.get(f"/api/rooms/{room['id']}/messages", headers=headers).get_json()
+    assert data['messages'] == []
+
+
+def test_cache_warm_reads_the_primary(client, lagging_replica):
+    headers, room = lagging_replica
+    data = client.get(f"/api/rooms/{room['id']}/messages", headers=headers).get_json()
+    assert [m['content'] for m in data['messages']] == [f'after snapshot {index}' for index in range(3)]
+    # 缓存中的窗口同样完整，后续请求命中缓存也能看到
+    data = client.get(f"/api/rooms/{room['id']}/messages", headers=headers).get_json()
+    assert len(data['messages']) == 3
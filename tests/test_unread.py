@@ -0,0 +1,89 @@
+"""未读计数：房间消息为除发送者外的每个成员 +1，成员集合未缓存时从 MySQL 回填"""
+
+
+def test_room_message_fans_out_to_members(app_module, client, register):
+    from utils.redis_client import redis_client
+    from utils.unread import unread_counters
+
+    (owner_headers, owner), (headers_b, _), (headers_c, _) = [register('unread') for _ in range(3)]
+    room = client.post('/api/rooms/', json={'name': 'unread'}, headers=owner_headers).get_json()['room']
+    for headers in (headers_b, headers_c):
+        client.post('/api/rooms/join', json={'room_id': room['id']}, headers=headers)
+    redis_client.client.flushdb()
+
+    with app_module.app.app_context():
+        assert unread_counters.on_room_message(room['id'], owner['id']) == 2
+        assert unread_counters.on_room_message(room['id'], owner['id']) == 2
+
+    for headers in (headers_b, headers_c):
+        assert client.get('/api/unread/', headers=headers).get_json()['rooms'] == {str(room['id']): 2}
+    assert client.get('/api/unread/', headers=owner_headers).get_json()['total'] == 0
+
+
+def test_flush_loads_persisted_counters_in_one_query(app_module, client, register):
+    from models import db
+    from conftest import count_queries
+    from utils.redis_client import redis_client
+    from utils.unread import unread_counters
+
+    owner_headers, owner = register('unread')
+    room = client.post('/api/rooms/', json={'name': 'flush'}, headers=owner_headers).get_json()['room']
+    for _ in range(19):
+        headers, _ = register('unread')
+        client.post('/api/rooms/join', json={'room_id': room['id']}, headers=headers)
+    redis_client.client.flushdb()
+
+    with app_module.app.app_context():
+        unread_counters.on_room_message(room['id'], owner['id'])
+        with count_queries(db.engine) as statements:
+            assert unread_counters.flush() == 19
+    selects = [statement for statement in statements if statement.lstrip().upper().startswith('SELECT')]
+    assert len(selects) == 1, statements
+
+
+def test_stale_member_fill_keeps_joined_member(app_module, client, register):
+    from models.room import RoomMember
+    from utils.redis_client import redis_client
+
+    owner_headers, owner = register('unread')
+    room = client.post('/api/rooms/', json={'name': 'race'}, headers=owner_headers).get_json()['room']
+    redis_client.client.flushdb()
+
+    with app_module.app.app_context():
+        # 回填方读到版本号和旧成员列表后，另一个用户加入
+        version = redis_client.get_room_members_version(room['id'])
+        stale = [uid for (uid,) in RoomMember.query.with_entities(RoomMember.user_id).filter_by(room_id=room['id'])]
+    headers_b, user_b = register('unread')
+    client.post('/api/rooms/join', json={'room_id': room['id']}, headers=headers_b)
+
+    assert not redis_client.set_room_members(room['id'], stale, version)
+    assert sorted(redis_client.get_room_members(room['id'])) == sorted([owner['id'], user_b['id']])
+
+    # 集合已缓存时加入直接 SADD
+    headers_c, user_c = register('unread')
+    client.post('/api/rooms/join', json={'room_id': room['id']}, headers=headers_c)
+    assert user_c['id'] in redis_client.get_room_members(room['id'])
+
+
+def test_send_defers_fanout_when_members_not_cached(app_module, client, register):
+    from models import db
+    from conftest import count_queries
+    from utils.inbox import inbox
+    from utils.redis_client import redis_client
+
+    (owner_headers, owner), (headers_b, _) = register('unread'), register('unread')
+    room = client.post('/api/rooms/', json={'name': 'deferred'}, headers=owner_headers).get_json()['room']
+    client.post('/api/rooms/join', json={'room_id': room['id']}, headers=headers_b)
+    redis_client.client.delete(f"room:{room['id']}:members")
+
+    token = owner_headers['Authorization'][7:]
+    socket = app_module.sio.test_client(app_module.app, query_string=f'token={token}')
+    with app_module.app.app_context(), count_queries(db.engine) as statements:
+        socket.emit('send_message', {'room_id': room['id'], 'content': 'hello'})
+    socket.disconnect()
+    assert not [statement for statement in statements if 'room_members' in statement], statements
+    assert client.get('/api/unread/', headers=headers_b).get_json()['total'] == 0
+
+    with app_module.app.app_context():
+        assert inbox.process_deferred_fanouts() == 1
+    assert client.get('/api/unread/', headers=headers_b).get_json()['rooms'] == {str(room['id']): 1}
@@ -0,0 +1,34 @@
+"""用户搜索：trigram 候选分批校验直到凑够 limit 条，短关键词回落到子串扫描"""
+import itertools
+
+_suffixes = itertools.count(1)
+
+
+def _add_users(names):
+    from models import db
+    from models.user import User
+
+    users = [User(username=name, email=f'{name}@mail.test', password_hash='x') for name in names]
+    db.session.add_all(users)
+    db.session.commit()
+    return [u.id for u in users]
+
+
+def test_gram_false_positives_do_not_starve_results(app_module):
+    from models.user_search_gram import UserSearchGram
+
+    tag = next(_suffixes)
+    with app_module.app.app_context():
+        # 前 8 个用户包含 "qwvqwx" 的全部 gram（qwv / wvq / vqw / qwx）但不包含该子串
+        _add_users([f'p{tag}qwvqwqwxf{i}' for i in range(8)])
+        expected = _add_users([f'p{tag}zqwvqwxz{i}' for i in range(2)])
+        assert [u.id for u in UserSearchGram.search('qwvqwx', limit=2)] == expected
+
+
+def test_short_keyword_matches_substrings(app_module):
+    from models.user_search_gram import UserSearchGram
+
+    tag = next(_suffixes)
+    with app_module.app.app_context():
+        expected = _add_users([f's{tag}kj'])
+        assert [u.id for u in UserSearchGram.search('kj', limit=5)] == expected
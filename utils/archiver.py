@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+
+from config import SETTINGS
+from utils.redis_client import redis_client
+
+
+class MessageArchiver:
+    """
+    消息冷热分层：把超过 after_days 天的消息从 messages 分批移入 messages_archive，保持热表足够小
+
+    - 每批按 (created_at, id) 从早到晚取 batch_size 条早于截止时间的消息（created_at 索引上的范围扫描），
+      在同一事务内 INSERT ... SELECT 到归档表并删除，中断后重跑从剩余最早的消息继续（天然可恢复）
+    - 按时间而不是按 ID 选取：异步写入的消息 ID 与创建时间不严格同序，按时间搬迁才能保证归档表中的消息
+      在 (created_at, id) 上都早于热表，跨层读取（Message.keyset_page / Message.latest）依赖这一点
+    - ID 最大的消息始终留在热表，避免自增 ID 在热表清空后被重置复用
+    - 多个 worker 之间用锁保证同一时刻只有一个在归档，批次之间暂停 batch_pause 秒以限制对主库的压力
+    """
+
+    def __init__(self, enabled=False, after_days=180, batch_size=1000, interval=600, batch_pause=0.1, worker_id=None):
+        self.enabled = enabled
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.batch_pause = batch_pause
+        self.worker_id = worker_id
+        self._started = False
+        self.archived = 0
+        self.batches = 0
+        self.last_run_at = None
+
+    def cutoff(self):
+        return datetime.utcnow() - timedelta(days=self.after_days)
+
+    def archive_batch(self, cutoff, keep_id):
+        """归档一批，返回移动的消息数（需在 app_context 中调用）"""
+        from models import db
+        from models.message import Message
+        from models.message_archive import ArchivedMessage, mark_archive_in_use
+
+        ids = [message_id for (message_id,) in db.session.query(Message.id)
+               .filter(Message.created_at < cutoff, Message.id != keep_id)
+               .order_by(Message.created_at, Message.id)
+               .limit(self.batch_size)]
+        if not ids:
+            db.session.rollback()
+            return 0
+
+        hot = Message.__table__
+        archive = ArchivedMessage.__table__
+        columns = [column.name for column in archive.columns]
+        in_batch = hot.c.id.in_(ids)
+        # 先发布"归档表有数据"，再提交搬迁：其他 worker 不会在提交后仍只查热表而漏掉刚归档的消息
+        mark_archive_in_use()
+        try:
+            db.session.execute(archive.insert().from_select(
+                columns, hot.select().with_only_columns(*[hot.c[name] for name in columns]).where(in_batch)
+            ))
+            db.session.execute(hot.delete().where(in_batch))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        self.archived += len(ids)
+        self.batches += 1
+        return len(ids)
+
+    def run(self, sleep=None, max_batches=None):
+        """归档所有过期消息，返回本次移动的消息数；sleep 为批次间的暂停函数（后台任务中传入 sio.sleep）"""
+        from sqlalchemy import func
+        from models import db
+        from models.message import Message
+
+        cutoff = self.cutoff()
+        keep_id = db.session.query(func.max(Message.id)).scalar()
+        total = 0
+        batches = 0
+        while keep_id is not None and (max_batches is None or batches < max_batches):
+            moved = self.archive_batch(cutoff, keep_id)
+            if not moved:
+                break
+            total += moved
+            batches += 1
+            if sleep:
+                sleep(self.batch_pause)
+        db.session.remove()
+        self.last_run_at = datetime.utcnow().isoformat()
+        return total
+
+    def start(self, sio, app):
+        """启动定时归档后台任务（ARCHIVE 开启时每个 worker 调用一次，由锁保证单实例执行）"""
+        if not self.enabled or self._started:
+            return
+        self._started = True
+        sio.start_background_task(self._archive_loop, sio, app)
+
+    def _archive_loop(self, sio, app):
+        while True:
+            sio.sleep(self.interval)
+            try:
+                if not redis_client.acquire_lock('messages:archiver', self.worker_id, self.interval):
+                    continue
+                with app.app_context():
+                    moved = self.run(sleep=sio.sleep)
+                if moved:
+                    print(f'消息归档: 移入归档表 {moved} 条')
+            except Exception as e:
+                print(f'消息归档失败: {str(e)}')
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'after_days': self.after_days,
+            'archived': self.archived,
+            'batches': self.batches,
+            'last_run_at': self.last_run_at
+        }
+
+
+_archive_config = SETTINGS['archive']
+
+# 全局消息归档实例
+message_archiver = MessageArchiver(
+    enabled=_archive_config['enabled'],
+    after_days=_archive_config['after_days'],
+    batch_size=_archive_config['batch_size'],
+    interval=_archive_config['interval'],
+    batch_pause=_archive_config['batch_pause_ms'] / 1000,
+    worker_id=SETTINGS['socketio']['worker_id']
+)
@@ -0,0 +1,41 @@
+from sqlalchemy import func
+
+
+def bulk_upsert(session, model, rows, update_columns, chunk_size=1000, keep_max=()):
+    """
+    批量插入或更新：主键冲突时用新值覆盖 update_columns，每 chunk_size 行一条语句
+    MySQL 使用 INSERT ... ON DUPLICATE KEY UPDATE，SQLite / PostgreSQL 使用 ON CONFLICT DO UPDATE
+    keep_max 中的列取新旧值中较大者（单调递增的游标，避免乱序写入回退）
+    """
+    if not rows:
+        return 0
+    table = model.__table__
+    dialect = session.get_bind(mapper=model).dialect.name
+    # SQLite 的多参数 max() 即 GREATEST
+    greatest = func.max if dialect == 'sqlite' else func.greatest
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        if dialect == 'mysql':
+            from sqlalchemy.dialects.mysql import insert
+            stmt = insert(table).values(chunk)
+            new = stmt.inserted
+        elif dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            stmt = insert(table).values(chunk)
+            new = stmt.excluded
+        else:
+            raise NotImplementedError(f'bulk_upsert 不支持 {dialect}')
+        values = {name: new[name] for name in update_columns}
+        values.update({name: greatest(table.c[name], new[name]) for name in keep_max})
+        if dialect == 'mysql':
+            stmt = stmt.on_duplicate_key_update(values)
+        else:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[column.name for column in table.primary_key.columns],
+                set_=values
+            )
+        session.execute(stmt)
+    return len(rows)
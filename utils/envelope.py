@@ -0,0 +1,132 @@
+import json
+import os
+import re
+
+from flask import Response, stream_with_context
+
+# 可选的高性能 JSON 后端：安装了 orjson（>=3.9，支持 Fragment）时使用，否则使用标准库
+try:
+    import orjson
+    if not hasattr(orjson, 'Fragment'):
+        orjson = None
+except ImportError:
+    orjson = None
+
+
+class RawJSON:
+    """已经编码好的 JSON 片段，再次序列化时原样拼接，不做解码 / 重新编码"""
+
+    __slots__ = ('json',)
+
+    def __init__(self, json_text):
+        self.json = json_text
+
+    def __reduce__(self):
+        # 多 worker 时 emit 参数会经消息队列 pickle 传输
+        return RawJSON, (self.json,)
+
+    def __repr__(self):
+        return f'RawJSON({self.json[:80]!r})'
+
+
+# 标准库后端中 RawJSON 的占位符，带进程级随机串，避免与用户内容冲突
+_NONCE = os.urandom(4).hex()
+_PLACEHOLDER = re.compile(r'"\\u0000' + _NONCE + r':(\d+)\\u0000"')
+
+
+def _orjson_default(obj):
+    if isinstance(obj, RawJSON):
+        return orjson.Fragment(obj.json)
+    return str(obj)
+
+
+def dumps(obj):
+    """紧凑编码为 JSON 字符串，其中的 RawJSON 原样拼接"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    raws = []
+
+    def default(value):
+        if isinstance(value, RawJSON):
+            raws.append(value.json)
+            return f'\x00{_NONCE}:{len(raws) - 1}\x00'
+        return str(value)
+
+    text = json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':'))
+    if raws:
+        text = _PLACEHOLDER.sub(lambda m: raws[int(m.group(1))], text)
+    return text
+
+
+def loads(text):
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+class MessageEnvelope:
+    """
+    消息载荷：字典 + 只编码一次的 JSON
+    同一条消息的日志、Redis 缓存、Socket.IO 推送都复用 .json，不再各自序列化
+    """
+
+    __slots__ = ('data', '_json')
+
+    def __init__(self, data):
+        self.data = data
+        self._json = None
+
+    @property
+    def id(self):
+        return self.data['id']
+
+    @property
+    def json(self):
+        if self._json is None:
+            self._json = dumps(self.data)
+        return self._json
+
+    @property
+    def raw(self):
+        """供 emit / 响应拼接使用的 RawJSON"""
+        return RawJSON(self.json)
+
+
+class SocketIOJSON:
+    """传给 SocketIO(json=...) 的序列化模块：帧中的 RawJSON 直接拼接"""
+
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        return dumps(obj)
+
+    @staticmethod
+    def loads(text, *args, **kwargs):
+        return loads(text)
+
+
+def json_response(payload, status=200):
+    """返回 JSON 响应，payload 中的 RawJSON（如缓存中的消息）直接拼接进响应体"""
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
+
+def ndjson_response(rows, filename, flush_every=100):
+    """
+    流式返回 NDJSON（每行一条 JSON），rows 为可迭代的字典；
+    每 flush_every 行合并写出一次，响应期间保持请求上下文（数据库会话在流结束后才释放）
+    """
+    def generate():
+        buffer = []
+        for row in rows:
+            buffer.append(dumps(row))
+            if len(buffer) >= flush_every:
+                yield '\n'.join(buffer) + '\n'
+                buffer = []
+        if buffer:
+            yield '\n'.join(buffer) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        # 关闭反向代理缓冲，保证边查边发
+        'X-Accel-Buffering': 'no'
+    })
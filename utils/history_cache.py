@@ -0,0 +1,96 @@
+from config import SETTINGS
+from utils.envelope import RawJSON
+from utils.redis_client import redis_client
+
+
+class RoomHistoryCache:
+    """
+    房间历史消息缓存（读穿透 + 写穿透）
+
+    - 写：发送消息时追加到已预热的缓存窗口（见 RedisClient.cache_messages）
+    - 读：缓存覆盖请求窗口时直接返回；未预热或校验失败时从主库取最新 size 条回填后重读
+    - 校验：meta 中的 newest_id 必须与列表头部一致，否则视为损坏并重新回填
+    - 统计：进程内命中 / 未命中计数
+    命中时返回缓存中已编码的 JSON（RawJSON），由响应直接拼接，不做解码 / 重新编码。
+    """
+
+    # read_room_messages 返回的状态码
+    HIT = 1
+    NOT_WARMED = 0
+    INVALID = -1
+    OUT_OF_RANGE = -2
+
+    def __init__(self, size=200, ttl=3600):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.warms = 0
+
+    def append(self, room_id, messages):
+        """写穿透：追加新消息（按时间正序）"""
+        return redis_client.cache_messages(room_id, messages, limit=self.size, ttl=self.ttl)
+
+    def get_window(self, room_id, per_page, page=1, before_id=None, after_id=None):
+        """
+        读取一个消息窗口，返回 (按时间正序的 RawJSON 列表, 对应的消息 ID 列表, has_more)
+        缓存无法覆盖该窗口时返回 None，由调用方回落 MySQL
+        """
+        if before_id:
+            mode, value = 'before', before_id
+        elif after_id:
+            mode, value = 'after', after_id
+        else:
+            mode, value = 'offset', (page - 1) * per_page
+
+        # 超出缓存容量的翻页不走缓存
+        if mode == 'offset' and value + per_page > self.size:
+            self.misses += 1
+            return None
+
+        status, has_more, version, raw, ids = redis_client.read_room_messages(room_id, mode, value, per_page)
+        if status == self.HIT:
+            self.hits += 1
+        else:
+            self.misses += 1
+            if status in (self.NOT_WARMED, self.INVALID):
+                # 回填后重读一次；回填期间有并发写入时放弃，本次由 MySQL 兜底
+                if self.warm(room_id, version):
+                    status, has_more, version, raw, ids = redis_client.read_room_messages(room_id, mode, value, per_page)
+            if status != self.HIT:
+                return None
+
+        # Redis 是新->旧，这里反转为旧->新
+        messages = [RawJSON(item) for item in reversed(raw)]
+        ids.reverse()
+        return messages, ids, has_more
+
+    def warm(self, room_id, version):
+        """从主库读取最新 size 条消息回填缓存（热表不足时含归档表中的消息）"""
+        from models.message import Message
+        from utils.replicas import replica_router
+        # 只读请求中也走主库：从库落后时读到的窗口缺少最新消息，而版本号校验发现不了
+        with replica_router.primary():
+            rows = Message.latest({'room_id': room_id}, self.size)
+            messages = Message.serialize_many(rows)  # 新->旧
+        self.warms += 1
+        return redis_client.warm_room_messages(
+            room_id, version, messages, complete=len(messages) < self.size, ttl=self.ttl
+        )
+
+    def stats(self):
+        """命中统计"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'warms': self.warms,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0
+        }
+
+
+# 全局房间历史缓存实例
+room_history_cache = RoomHistoryCache(
+    size=SETTINGS['cache']['room_history_size'],
+    ttl=SETTINGS['cache']['room_history_ttl']
+)
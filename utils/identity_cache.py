@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+
+from config import SETTINGS
+
+
+class IdentityCache:
+    """
+    进程内 token -> 用户身份缓存（有界 LRU + TTL）
+
+    - token 层：token -> (user_id, 过期时间)，过期时间取 JWT exp 与 TTL 的较小值，
+      命中时连 JWT 解码都可以省掉
+    - 用户层：user_id -> 用户列快照，用户信息变更时按 user_id 失效
+    两层都命中才算命中，任一层缺失都回落到 JWT 解码 + 数据库查询。
+    """
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._tokens = OrderedDict()
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _evict(store, max_size):
+        while len(store) > max_size:
+            store.popitem(last=False)
+
+    def get(self, token):
+        """返回 (user_id, 用户快照)，未命中返回 None"""
+        now = time.time()
+        with self._lock:
+            entry = self._tokens.get(token)
+            if entry is not None:
+                user_id, expires_at = entry
+                if expires_at > now:
+                    snapshot = self._users.get(user_id)
+                    if snapshot is not None and snapshot[1] > now:
+                        self._tokens.move_to_end(token)
+                        self._users.move_to_end(user_id)
+                        self.hits += 1
+                        return user_id, snapshot[0]
+                else:
+                    del self._tokens[token]
+            self.misses += 1
+            return None
+
+    def put(self, token, user_id, token_exp, snapshot):
+        """写入缓存，token_exp 为 JWT 中的 exp 时间戳"""
+        now = time.time()
+        expires_at = min(token_exp, now + self.ttl)
+        if expires_at <= now:
+            return
+        with self._lock:
+            self._tokens[token] = (user_id, expires_at)
+            self._tokens.move_to_end(token)
+            self._users[user_id] = (snapshot, now + self.ttl)
+            self._users.move_to_end(user_id)
+            self._evict(self._tokens, self.max_size)
+            self._evict(self._users, self.max_size)
+
+    def invalidate_user(self, user_id):
+        """用户信息变更/删除时失效（token 层随之自然失效）"""
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+            self._users.clear()
+
+    def stats(self):
+        """命中统计"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            'tokens': len(self._tokens),
+            'users': len(self._users)
+        }
+
+
+# 全局身份缓存实例，与 redis_client 一样在模块导入时创建一次
+identity_cache = IdentityCache(
+    max_size=SETTINGS['jwt']['identity_cache_size'],
+    ttl=SETTINGS['jwt']['identity_cache_ttl']
+)
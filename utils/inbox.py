@@ -0,0 +1,289 @@
+import json
+import time
+from datetime import datetime
+
+from config import SETTINGS
+from utils.redis_client import redis_client
+from utils.unread import room_field, private_field, room_member_ids, unread_counters
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+# 没有消息的房间的预览占位：区分"房间还没有消息"和"预览已过期"，(0, 0) 会被任何真实消息覆盖
+EMPTY_PREVIEW = ('', 0, 0)
+
+
+def _millis(dt):
+    """naive UTC datetime -> 毫秒时间戳"""
+    return int((dt - _EPOCH).total_seconds() * 1000)
+
+
+class Inbox:
+    """
+    预计算的会话列表（收件箱）
+
+    - 每个用户一个 ZSet，成员为房间 / 私聊对方，分数为最后活跃时间；最后一条消息的预览按会话各存一个 Hash
+      （同会话成员共享，与会话列表同一 TTL），发送消息时更新（房间一次 Lua 调用扇出到全部成员，
+      每个成员的 key 都经 KEYS 传入）
+    - 列表接口按分数倒序分页读取 ZSet，再批量取预览、房间名和对方用户信息，不查询 messages 表
+    - Redis 中没有某个用户的列表（首次访问或过期）或预览已过期时，登记到 inbox:rebuild 由后台任务从 MySQL
+      重建，请求本身只返回已缓存的内容（rebuilding 为 true）；登录时也会提前登记。
+      重建只合并更新的值，与同时发生的发送不会互相覆盖
+    """
+
+    def __init__(self, size=500, ttl=604800, preview_length=100, rebuild_interval=0.5, rebuild_batch=100):
+        self.size = size
+        self.ttl = ttl
+        self.preview_length = preview_length
+        self.rebuild_interval = rebuild_interval
+        self.rebuild_batch = rebuild_batch
+        self._started = False
+        self.rebuilds = 0
+
+    def preview_of(self, message):
+        """消息字典 -> 预览 JSON"""
+        sender = message.get('sender') or {}
+        return json.dumps({
+            'message_id': message['id'],
+            'sender_id': message['sender_id'],
+            'sender_username': sender.get('username'),
+            'content': (message.get('content') or '')[:self.preview_length],
+            'message_type': message.get('message_type'),
+            'created_at': message.get('created_at')
+        }, ensure_ascii=False)
+
+    # =========================
+    # 更新
+    # =========================
+    def on_message(self, message, member_ids=None):
+        """
+        新消息：更新会话预览并把会话移到相关用户列表的最前（message 为消息字典，
+        member_ids 为调用方已取得的房间成员）
+        """
+        created_at = message.get('created_at')
+        score = _millis(datetime.fromisoformat(created_at)) if created_at else int(time.time() * 1000)
+        preview = self.preview_of(message)
+        room_id = message.get('room_id')
+        if room_id:
+            if member_ids is None:
+                member_ids = room_member_ids(room_id)
+            redis_client.touch_room_inbox(room_id, member_ids, score, self.ttl, self.size,
+                                          (room_field(room_id), message['id'], preview))
+        else:
+            from models.message import Message
+            sender_id, receiver_id = message['sender_id'], message['receiver_id']
+            field = f"c:{Message.make_conversation_key(sender_id, receiver_id)}"
+            redis_client.touch_private_inbox(sender_id, receiver_id, score, self.ttl, self.size,
+                                             (field, message['id'], preview))
+
+    def defer_room_fanout(self, envelope):
+        """房间成员集合未缓存：发送路径不查询 MySQL，扇出交给后台任务（回填成员后补做未读计数与会话列表）"""
+        redis_client.defer_room_fanout(envelope.json)
+
+    def process_deferred_fanouts(self):
+        """处理一批被推迟的房间消息扇出，返回处理条数（需在 app_context 中调用）"""
+        processed = 0
+        for raw in redis_client.pop_room_fanouts(self.rebuild_batch):
+            message = json.loads(raw)
+            try:
+                member_ids = room_member_ids(message['room_id'])
+                unread_counters.on_room_message(message['room_id'], message['sender_id'], member_ids)
+                self.on_message(message, member_ids)
+            except Exception:
+                # 失败的扇出放回队列，下一轮重试
+                redis_client.defer_room_fanout(raw)
+                raise
+            processed += 1
+        return processed
+
+    def on_join(self, user_id, room_id, new_room=False):
+        """加入 / 创建房间：房间立即出现在用户列表中（以加入时间排序，直到有新消息）；新建的房间写入空预览占位"""
+        if new_room:
+            self._set_empty_previews([room_id])
+        redis_client.merge_inbox([user_id], {room_field(room_id): int(time.time() * 1000)}, self.ttl, self.size)
+
+    def _set_empty_previews(self, room_ids, previews=None):
+        json_text, score, message_id = EMPTY_PREVIEW
+        previews = previews if previews is not None else []
+        previews.extend((room_field(room_id), score, message_id, json_text) for room_id in room_ids)
+        redis_client.set_inbox_previews(previews, self.ttl)
+
+    # =========================
+    # 重建
+    # =========================
+    @staticmethod
+    def _latest_ids(model, key_column, condition):
+        """每个会话按 (created_at, id) 最新的一条消息 ID：{会话: 消息ID}（号段分配的 ID 不保证与时间同序）"""
+        from sqlalchemy import func
+        from models import db
+
+        newest = db.session.query(key_column.label('conversation'), func.max(model.created_at).label('created_at'))\
+            .filter(condition).group_by(key_column).subquery()
+        rows = db.session.query(key_column, func.max(model.id))\
+            .join(newest, (key_column == newest.c.conversation) & (model.created_at == newest.c.created_at))\
+            .group_by(key_column)
+        return dict(rows.all())
+
+    def rebuild(self, user_id):
+        """从 MySQL 重建用户的会话列表与预览，返回会话数（需在 app_context 中调用）"""
+        from sqlalchemy import or_
+        from models import db
+        from models.room import RoomMember
+        from models.message import Message
+
+        joined = dict(db.session.query(RoomMember.room_id, RoomMember.joined_at).filter_by(user_id=user_id))
+        # 每个房间 / 私聊会话的最后一条消息 ID（热表优先，归档表补充只有冷数据的会话）
+        room_latest, private_latest = {}, {}
+        for model in Message.tiers():
+            if joined:
+                for room_id, message_id in self._latest_ids(model, model.room_id,
+                                                            model.room_id.in_(list(joined))).items():
+                    room_latest.setdefault(room_id, message_id)
+            private = self._latest_ids(model, model.conversation_key,
+                                       or_(model.sender_id == user_id, model.receiver_id == user_id)
+                                       & model.conversation_key.isnot(None))
+            for key, message_id in private.items():
+                private_latest.setdefault(key, message_id)
+
+        messages = Message.load_many(list(room_latest.values()) + list(private_latest.values()))
+        serialized = {m['id']: m for m in Message.serialize_many(list(messages.values()))}
+
+        scores, previews, empty_rooms = {}, [], []
+        for room_id, joined_at in joined.items():
+            message = messages.get(room_latest.get(room_id))
+            if message:
+                score = scores[room_field(room_id)] = _millis(message.created_at)
+                previews.append((room_field(room_id), score, message.id, self.preview_of(serialized[message.id])))
+            else:
+                scores[room_field(room_id)] = _millis(joined_at) if joined_at else 0
+                empty_rooms.append(room_id)
+        for key, message_id in private_latest.items():
+            message = messages.get(message_id)
+            if not message:
+                continue
+            a, b = (int(uid) for uid in key.split(':'))
+            score = scores[private_field(b if a == int(user_id) else a)] = _millis(message.created_at)
+            previews.append((f'c:{key}', score, message.id, self.preview_of(serialized[message.id])))
+
+        self._set_empty_previews(empty_rooms, previews)
+        if scores:
+            redis_client.merge_inbox([user_id], scores, self.ttl, self.size)
+        redis_client.mark_inbox_ready(user_id, self.ttl)
+        self.rebuilds += 1
+        return len(scores)
+
+    def ensure_ready(self, user_id):
+        """用户的会话列表尚未重建时登记后台重建（如登录时调用，首次打开会话列表前完成预热）"""
+        if not redis_client.is_inbox_ready(user_id):
+            redis_client.request_inbox_rebuild(user_id)
+
+    def process_rebuilds(self):
+        """重建一批已登记的用户，返回重建的用户数（需在 app_context 中调用）"""
+        from models import db
+
+        user_ids = redis_client.pop_inbox_rebuilds(self.rebuild_batch)
+        for index, user_id in enumerate(user_ids):
+            try:
+                self.rebuild(user_id)
+            except Exception:
+                db.session.rollback()
+                # 本批未完成的用户放回待重建集合，下一轮重试
+                for pending in user_ids[index:]:
+                    redis_client.request_inbox_rebuild(pending)
+                raise
+        return len(user_ids)
+
+    def start(self, sio, app):
+        """启动会话列表后台重建与推迟扇出任务（每个 worker 调用一次，SPOP / LPOP 保证同一项只被一个 worker 处理）"""
+        if self._started:
+            return
+        self._started = True
+        sio.start_background_task(self._rebuild_loop, sio, app)
+
+    def _rebuild_loop(self, sio, app):
+        while True:
+            sio.sleep(self.rebuild_interval)
+            try:
+                with app.app_context():
+                    while self.process_deferred_fanouts():
+                        sio.sleep(0)
+                    while self.process_rebuilds():
+                        sio.sleep(0)
+            except Exception as e:
+                print(f'会话列表重建失败: {str(e)}')
+
+    # =========================
+    # 读取
+    # =========================
+    def get_page(self, user_id, offset=0, limit=20):
+        """
+        按最后活跃时间倒序返回一页会话：
+        {'conversations': [...], 'total': n, 'has_more': bool, 'rebuilding': bool}，每项含会话对象、最后一条消息预览和未读数；
+        列表尚未重建或有预览已过期时只返回已缓存的内容并登记后台重建，rebuilding 为 true，客户端稍后重新拉取即可
+        """
+        from models.room import Room
+        from models.user import User
+        from models.message import Message
+
+        ready, total, entries, unread = redis_client.get_inbox_page(user_id, offset, limit)
+        unread = unread_counters.ensure_loaded(user_id, unread)
+
+        room_ids, peer_ids, preview_fields = [], [], []
+        for member, _ in entries:
+            kind, _, target = member.partition(':')
+            if kind == 'r':
+                room_ids.append(int(target))
+                preview_fields.append(member)
+            else:
+                peer_ids.append(int(target))
+                preview_fields.append(f'c:{Message.make_conversation_key(user_id, target)}')
+        previews = redis_client.get_inbox_previews(preview_fields)
+        # 预览已过期（长时间没有新消息的会话）同样需要重建；没有消息的房间有空预览占位，不算过期
+        rebuilding = not ready or any(preview is None for preview in previews)
+        if rebuilding:
+            redis_client.request_inbox_rebuild(user_id)
+        rooms = {room.id: room for room in Room.query.filter(Room.id.in_(room_ids))} if room_ids else {}
+        peers = {peer.id: peer for peer in User.query.filter(User.id.in_(peer_ids))} if peer_ids else {}
+
+        conversations = []
+        for (member, score), preview in zip(entries, previews):
+            kind, _, target = member.partition(':')
+            item = {
+                'type': 'room' if kind == 'r' else 'private',
+                'last_activity': int(score),
+                'last_message': json.loads(preview) if preview else None,
+                'unread': int(unread.get(member, 0))
+            }
+            if kind == 'r':
+                room = rooms.get(int(target))
+                if not room:
+                    continue
+                item['room'] = room.to_dict()
+            else:
+                peer = peers.get(int(target))
+                if not peer:
+                    continue
+                item['user'] = peer.to_dict()
+            conversations.append(item)
+
+        return {
+            'conversations': conversations,
+            'total': total,
+            'has_more': offset + len(entries) < total,
+            'rebuilding': rebuilding
+        }
+
+    def stats(self):
+        return {'rebuilds': self.rebuilds, 'size': self.size, 'pending_rebuilds': redis_client.count_inbox_rebuilds()}
+
+
+_inbox_config = SETTINGS['inbox']
+
+# 全局会话列表实例
+inbox = Inbox(
+    size=_inbox_config['size'],
+    ttl=_inbox_config['ttl'],
+    preview_length=_inbox_config['preview_length'],
+    rebuild_interval=_inbox_config['rebuild_interval'],
+    rebuild_batch=_inbox_config['rebuild_batch']
+)
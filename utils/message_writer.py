@@ -0,0 +1,246 @@
+import threading
+from datetime import datetime
+
+from eventlet.event import Event
+from eventlet.queue import LightQueue, Empty, Full
+
+from config import SETTINGS
+from utils.redis_client import redis_client
+
+
+class WriterBusy(Exception):
+    """写入队列已满（背压），发送方应稍后重试"""
+
+
+class _PendingWrite:
+    """队列中的一条待写消息：queued -> writing -> written，排队期间可被发送方取消"""
+
+    __slots__ = ('row', 'envelope', 'done', 'state')
+
+    QUEUED = 'queued'
+    WRITING = 'writing'
+    WRITTEN = 'written'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, row, envelope):
+        self.row = row
+        self.envelope = envelope
+        self.done = Event()
+        self.state = self.QUEUED
+
+
+class MessageWriter:
+    """
+    消息异步批量落库（group commit）
+
+    - ID：应用侧生成，每个 worker 从 Redis 一次领取一个号段，发送消息不再依赖数据库回填自增 ID
+    - 队列：有界队列，满了之后发送方最多等待 enqueue_timeout 秒，仍无空位则拒绝（背压）
+    - 落库：后台任务每 flush_interval 秒把队列中最多 batch_size 条消息合并为一条多行 INSERT，
+      一个批次只提交一次事务；批量失败时逐行重试，只让真正出错的消息失败
+    - 确认：发送方等待自己所在批次提交后才广播和确认，保证确认过的消息一定已落库；
+      等待超时时仍在排队的消息被取消（写入任务跳过），已被取出写入的消息则继续等待事务结果，
+      不会出现"报告失败但随后落库且未广播"的消息
+    - 缓存：批次提交后按入队顺序分房间/会话批量写穿透 Redis，缓存列表顺序与 ID 顺序一致
+    """
+
+    def __init__(self, enabled=False, queue_size=10000, batch_size=500, flush_interval=0.005,
+                 id_block=1000, enqueue_timeout=2, ack_timeout=10):
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.id_block = id_block
+        self.enqueue_timeout = enqueue_timeout
+        self.ack_timeout = ack_timeout
+        self._queue = LightQueue(queue_size)
+        self._next_id = 1
+        self._block_end = 0
+        self._id_lock = threading.Lock()
+        self._started = False
+        self.batches = 0
+        self.rows = 0
+        self.failed = 0
+        self.rejected = 0
+        self.cancelled = 0
+
+    @property
+    def active(self):
+        """已启动写入任务时才走异步落库，否则调用方使用同步写入"""
+        return self._started
+
+    def next_id(self):
+        """分配消息 ID（号段用完时向 Redis 领取新号段）"""
+        with self._id_lock:
+            # 加锁保证号段用完时只有一个发送方去 Redis 领取，其余等待后直接复用新号段
+            if self._next_id > self._block_end:
+                self._next_id, self._block_end = redis_client.allocate_id_block('messages', self.id_block)
+            message_id = self._next_id
+            self._next_id += 1
+            return message_id
+
+    def new_row(self, **fields):
+        """生成一行待写入的消息（补齐 ID、类型和创建时间），所有行的列保持一致以便合并为多行 INSERT"""
+        row = {
+            'id': self.next_id(),
+            'message_type': 'text',
+            'created_at': datetime.utcnow()
+        }
+        row.update(fields)
+        return row
+
+    def write(self, row, envelope):
+        """入队并等待所在批次提交；队列满或排队超时抛出异常（超时的消息不会再落库）"""
+        pending = _PendingWrite(row, envelope)
+        try:
+            self._queue.put(pending, timeout=self.enqueue_timeout)
+        except Full:
+            self.rejected += 1
+            raise WriterBusy('消息写入队列已满，请稍后重试')
+        if pending.done.wait(self.ack_timeout) is not None:
+            return
+        if pending.state == _PendingWrite.QUEUED:
+            # 仍在排队：取消后写入任务会跳过它，可以安全地报告失败
+            pending.state = _PendingWrite.CANCELLED
+            self.cancelled += 1
+            raise TimeoutError('消息落库超时')
+        # 已在写入中：事务结果确定后再返回，提交成功的消息照常广播
+        pending.done.wait()
+
+    def _take(self, block=True):
+        """从队列取出下一条未取消的消息并标记为写入中，非阻塞模式下队列为空时返回 None"""
+        while True:
+            try:
+                pending = self._queue.get() if block else self._queue.get_nowait()
+            except Empty:
+                return None
+            if pending.state == _PendingWrite.QUEUED:
+                pending.state = _PendingWrite.WRITING
+                return pending
+
+    def flush(self, batch):
+        """把一批 _PendingWrite 写入数据库、写穿透缓存并通知发送方"""
+        from models import db
+        from models.message import Message
+        from models.message_token import MessageToken
+
+        table = Message.__table__
+        written = []
+        self.batches += 1
+        try:
+            # 消息与全文索引在同一事务中提交
+            rows = [pending.row for pending in batch]
+            db.session.execute(table.insert().values(rows))
+            MessageToken.index_messages(rows)
+            db.session.commit()
+            for pending in batch:
+                pending.state = _PendingWrite.WRITTEN
+            written = batch
+        except Exception as e:
+            db.session.rollback()
+            print(f'批量写入消息失败，逐行重试: {str(e)}')
+            for pending in batch:
+                try:
+                    db.session.execute(table.insert().values(pending.row))
+                    MessageToken.index_messages([pending.row])
+                    db.session.commit()
+                    pending.state = _PendingWrite.WRITTEN
+                    written.append(pending)
+                except Exception as row_error:
+                    db.session.rollback()
+                    self.failed += 1
+                    pending.done.send_exception(row_error)
+        finally:
+            db.session.remove()
+
+        self.rows += len(written)
+        try:
+            self._write_through([pending.envelope for pending in written])
+        except Exception as e:
+            print(f'批量写穿透缓存失败: {str(e)}')
+        for pending in written:
+            pending.done.send(True)
+
+    @staticmethod
+    def _write_through(messages):
+        """按房间/私聊会话分组，每组一次批量写入 Redis（复用信封中已编码的 JSON）"""
+        from utils.history_cache import room_history_cache
+
+        rooms, conversations = {}, {}
+        for envelope in messages:
+            message = envelope.data
+            if message['room_id']:
+                rooms.setdefault(message['room_id'], []).append(envelope)
+            else:
+                key = tuple(sorted((int(message['sender_id']), int(message['receiver_id']))))
+                conversations.setdefault(key, []).append(envelope)
+        for room_id, room_messages in rooms.items():
+            room_history_cache.append(room_id, room_messages)
+        for (user_a_id, user_b_id), private_messages in conversations.items():
+            redis_client.cache_private_messages(user_a_id, user_b_id, private_messages)
+
+    def start(self, sio, app):
+        """与数据库中最大 ID 对齐号段序列并启动写入任务（每个 worker 调用一次）"""
+        if not self.enabled or self._started:
+            return
+        from sqlalchemy import func
+        from models import db
+        from models.message import Message
+
+        with app.app_context():
+            max_id = db.session.query(func.max(Message.id)).scalar() or 0
+            db.session.remove()
+        redis_client.ensure_id_floor('messages', max_id)
+        self._started = True
+        sio.start_background_task(self._writer_loop, sio, app)
+
+    def _writer_loop(self, sio, app):
+        while True:
+            batch = []
+            try:
+                batch.append(self._take())
+                # 等待一个很短的窗口，让同一时刻的消息合并进同一批次
+                sio.sleep(self.flush_interval)
+                while len(batch) < self.batch_size:
+                    pending = self._take(block=False)
+                    if pending is None:
+                        break
+                    batch.append(pending)
+                with app.app_context():
+                    self.flush(batch)
+            except Exception as e:
+                # 任何异常（如连接失效时 rollback 失败）都不能让写入任务退出，
+                # 本批次中尚未通知的发送方按实际结果收到确认或失败
+                print(f'消息写入任务异常: {str(e)}')
+                for pending in batch:
+                    if pending.done.ready():
+                        continue
+                    if pending.state == _PendingWrite.WRITTEN:
+                        pending.done.send(True)
+                    else:
+                        self.failed += 1
+                        pending.done.send_exception(e)
+                sio.sleep(self.flush_interval)
+
+    def stats(self):
+        """写入统计"""
+        return {
+            'enabled': self.active,
+            'queued': self._queue.qsize(),
+            'batches': self.batches,
+            'rows': self.rows,
+            'avg_batch_size': round(self.rows / self.batches, 2) if self.batches else 0.0,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'cancelled': self.cancelled
+        }
+
+
+# 全局消息写入实例
+message_writer = MessageWriter(
+    enabled=SETTINGS['message_writer']['enabled'],
+    queue_size=SETTINGS['message_writer']['queue_size'],
+    batch_size=SETTINGS['message_writer']['batch_size'],
+    flush_interval=SETTINGS['message_writer']['flush_interval_ms'] / 1000.0,
+    id_block=SETTINGS['message_writer']['id_block'],
+    enqueue_timeout=SETTINGS['message_writer']['enqueue_timeout'],
+    ack_timeout=SETTINGS['message_writer']['ack_timeout']
+)
@@ -0,0 +1,182 @@
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+from config import SETTINGS
+
+# 默认延迟分桶（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    """延迟直方图：固定分桶，每个标签组合只保存分桶计数、总和与次数"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # {标签值元组: [分桶计数列表, 总和, 次数]}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labelvalues, counts, total, count in sorted(snapshot):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, labelvalues, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, labelvalues, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{labels} {count}')
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Gauge:
+    """回调式仪表：抓取时才调用 fn 取值，平时没有任何开销"""
+
+    def __init__(self, name, documentation, fn):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        try:
+            value = self.fn()
+        except Exception:
+            return lines
+        if value is not None:
+            lines.append(f'{self.name} {value}')
+        return lines
+
+
+class Metrics:
+    """
+    进程内指标注册表（Prometheus 文本格式）
+
+    - Socket.IO 事件 / Flask 路由各一个延迟直方图
+    - SQLAlchemy 语句耗时与 Redis 命令耗时分开统计，另有数据库 / Redis 连接池取连接的等待耗时
+    - 连接数、房间数、队列长度等以回调式仪表在抓取时计算
+    记录一次耗时只有一次分桶查找和几次整数加法，可在生产环境常开。
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._metrics = []
+        self.socket_event_seconds = self.histogram(
+            'chat_socketio_event_seconds', 'Socket.IO 事件处理耗时', ('event',))
+        self.http_request_seconds = self.histogram(
+            'chat_http_request_seconds', 'HTTP 请求处理耗时', ('method', 'endpoint', 'status'))
+        self.db_query_seconds = self.histogram(
+            'chat_db_query_seconds', 'SQL 语句执行耗时', ('statement',))
+        self.redis_command_seconds = self.histogram(
+            'chat_redis_command_seconds', 'Redis 命令/管道执行耗时', ('command',))
+        self.pool_wait_seconds = self.histogram(
+            'chat_pool_wait_seconds', '从连接池取得连接的耗时（含排队等待）', ('pool',))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, documentation, fn):
+        metric = Gauge(name, documentation, fn)
+        self._metrics.append(metric)
+        return metric
+
+    def track_event(self, event):
+        """Socket.IO 事件处理函数计时装饰器（放在 @sio.on 下方）"""
+        def decorator(fn):
+            if not self.enabled:
+                return fn
+
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.socket_event_seconds.observe(time.perf_counter() - start, event)
+            return wrapper
+        return decorator
+
+    def init_app(self, app):
+        """为 Flask 路由计时（按路由规则而不是实际 URL 聚合，避免标签数量膨胀）"""
+        if not self.enabled:
+            return
+        from flask import g, request
+
+        @app.before_request
+        def _start_timer():
+            g._metrics_start = time.perf_counter()
+
+        @app.after_request
+        def _record_request(response):
+            start = g.pop('_metrics_start', None)
+            if start is not None:
+                endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+                self.http_request_seconds.observe(
+                    time.perf_counter() - start, request.method, endpoint, response.status_code)
+            return response
+
+    def instrument_sqlalchemy(self, engine_cls):
+        """监听游标执行事件统计 SQL 耗时（传入 Engine 类则对所有引擎生效）"""
+        if not self.enabled:
+            return
+        from sqlalchemy import event
+
+        @event.listens_for(engine_cls, 'before_cursor_execute')
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('_metrics_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine_cls, 'after_cursor_execute')
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            starts = conn.info.get('_metrics_start')
+            if starts:
+                kind = statement.lstrip().split(None, 1)[0].upper() if statement else ''
+                self.db_query_seconds.observe(time.perf_counter() - starts.pop(), kind)
+
+        @event.listens_for(engine_cls, 'handle_error')
+        def _error(context):
+            starts = context.connection.info.get('_metrics_start') if context.connection else None
+            if starts:
+                starts.pop()
+
+    def render(self):
+        """输出 Prometheus 文本格式"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# 全局指标实例
+metrics = Metrics(enabled=SETTINGS['metrics']['enabled'])
@@ -0,0 +1,145 @@
+import threading
+import time
+
+import redis
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+from utils.metrics import metrics
+
+
+class PoolStats:
+    """连接池取连接的等待统计：次数、总耗时、最大耗时、超时次数"""
+
+    def __init__(self, name):
+        self.name = name
+        self.acquired = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.acquired += 1
+            self.wait_total += seconds
+            if seconds > self.wait_max:
+                self.wait_max = seconds
+        if metrics.enabled:
+            metrics.pool_wait_seconds.observe(seconds, self.name)
+
+    def timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'acquired': self.acquired,
+                'timeouts': self.timeouts,
+                'wait_avg_ms': round(self.wait_total / self.acquired * 1000, 3) if self.acquired else 0.0,
+                'wait_max_ms': round(self.wait_max * 1000, 3)
+            }
+
+
+# 各连接池的等待统计 {名称: PoolStats}
+_stats = {}
+
+
+def get_pool_stats(name):
+    if name not in _stats:
+        _stats[name] = PoolStats(name)
+    return _stats[name]
+
+
+class TimedQueuePool(QueuePool):
+    """
+    统计取连接耗时的 SQLAlchemy 连接池（含排队等待、新建连接与 pre_ping 的时间）
+    通过 create_engine(poolclass=TimedQueuePool) 使用，watch_engine() 绑定统计名称
+    """
+
+    stats = None
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            if self.stats is not None:
+                self.stats.timeout()
+            raise
+        if self.stats is not None:
+            self.stats.observe(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        # dispose() 时会重建连接池，保留统计
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def watch_engine(engine, name):
+    """为引擎的连接池绑定等待统计（仅 TimedQueuePool 生效）"""
+    if isinstance(engine.pool, TimedQueuePool):
+        engine.pool.stats = get_pool_stats(name)
+
+
+def engine_pool_status(engine, name):
+    """SQLAlchemy 连接池状态：使用中 / 空闲 / 溢出连接数与等待统计"""
+    pool = engine.pool
+    status = {'class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'max_overflow': pool._max_overflow,
+            'checked_out': pool.checkedout(),
+            'idle': pool.checkedin(),
+            # overflow() 以 -size 为起点计数，正数部分才是超出 size 的连接
+            'overflow': max(0, pool.overflow())
+        })
+    if name in _stats:
+        status['wait'] = _stats[name].snapshot()
+    return status
+
+
+class TimedBlockingConnectionPool(redis.BlockingConnectionPool):
+    """
+    统计取连接耗时的 Redis 阻塞式连接池：连接用满时排队等待 timeout 秒而不是直接报错
+    """
+
+    def __init__(self, *args, stats_name='redis', **kwargs):
+        self.stats = get_pool_stats(stats_name)
+        super().__init__(*args, **kwargs)
+
+    def reset(self):
+        super().reset()
+        self._checked_out = set()
+
+    def get_connection(self, command_name, *keys, **options):
+        start = time.perf_counter()
+        try:
+            connection = super().get_connection(command_name, *keys, **options)
+        except redis.ConnectionError as e:
+            if str(e) == 'No connection available.':
+                self.stats.timeout()
+            raise
+        self._checked_out.add(id(connection))
+        self.stats.observe(time.perf_counter() - start)
+        return connection
+
+    def release(self, connection):
+        self._checked_out.discard(id(connection))
+        super().release(connection)
+
+    def status(self):
+        created = len(self._connections)
+        checked_out = len(self._checked_out)
+        return {
+            'class': type(self).__name__,
+            'max_connections': self.max_connections,
+            'created': created,
+            'checked_out': checked_out,
+            'idle': created - checked_out,
+            'wait': self.stats.snapshot()
+        }
@@ -0,0 +1,184 @@
+import time
+
+from config import SETTINGS
+from utils.redis_client import redis_client
+from utils.socket_session import socket_sessions, user_room
+
+
+class PresenceTracker:
+    """
+    在线状态管理（多端在线 + 心跳 + 过期清理）
+
+    - 连接/断开：维护用户的连接集合，第一个连接上线、最后一个连接断开才算上/下线
+    - 心跳：Engine.IO 的 ping/pong 会断开失联的连接，仍在本进程会话表中的连接即为存活连接，
+      每个心跳周期用一次 Redis 调用批量刷新本 worker 全部连接的时间戳
+    - 清理：后台任务分批移除心跳超过 ttl 的连接（worker 崩溃后遗留的记录），
+      多个 worker 之间用锁保证同一时刻只有一个在清理
+    - 广播：上/下线变化先暂存，每 broadcast_interval 秒合并为一批，
+      只发给好友和同房间成员中在线的用户（presence_diff 事件），而不是广播给所有连接
+    """
+
+    def __init__(self, worker_id, ttl=120, heartbeat_interval=25, sweep_interval=30, sweep_batch=500,
+                 broadcast_interval=0.25):
+        self.worker_id = worker_id
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        self.broadcast_interval = broadcast_interval
+        self._started = False
+        # 待广播的状态变化 {user_id: 用户快照（上线）或 None（下线）}，同一用户只保留最后状态
+        self._pending = {}
+
+    @property
+    def worker_ttl(self):
+        # worker 连接集合的过期时间：连续错过多次心跳即视为 worker 已消失
+        return self.ttl * 3
+
+    def connect(self, user_id, socket_id):
+        """登记连接，返回 True 表示用户刚上线"""
+        return redis_client.presence_connect(self.worker_id, socket_id, user_id, time.time(), self.worker_ttl)
+
+    def disconnect(self, user_id, socket_id):
+        """注销连接，返回 True 表示用户已离线"""
+        return redis_client.presence_disconnect(self.worker_id, socket_id, user_id)
+
+    def notify_online(self, user):
+        """记录上线变化，user 为 User.to_dict() 快照"""
+        self._pending[user['id']] = user
+
+    def notify_offline(self, user_id):
+        """记录下线变化"""
+        self._pending[int(user_id)] = None
+
+    def pending_count(self):
+        return len(self._pending)
+
+    def _audience(self, user_ids):
+        """
+        计算状态变化的接收者：好友 + 同房间成员
+        返回 {接收者ID: 与其相关的变化用户ID集合}，两次查询覆盖整批变化
+        """
+        from sqlalchemy.orm import aliased
+        from models import db
+        from models.friend import Friend
+        from models.room import RoomMember
+
+        audience = {}
+
+        def add(changed_id, peer_id):
+            if changed_id != peer_id:
+                audience.setdefault(peer_id, set()).add(changed_id)
+
+        friend_rows = db.session.query(Friend.user_id, Friend.friend_id).filter(
+            Friend.status == 'accepted',
+            (Friend.user_id.in_(user_ids)) | (Friend.friend_id.in_(user_ids))
+        ).all()
+        for a, b in friend_rows:
+            if a in user_ids:
+                add(a, b)
+            if b in user_ids:
+                add(b, a)
+
+        peer = aliased(RoomMember)
+        member_rows = db.session.query(RoomMember.user_id, peer.user_id)\
+            .join(peer, peer.room_id == RoomMember.room_id)\
+            .filter(RoomMember.user_id.in_(user_ids))\
+            .distinct()\
+            .all()
+        for changed_id, peer_id in member_rows:
+            add(changed_id, peer_id)
+
+        db.session.remove()
+        return audience
+
+    def flush_broadcasts(self, sio):
+        """把暂存的状态变化合并成 presence_diff 发给相关的在线用户，返回发送的帧数"""
+        if not self._pending:
+            return 0
+        changes, self._pending = self._pending, {}
+
+        audience = self._audience(list(changes.keys()))
+        if not audience:
+            return 0
+        online_peers = redis_client.filter_online_users(list(audience.keys()))
+
+        for peer_id in online_peers:
+            diff = {'online': [], 'offline': []}
+            for changed_id in audience[peer_id]:
+                user = changes[changed_id]
+                if user is None:
+                    diff['offline'].append(changed_id)
+                else:
+                    diff['online'].append(user)
+            sio.emit('presence_diff', diff, room=user_room(peer_id))
+        return len(online_peers)
+
+    def heartbeat_once(self):
+        """刷新本 worker 全部连接的心跳"""
+        sockets = socket_sessions.items()
+        if sockets:
+            redis_client.presence_heartbeat(self.worker_id, sockets, time.time(), self.worker_ttl)
+        return len(sockets)
+
+    def sweep_once(self):
+        """分批清理过期连接，返回离线的用户ID列表"""
+        cutoff = time.time() - self.ttl
+        offline = []
+        while True:
+            processed, batch_offline = redis_client.presence_sweep(cutoff, self.sweep_batch)
+            offline.extend(batch_offline)
+            if processed < self.sweep_batch:
+                break
+        return offline
+
+    def start(self, sio, app):
+        """启动心跳、清理与广播后台任务（每个 worker 调用一次）"""
+        if self._started:
+            return
+        self._started = True
+        sio.start_background_task(self._heartbeat_loop, sio)
+        sio.start_background_task(self._sweep_loop, sio)
+        sio.start_background_task(self._broadcast_loop, sio, app)
+
+    def _broadcast_loop(self, sio, app):
+        while True:
+            sio.sleep(self.broadcast_interval)
+            try:
+                with app.app_context():
+                    self.flush_broadcasts(sio)
+            except Exception as e:
+                print(f'在线状态广播失败: {str(e)}')
+
+    def _heartbeat_loop(self, sio):
+        while True:
+            sio.sleep(self.heartbeat_interval)
+            try:
+                self.heartbeat_once()
+            except Exception as e:
+                print(f'在线心跳刷新失败: {str(e)}')
+
+    def _sweep_loop(self, sio):
+        while True:
+            sio.sleep(self.sweep_interval)
+            try:
+                if not redis_client.acquire_lock('presence:sweeper', self.worker_id, self.sweep_interval):
+                    continue
+                offline = self.sweep_once()
+                if offline:
+                    print(f'清理过期在线记录: {len(offline)} 个用户离线')
+                    for user_id in offline:
+                        self.notify_offline(user_id)
+            except Exception as e:
+                print(f'在线状态清理失败: {str(e)}')
+
+
+# 全局在线状态管理实例
+presence = PresenceTracker(
+    worker_id=SETTINGS['socketio']['worker_id'],
+    ttl=SETTINGS['presence']['ttl'],
+    heartbeat_interval=SETTINGS['presence']['heartbeat_interval'],
+    sweep_interval=SETTINGS['presence']['sweep_interval'],
+    sweep_batch=SETTINGS['presence']['sweep_batch'],
+    broadcast_interval=SETTINGS['presence']['broadcast_interval_ms'] / 1000.0
+)
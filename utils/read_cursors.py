@@ -0,0 +1,223 @@
+from datetime import datetime
+
+from config import SETTINGS
+from utils.redis_client import redis_client
+from utils.socket_session import user_room
+from utils.unread import room_field, private_field
+
+# messages.id 为 INT，超出范围的确认一定无效
+MAX_MESSAGE_ID = 2 ** 31 - 1
+
+
+class ReadCursors:
+    """
+    已读游标（已读回执）
+
+    - 推进：客户端确认的消息 ID 必须是该会话中的消息（一次主键查询），之后只在 Redis 中把游标推进到
+      更大的消息 ID（Lua 原子比较），同一会话的频繁确认合并为一个值，不产生数据库写入
+    - 持久化：后台任务每 flush_interval 秒取出一批有推进的用户，群聊游标以一条 executemany UPDATE
+      写入 room_members.last_read_message_id，私聊游标批量 upsert 到 private_read_cursors，数据库中只增不减；
+      批量写入失败时逐个用户重试，只丢弃单独写入仍失败的用户，不让一个坏游标拖住之后的每一轮
+    - 回执：推进后的游标暂存在本进程，每 receipt_interval 秒把每个会话每个用户的最新值合并成一条
+      read_receipt 推送给会话其他成员
+    """
+
+    def __init__(self, ttl=604800, flush_interval=5, flush_batch=500, receipt_interval=1.0):
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.receipt_interval = receipt_interval
+        self._pending = {}
+        self._started = False
+        self.acks = 0
+        self.advanced = 0
+        self.flushes = 0
+        self.persisted = 0
+        self.receipts_sent = 0
+
+    # =========================
+    # 推进
+    # =========================
+    def advance(self, user_id, message_id, room_id=None, peer_id=None):
+        """
+        推进已读游标，返回是否推进（不比当前游标新的确认直接丢弃，不查询数据库）
+        会推进游标的 message_id 不是该会话中的消息时抛出 ValueError（需在 app_context 中调用）
+        """
+        from models.message import Message
+
+        self.acks += 1
+        try:
+            message_id = int(message_id)
+        except (TypeError, ValueError):
+            raise ValueError('消息ID无效')
+        scope = {'room_id': int(room_id)} if room_id else \
+            {'conversation_key': Message.make_conversation_key(user_id, peer_id)}
+        if not 0 < message_id <= MAX_MESSAGE_ID:
+            raise ValueError('消息不属于该会话')
+        field = room_field(room_id) if room_id else private_field(peer_id)
+        # 先和 Redis 中的游标比较：不会推进的确认（重复 / 乱序）直接丢弃，只有会推进时才查库校验消息归属
+        current = redis_client.get_read_cursor(user_id, field)
+        if current is not None and message_id <= current:
+            return False
+        if Message.anchor_time(scope, message_id) is None:
+            raise ValueError('消息不属于该会话')
+        if not redis_client.advance_read_cursor(user_id, field, message_id, self.ttl):
+            return False
+        self.advanced += 1
+        self._pending[(field, int(user_id))] = int(message_id)
+        return True
+
+    def pending_count(self):
+        return len(self._pending)
+
+    def flush_receipts(self, sio):
+        """把暂存的游标推进合并成 read_receipt 推送出去，返回发送的帧数"""
+        if not self._pending:
+            return 0
+        receipts, self._pending = self._pending, {}
+        for (field, user_id), message_id in receipts.items():
+            kind, _, target = field.partition(':')
+            if kind == 'r':
+                sio.emit('read_receipt', {'room_id': int(target), 'user_id': user_id, 'message_id': message_id},
+                         room=str(target))
+            else:
+                sio.emit('read_receipt', {'user_id': user_id, 'message_id': message_id},
+                         room=user_room(target))
+        self.receipts_sent += len(receipts)
+        return len(receipts)
+
+    # =========================
+    # 读取
+    # =========================
+    def room_cursors(self, room_id):
+        """房间全部成员的已读游标 {user_id: message_id}（Redis 中尚未写回的值优先）"""
+        from models.room import RoomMember
+        cursors = dict(RoomMember.query.with_entities(RoomMember.user_id, RoomMember.last_read_message_id)
+                       .filter_by(room_id=room_id))
+        user_ids = list(cursors)
+        for user_id, cached in zip(user_ids, redis_client.get_read_cursor_many(user_ids, room_field(room_id))):
+            if cached is not None:
+                cursors[user_id] = max(cursors[user_id] or 0, cached)
+        return cursors
+
+    def private_cursor(self, user_id, peer_id):
+        """user_id 在与 peer_id 的私聊中已读到的消息 ID"""
+        from models.read_cursor import PrivateReadCursor
+        row = PrivateReadCursor.query.get((user_id, peer_id))
+        cached = redis_client.get_read_cursor_many([user_id], private_field(peer_id))[0]
+        return max(row.last_read_message_id if row else 0, cached or 0)
+
+    # =========================
+    # 批量持久化
+    # =========================
+    def flush(self):
+        """把一批用户的已读游标写回 MySQL，返回写入的游标数（需在 app_context 中调用）"""
+        user_ids = redis_client.pop_read_dirty(self.flush_batch)
+        if not user_ids:
+            return 0
+        now = datetime.utcnow()
+        rows = {}  # {user_id: (群聊游标行, 私聊游标行)}
+        for user_id, cursors in zip(user_ids, redis_client.get_read_cursors_many(user_ids)):
+            room_rows, private_rows = rows.setdefault(user_id, ([], []))
+            for field, message_id in cursors.items():
+                kind, _, target = field.partition(':')
+                if kind == 'r':
+                    room_rows.append({'b_room_id': int(target), 'b_user_id': user_id, 'b_message_id': int(message_id)})
+                else:
+                    private_rows.append({'user_id': user_id, 'peer_id': int(target),
+                                         'last_read_message_id': int(message_id), 'updated_at': now})
+        try:
+            written = self._write([row for room_rows, _ in rows.values() for row in room_rows],
+                                  [row for _, private_rows in rows.values() for row in private_rows])
+        except Exception as e:
+            print(f'批量写回已读游标失败，逐个用户重试: {str(e)}')
+            written, failed = 0, []
+            for user_id, (room_rows, private_rows) in rows.items():
+                try:
+                    written += self._write(room_rows, private_rows)
+                except Exception as row_error:
+                    failed.append(user_id)
+                    print(f'写回用户 {user_id} 的已读游标失败，已丢弃: {str(row_error)}')
+            if len(failed) == len(rows):
+                # 全部失败更可能是数据库不可用：放回待写集合，下一轮重试
+                redis_client.mark_read_dirty(user_ids)
+                raise
+        self.flushes += 1
+        self.persisted += written
+        return written
+
+    @staticmethod
+    def _write(room_rows, private_rows):
+        """在一个事务中写入游标行，失败时回滚并抛出，返回写入的游标数"""
+        from sqlalchemy import bindparam
+        from models import db
+        from models.room import RoomMember
+        from models.read_cursor import PrivateReadCursor
+        from utils.bulk import bulk_upsert
+
+        try:
+            if room_rows:
+                members = RoomMember.__table__
+                # 只更新已有的成员记录，且游标只前进
+                db.session.execute(
+                    members.update()
+                    .where(members.c.room_id == bindparam('b_room_id'),
+                           members.c.user_id == bindparam('b_user_id'),
+                           members.c.last_read_message_id < bindparam('b_message_id'))
+                    .values(last_read_message_id=bindparam('b_message_id')),
+                    room_rows
+                )
+            bulk_upsert(db.session, PrivateReadCursor, private_rows, ('updated_at',),
+                        keep_max=('last_read_message_id',))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return len(room_rows) + len(private_rows)
+
+    def start(self, sio, app):
+        """启动回执合并推送与游标批量写回后台任务（每个 worker 调用一次）"""
+        if self._started:
+            return
+        self._started = True
+        sio.start_background_task(self._receipt_loop, sio)
+        sio.start_background_task(self._flush_loop, sio, app)
+
+    def _receipt_loop(self, sio):
+        while True:
+            sio.sleep(self.receipt_interval)
+            try:
+                self.flush_receipts(sio)
+            except Exception as e:
+                print(f'已读回执推送失败: {str(e)}')
+
+    def _flush_loop(self, sio, app):
+        while True:
+            sio.sleep(self.flush_interval)
+            try:
+                with app.app_context():
+                    while self.flush() and redis_client.count_read_dirty():
+                        sio.sleep(0)
+            except Exception as e:
+                print(f'已读游标写回失败: {str(e)}')
+
+    def stats(self):
+        return {
+            'acks': self.acks,
+            'advanced': self.advanced,
+            'receipts_sent': self.receipts_sent,
+            'flushes': self.flushes,
+            'persisted_cursors': self.persisted,
+            'pending_users': redis_client.count_read_dirty()
+        }
+
+
+_read_config = SETTINGS['read_receipts']
+
+# 全局已读游标实例
+read_cursors = ReadCursors(
+    ttl=_read_config['ttl'],
+    flush_interval=_read_config['flush_interval'],
+    flush_batch=_read_config['flush_batch'],
+    receipt_interval=_read_config['receipt_interval_ms'] / 1000
+)
@@ -1,5 +1,38 @@
 import redis
 import os
+import time
+
+from redis.client import Pipeline
+
+from config import SETTINGS
+from utils.envelope import MessageEnvelope, RawJSON, dumps as encode_json, loads
+from utils.metrics import metrics
+from utils.pools import TimedBlockingConnectionPool
+
+
+class InstrumentedPipeline(Pipeline):
+    """统计整个管道往返耗时的 Pipeline"""
+
+    def execute(self, raise_on_error=True):
+        start = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            metrics.redis_command_seconds.observe(time.perf_counter() - start, 'PIPELINE')
+
+
+class InstrumentedRedis(redis.Redis):
+    """按命令名统计耗时的 Redis 客户端（Lua 脚本归入 EVALSHA）"""
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            metrics.redis_command_seconds.observe(time.perf_counter() - start, args[0])
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
 
 
 class RedisClient:
@@ -24,14 +57,25 @@ class RedisClient:
             # 注意，MySQL 是通过数据库名字区分“库”，而不是编号。而 Redis 的逻辑数据库通过编号区分。
             redis_db = int(os.environ.get('REDIS_DB', 0))
             redis_password = os.environ.get('REDIS_PASSWORD', None)
-            # 创建 Redis 客户端实例（使用上面获取的端口和密码）
-            self._redis_client = redis.Redis(
+            # 创建 Redis 客户端实例（使用上面获取的端口和密码），开启指标时按命令统计耗时
+            pool_config = SETTINGS['redis']['pool']
+            connection_pool = TimedBlockingConnectionPool(
                 host=redis_host,
                 port=redis_port,
                 db=redis_db,
                 password=redis_password,
-                decode_responses=True
+                decode_responses=True,
+                max_connections=pool_config['max_connections'],
+                timeout=pool_config['timeout'],
+                socket_timeout=pool_config['socket_timeout'],
+                socket_connect_timeout=pool_config['socket_connect_timeout'],
+                socket_keepalive=True,
+                health_check_interval=pool_config['health_check_interval']
             )
+            client_cls = InstrumentedRedis if metrics.enabled else redis.Redis
+            self._redis_client = client_cls(connection_pool=connection_pool)
+            # 已注册的 Lua 脚本 {名称: Script}
+            self._scripts = {}
 
     # 简单概括：@property 用于把方法变为属性，可用 obj.client 而不是 obj.client() 调用，更简洁。
     @property
@@ -39,49 +83,506 @@ class RedisClient:
         """获取 Redis 客户端实例"""
         return self._redis_client
 
+    def pool_status(self):
+        """连接池状态：已创建 / 使用中 / 空闲连接数与取连接等待统计"""
+        return self._redis_client.connection_pool.status()
+
     # =========================
-    # 在线状态 / socket 映射
+    # 在线状态 / socket 映射（多端在线 + 心跳）
     # =========================
-    def set_user_online(self, user_id, socket_id):
-        """设置用户在线状态"""
-        key = f"user:{user_id}:online"
-        self._redis_client.setex(key, 300, socket_id)  # 5分钟过期
-        self._redis_client.sadd("online_users", user_id)
+    # socket:connections      Hash  socket_id -> user_id（跨 worker 共享的连接表）
+    # worker:{id}:sockets     Set   该 worker 上的连接，随心跳续期，worker 消失后自动过期
+    # user:{id}:sockets       Set   用户的全部连接（多标签页/多设备）
+    # presence:sockets        ZSet  socket_id -> 最近心跳时间
+    # presence:users          ZSet  user_id -> 最近心跳时间，ZCARD 即在线人数（O(1)）
+    # 心跳过期的连接由后台清理任务分批移除，见 utils/presence.py
+
+    _PRESENCE_CONNECT_LUA = """
+    local was_online = redis.call('ZSCORE', KEYS[5], ARGV[2])
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+    redis.call('SADD', KEYS[2], ARGV[1])
+    redis.call('EXPIRE', KEYS[2], ARGV[4])
+    redis.call('SADD', KEYS[3], ARGV[1])
+    redis.call('ZADD', KEYS[4], ARGV[3], ARGV[1])
+    redis.call('ZADD', KEYS[5], ARGV[3], ARGV[2])
+    if was_online then
+        return 0
+    end
+    return 1
+    """
+
+    _PRESENCE_DISCONNECT_LUA = """
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    redis.call('SREM', KEYS[2], ARGV[1])
+    redis.call('SREM', KEYS[3], ARGV[1])
+    redis.call('ZREM', KEYS[4], ARGV[1])
+    if redis.call('SCARD', KEYS[3]) == 0 and redis.call('ZREM', KEYS[5], ARGV[2]) == 1 then
+        return 1
+    end
+    return 0
+    """
+
+    # 心跳：刷新本 worker 所有连接的时间戳；被误清理的连接会被重新登记
+    # KEYS[5..] 为各连接所属用户的连接集合，与 ARGV 中的 (socket_id, user_id) 一一对应
+    _PRESENCE_HEARTBEAT_LUA = """
+    local now = ARGV[1]
+    for i = 3, #ARGV, 2 do
+        local sid, uid = ARGV[i], ARGV[i + 1]
+        redis.call('HSET', KEYS[1], sid, uid)
+        redis.call('SADD', KEYS[2], sid)
+        redis.call('SADD', KEYS[5 + (i - 3) / 2], sid)
+        redis.call('ZADD', KEYS[3], now, sid)
+        redis.call('ZADD', KEYS[4], now, uid)
+    end
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+    return 1
+    """
+
+    # 清理一批心跳过期的连接与用户（候选由客户端先读出，脚本内重新校验心跳时间），返回因此离线的用户ID列表
+    # ARGV: cutoff, 连接数 n, n 组 (socket_id, user_id, 连接集合在 KEYS 中的下标，0 表示没有登记用户),
+    #       之后为若干组 (user_id, 连接集合下标)
+    _PRESENCE_SWEEP_LUA = """
+    local cutoff = tonumber(ARGV[1])
+    local n = tonumber(ARGV[2])
+    local offline = {}
+    for i = 3, 2 + n * 3, 3 do
+        local sid, uid, k = ARGV[i], ARGV[i + 1], tonumber(ARGV[i + 2])
+        local score = redis.call('ZSCORE', KEYS[2], sid)
+        if score and tonumber(score) <= cutoff then
+            redis.call('ZREM', KEYS[2], sid)
+            redis.call('HDEL', KEYS[1], sid)
+            if k > 0 then
+                redis.call('SREM', KEYS[k], sid)
+                if redis.call('SCARD', KEYS[k]) == 0 and redis.call('ZREM', KEYS[3], uid) == 1 then
+                    offline[#offline + 1] = uid
+                end
+            end
+        end
+    end
+    for i = 3 + n * 3, #ARGV, 2 do
+        local uid, k = ARGV[i], tonumber(ARGV[i + 1])
+        local score = redis.call('ZSCORE', KEYS[3], uid)
+        if score and tonumber(score) <= cutoff and redis.call('SCARD', KEYS[k]) == 0 then
+            redis.call('ZREM', KEYS[3], uid)
+            offline[#offline + 1] = uid
+        end
+    end
+    return offline
+    """
+
+    def presence_connect(self, worker_id, socket_id, user_id, now, worker_ttl=300):
+        """登记连接，返回 True 表示用户由离线变为在线"""
+        return bool(self._script('_PRESENCE_CONNECT_LUA')(
+            keys=["socket:connections", f"worker:{worker_id}:sockets", f"user:{user_id}:sockets",
+                  "presence:sockets", "presence:users"],
+            args=[socket_id, user_id, now, worker_ttl]
+        ))
+
+    def presence_disconnect(self, worker_id, socket_id, user_id):
+        """注销连接，返回 True 表示用户的最后一个连接已断开（变为离线）"""
+        return bool(self._script('_PRESENCE_DISCONNECT_LUA')(
+            keys=["socket:connections", f"worker:{worker_id}:sockets", f"user:{user_id}:sockets",
+                  "presence:sockets", "presence:users"],
+            args=[socket_id, user_id]
+        ))
+
+    def presence_heartbeat(self, worker_id, sockets, now, worker_ttl=300):
+        """批量刷新心跳，sockets 为 [(socket_id, user_id)]，单次往返"""
+        keys = ["socket:connections", f"worker:{worker_id}:sockets", "presence:sockets", "presence:users"]
+        args = [now, worker_ttl]
+        for socket_id, user_id in sockets:
+            keys.append(f"user:{user_id}:sockets")
+            args.extend([socket_id, user_id])
+        self._script('_PRESENCE_HEARTBEAT_LUA')(keys=keys, args=args)
+
+    def presence_sweep(self, cutoff, batch=500):
+        """清理一批心跳早于 cutoff 的连接，返回 (处理数, 离线用户ID列表)"""
+        pipe = self._redis_client.pipeline(transaction=False)
+        pipe.zrangebyscore("presence:sockets", '-inf', cutoff, start=0, num=batch)
+        pipe.zrangebyscore("presence:users", '-inf', cutoff, start=0, num=batch)
+        stale, users = pipe.execute()
+        if not stale and not users:
+            return 0, []
+        owners = self._redis_client.hmget("socket:connections", stale) if stale else []
 
-    def set_user_offline(self, user_id):
-        """设置用户离线状态"""
-        key = f"user:{user_id}:online"
+        keys = ["socket:connections", "presence:sockets", "presence:users"]
+        key_index = {}
+
+        def sockets_key(user_id):
+            if user_id not in key_index:
+                keys.append(f"user:{user_id}:sockets")
+                key_index[user_id] = len(keys)
+            return key_index[user_id]
+
+        args = [cutoff, len(stale)]
+        for socket_id, user_id in zip(stale, owners):
+            args.extend([socket_id, user_id or '', sockets_key(user_id) if user_id else 0])
+        for user_id in users:
+            args.extend([user_id, sockets_key(user_id)])
+        offline = self._script('_PRESENCE_SWEEP_LUA')(keys=keys, args=args)
+        return len(stale), [int(uid) for uid in offline]
+
+    def acquire_lock(self, name, owner, ttl):
+        """简单的互斥锁（SET NX EX），用于多 worker 间只让一个执行后台任务"""
+        return bool(self._redis_client.set(f"lock:{name}", owner, nx=True, ex=ttl))
+
+    def clear_worker_sockets(self, worker_id):
+        """
+        清理某个 worker 遗留的连接记录（worker 崩溃/重启后调用）
+        返回因此离线的用户ID列表
+        """
+        key = f"worker:{worker_id}:sockets"
+        socket_ids = list(self._redis_client.smembers(key))
+        if not socket_ids:
+            return []
+        user_ids = self._redis_client.hmget("socket:connections", socket_ids)
+        offline = []
+        for socket_id, user_id in zip(socket_ids, user_ids):
+            if user_id and self.presence_disconnect(worker_id, socket_id, user_id):
+                offline.append(int(user_id))
         self._redis_client.delete(key)
-        self._redis_client.srem("online_users", user_id)
+        return offline
+
+    def count_sockets(self):
+        """集群内的连接总数"""
+        return self._redis_client.hlen("socket:connections")
+
+    def count_online_users(self):
+        """在线人数（ZCARD，O(1)）"""
+        return self._redis_client.zcard("presence:users")
 
     def is_user_online(self, user_id):
         """检查用户是否在线"""
-        key = f"user:{user_id}:online"
-        return self._redis_client.exists(key) > 0
+        return self._redis_client.zscore("presence:users", user_id) is not None
+
+    def filter_online_users(self, user_ids):
+        """从给定用户中筛选出在线的，单次往返"""
+        if not user_ids:
+            return []
+        pipe = self._redis_client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.zscore("presence:users", user_id)
+        return [uid for uid, score in zip(user_ids, pipe.execute()) if score is not None]
+
+    def get_user_socket_ids(self, user_id):
+        """获取用户的全部 socket_id"""
+        return list(self._redis_client.smembers(f"user:{user_id}:sockets"))
 
     def get_user_socket_id(self, user_id):
-        """获取用户的 socket_id"""
-        key = f"user:{user_id}:online"
-        return self._redis_client.get(key)
+        """获取用户的任意一个 socket_id（兼容旧接口）"""
+        return self._redis_client.srandmember(f"user:{user_id}:sockets")
 
     def get_online_users(self):
         """获取所有在线用户ID列表"""
-        return [int(uid) for uid in self._redis_client.smembers("online_users")]
+        return [int(uid) for uid in self._redis_client.zrange("presence:users", 0, -1)]
+
+    def scan_online_users(self, cursor=0, count=100, offset=0):
+        """
+        游标方式分批获取在线用户（ZSCAN），避免一次性拉取整个集合
+        ZSCAN 的 COUNT 只是提示（集合较小时会一次返回全部），单批超过 count 时只取 [offset, offset + count)，
+        剩余部分由下一次以相同游标、新的 offset 读取
+        返回 (next_cursor, next_offset, user_ids, total)，next_cursor 与 next_offset 均为 0 表示遍历结束
+        """
+        pipe = self._redis_client.pipeline(transaction=False)
+        pipe.zscan("presence:users", cursor=cursor, count=count)
+        pipe.zcard("presence:users")
+        (next_cursor, members), total = pipe.execute()
+        user_ids = [int(uid) for uid, _ in members[offset:offset + count]]
+        if offset + count < len(members):
+            return cursor, offset + count, user_ids, total
+        return int(next_cursor), 0, user_ids, total
 
     # =========================
-    # 群聊消息缓存
+    # ID 号段分配
     # =========================
-    # 缓存最新消息到 Redis（最多缓存 limit 条消息）
-    def cache_message(self, room_id, message_data, limit=50):
-        """缓存最新消息到 Redis"""
-        key = f"room:{room_id}:messages"
-        # 使用列表存储，保留最新的 limit 条消息
+    _ID_FLOOR_LUA = """
+    local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+    local floor = tonumber(ARGV[1])
+    if current < floor then
+        redis.call('SET', KEYS[1], floor)
+        return floor
+    end
+    return current
+    """
+
+    def ensure_id_floor(self, name, floor):
+        """保证序列当前值不小于 floor（启动时与数据库 MAX(id) 对齐）"""
+        return int(self._script('_ID_FLOOR_LUA')(keys=[f"idseq:{name}"], args=[int(floor)]))
+
+    def allocate_id_block(self, name, size):
+        """分配一个号段，返回 (起始ID, 结束ID)，闭区间"""
+        end = self._redis_client.incrby(f"idseq:{name}", size)
+        return end - size + 1, end
+
+    # =========================
+    # 用户公开资料缓存（Hash）
+    # =========================
+    def get_user_profiles(self, user_ids):
+        """批量读取用户公开资料，返回 {user_id: profile}，未命中的不在结果中"""
         import json
+        if not user_ids:
+            return {}
+        values = self._redis_client.hmget("user:profiles", [str(uid) for uid in user_ids])
+        return {uid: json.loads(v) for uid, v in zip(user_ids, values) if v}
+
+    def cache_user_profiles(self, profiles):
+        """批量写入用户公开资料 {user_id: profile}，单次往返"""
+        if not profiles:
+            return
+        pipe = self._redis_client.pipeline(transaction=False)
+        pipe.hset("user:profiles", mapping={str(uid): self._encode_message(p) for uid, p in profiles.items()})
+        pipe.expire("user:profiles", 86400)
+        pipe.execute()
+
+    def invalidate_user_profile(self, user_id):
+        """用户资料变更后删除缓存"""
+        self._redis_client.hdel("user:profiles", str(user_id))
+
+    # =========================
+    # 读己之写标记（String，短 TTL）
+    # =========================
+    def pin_users(self, user_ids, ttl):
+        """标记用户刚写入过数据，ttl 秒内其只读请求走主库"""
+        pipe = self._redis_client.pipeline(transaction=False)
+        for user_id in set(user_ids):
+            if user_id:
+                pipe.set(f"replica:pin:{user_id}", 1, ex=ttl)
+        pipe.execute()
+
+    def is_user_pinned(self, user_id):
+        return bool(self._redis_client.exists(f"replica:pin:{user_id}"))
+
+    # =========================
+    # 消息归档标记（String，不过期）
+    # =========================
+    ARCHIVE_IN_USE_KEY = "archive:in_use"
+
+    def set_archive_in_use(self):
+        """归档表开始有数据：所有 worker 的历史查询随即带上归档表"""
+        self._redis_client.set(self.ARCHIVE_IN_USE_KEY, 1)
+
+    def is_archive_in_use(self):
+        return bool(self._redis_client.exists(self.ARCHIVE_IN_USE_KEY))
+
+    # =========================
+    # 用户搜索结果缓存（String，短 TTL）
+    # =========================
+    @staticmethod
+    def _user_search_key(keyword):
+        return f"search:users:{keyword.lower()}"
+
+    def get_user_search(self, keyword):
+        """读取关键词的搜索结果（用户资料列表），未命中返回 None"""
+        value = self._redis_client.get(self._user_search_key(keyword))
+        return loads(value) if value is not None else None
+
+    def cache_user_search(self, keyword, users, ttl=30):
+        self._redis_client.set(self._user_search_key(keyword), encode_json(users), ex=ttl)
+
+    # =========================
+    # 批量写入（单次往返）
+    # =========================
+    @staticmethod
+    def _encode_message(message_data):
+        """消息统一序列化为 JSON 字符串（MessageEnvelope / RawJSON 直接复用已编码的结果）"""
+        if isinstance(message_data, (MessageEnvelope, RawJSON)):
+            return message_data.json
         if isinstance(message_data, dict):
-            message_data = json.dumps(message_data, default=str)
-        self._redis_client.lpush(key, message_data)
-        self._redis_client.ltrim(key, 0, limit - 1)
-        self._redis_client.expire(key, 3600)  # 1小时过期
+            return encode_json(message_data)
+        return message_data
+
+    @staticmethod
+    def _message_id(message_data):
+        if isinstance(message_data, MessageEnvelope):
+            return message_data.id
+        return message_data['id']
+
+    def _push_messages(self, key, messages, limit, ttl):
+        """
+        批量写入消息列表：LPUSH + LTRIM + EXPIRE 放进同一个 MULTI/EXEC 管道，
+        无论批量大小，都只需一次网络往返，且三个操作原子执行。
+        messages 按时间正序（旧->新）传入，LPUSH 后最新消息位于列表头部。
+        """
+        if not messages:
+            return
+        values = [self._encode_message(m) for m in messages]
+        pipe = self._redis_client.pipeline(transaction=True)
+        pipe.lpush(key, *values)
+        pipe.ltrim(key, 0, limit - 1)
+        pipe.expire(key, ttl)
+        pipe.execute()
+
+    # =========================
+    # 群聊消息缓存（读穿透 + 写穿透）
+    # =========================
+    # 房间最新消息窗口由 4 个 key 组成：
+    #   room:{id}:messages          消息 JSON 列表（新->旧）
+    #   room:{id}:messages:ids      与上面一一对应的消息 ID 列表
+    #   room:{id}:messages:meta     newest_id（用于校验）、complete（是否已包含房间全部消息）
+    #   room:{id}:messages:version  每次写入自增，防止回填覆盖并发写入的新消息
+    # meta 存在即表示缓存已预热；写穿透只追加到已预热的缓存，未预热时由读请求从 MySQL 回填。
+
+    # 写穿透：追加消息（仅在缓存已预热时生效）
+    _ROOM_APPEND_LUA = """
+    local limit = tonumber(ARGV[1])
+    local ttl = tonumber(ARGV[2])
+    local n = tonumber(ARGV[3])
+    redis.call('INCR', KEYS[4])
+    redis.call('EXPIRE', KEYS[4], ttl)
+    if redis.call('EXISTS', KEYS[3]) == 0 then
+        return 0
+    end
+    for i = 1, n do
+        redis.call('LPUSH', KEYS[1], ARGV[3 + i])
+        redis.call('LPUSH', KEYS[2], ARGV[3 + n + i])
+    end
+    redis.call('LTRIM', KEYS[1], 0, limit - 1)
+    redis.call('LTRIM', KEYS[2], 0, limit - 1)
+    if redis.call('LLEN', KEYS[2]) >= limit then
+        redis.call('HSET', KEYS[3], 'complete', 0)
+    end
+    redis.call('HSET', KEYS[3], 'newest_id', ARGV[3 + 2 * n])
+    redis.call('EXPIRE', KEYS[1], ttl)
+    redis.call('EXPIRE', KEYS[2], ttl)
+    redis.call('EXPIRE', KEYS[3], ttl)
+    return 1
+    """
+
+    # 从 MySQL 回填：只有在读取版本号之后没有新写入时才生效
+    _ROOM_WARM_LUA = """
+    local current = redis.call('GET', KEYS[4]) or '0'
+    if current ~= ARGV[1] then
+        return 0
+    end
+    local ttl = tonumber(ARGV[2])
+    local n = tonumber(ARGV[4])
+    redis.call('DEL', KEYS[1], KEYS[2])
+    for i = 1, n do
+        redis.call('RPUSH', KEYS[1], ARGV[4 + i])
+        redis.call('RPUSH', KEYS[2], ARGV[4 + n + i])
+    end
+    redis.call('HSET', KEYS[3], 'newest_id', n > 0 and ARGV[5 + n] or '0', 'complete', ARGV[3])
+    redis.call('EXPIRE', KEYS[1], ttl)
+    redis.call('EXPIRE', KEYS[2], ttl)
+    redis.call('EXPIRE', KEYS[3], ttl)
+    return 1
+    """
+
+    # 原子读取一个消息窗口，返回 {状态, has_more, 版本号, 消息...}
+    # 状态：1 命中；0 未预热；-1 校验失败；-2 窗口超出缓存范围
+    _ROOM_READ_LUA = """
+    local version = redis.call('GET', KEYS[4]) or '0'
+    if redis.call('EXISTS', KEYS[3]) == 0 then
+        return {0, 0, version}
+    end
+    local newest_id = redis.call('HGET', KEYS[3], 'newest_id') or '0'
+    local complete = redis.call('HGET', KEYS[3], 'complete') == '1'
+    local ids = redis.call('LRANGE', KEYS[2], 0, -1)
+    local n = #ids
+    if (ids[1] or '0') ~= newest_id or redis.call('LLEN', KEYS[1]) ~= n then
+        return {-1, 0, version}
+    end
+
+    local mode = ARGV[1]
+    local per_page = tonumber(ARGV[3])
+    local first, last, has_more
+    if mode == 'offset' then
+        first = tonumber(ARGV[2])
+    else
+        local idx = nil
+        for i = 1, n do
+            if ids[i] == ARGV[2] then
+                idx = i - 1
+                break
+            end
+        end
+        if idx == nil then
+            return {-2, 0, version}
+        end
+        if mode == 'after' then
+            first = math.max(0, idx - per_page)
+            last = idx - 1
+            has_more = first > 0
+        else
+            first = idx + 1
+        end
+    end
+    if last == nil then
+        last = first + per_page - 1
+        if n < last + 1 and not complete then
+            return {-2, 0, version}
+        end
+        has_more = n > last + 1 or not complete
+    end
+
+    -- 消息 JSON 之后附上对应的 ID，调用方无需解码消息即可拿到游标
+    local result = {1, has_more and 1 or 0, version}
+    if last >= first then
+        local values = redis.call('LRANGE', KEYS[1], first, last)
+        for i = 1, #values do
+            result[#result + 1] = values[i]
+        end
+        for i = 1, #values do
+            result[#result + 1] = ids[first + i]
+        end
+    end
+    return result
+    """
+
+    @staticmethod
+    def _room_history_keys(room_id):
+        base = f"room:{room_id}:messages"
+        return [base, f"{base}:ids", f"{base}:meta", f"{base}:version"]
+
+    def _script(self, name):
+        """懒注册 Lua 脚本（EVALSHA，脚本只传输一次）"""
+        if name not in self._scripts:
+            self._scripts[name] = self._redis_client.register_script(getattr(self, name))
+        return self._scripts[name]
+
+    # 缓存最新消息到 Redis（写穿透）
+    def cache_message(self, room_id, message_data, limit=200):
+        """缓存最新消息到 Redis"""
+        self.cache_messages(room_id, [message_data], limit=limit)
+
+    def cache_messages(self, room_id, messages, limit=200, ttl=3600):
+        """
+        批量写穿透群聊消息（按时间正序传入）：一次脚本调用完成推入、裁剪、续期和版本号更新。
+        返回 True 表示已追加到预热的缓存，False 表示缓存未预热（由下次读取回填）
+        """
+        if not messages:
+            return False
+        values = [self._encode_message(m) for m in messages]
+        ids = [str(self._message_id(m)) for m in messages]
+        return bool(self._script('_ROOM_APPEND_LUA')(
+            keys=self._room_history_keys(room_id),
+            args=[limit, ttl, len(values)] + values + ids
+        ))
+
+    def warm_room_messages(self, room_id, version, messages, complete, ttl=3600):
+        """
+        用 MySQL 查询结果回填房间缓存（messages 为新->旧）
+        version 为读取时拿到的版本号，期间若有新消息写入则放弃回填，返回 False
+        """
+        values = [self._encode_message(m) for m in messages]
+        ids = [str(self._message_id(m)) for m in messages]
+        return bool(self._script('_ROOM_WARM_LUA')(
+            keys=self._room_history_keys(room_id),
+            args=[version, ttl, 1 if complete else 0, len(values)] + values + ids
+        ))
+
+    def read_room_messages(self, room_id, mode, value, per_page):
+        """
+        原子读取房间缓存窗口，mode 为 offset / before / after
+        返回 (状态, has_more, 版本号, 消息 JSON 列表(新->旧), 对应的消息 ID 列表)
+        """
+        result = self._script('_ROOM_READ_LUA')(
+            keys=self._room_history_keys(room_id),
+            args=[mode, value, per_page]
+        )
+        payload = result[3:]
+        half = len(payload) // 2
+        return int(result[0]), bool(result[1]), str(result[2]), payload[:half], [int(i) for i in payload[half:]]
 
     def get_cached_messages(self, room_id, count=50):
         """从 Redis 获取缓存的消息"""
@@ -91,8 +592,7 @@ class RedisClient:
 
     def clear_room_cache(self, room_id):
         """清除房间消息缓存"""
-        key = f"room:{room_id}:messages"
-        self._redis_client.delete(key)
+        self._redis_client.delete(*self._room_history_keys(room_id))
 
     # =========================
     # 私聊消息缓存
@@ -105,14 +605,12 @@ class RedisClient:
 
     def cache_private_message(self, user_a_id, user_b_id, message_data, limit=100):
         """缓存最新私聊消息"""
+        self.cache_private_messages(user_a_id, user_b_id, [message_data], limit=limit)
+
+    def cache_private_messages(self, user_a_id, user_b_id, messages, limit=100):
+        """批量缓存私聊消息（按时间正序传入），私聊缓存 24 小时"""
         key = self._private_key(user_a_id, user_b_id)
-        import json
-        if isinstance(message_data, dict):
-            message_data = json.dumps(message_data, default=str)
-        self._redis_client.lpush(key, message_data)
-        self._redis_client.ltrim(key, 0, limit - 1)
-        # 私聊缓存 24 小时
-        self._redis_client.expire(key, 86400)
+        self._push_messages(key, messages, limit, 86400)
 
     def get_private_messages(self, user_a_id, user_b_id, count=100):
         """获取最新私聊消息（倒序，调用方可反转）"""
@@ -124,6 +622,358 @@ class RedisClient:
         key = self._private_key(user_a_id, user_b_id)
         self._redis_client.delete(key)
 
+    # =========================
+    # 房间成员集合 / 未读计数
+    # =========================
+    # room:{id}:members   Set   房间成员（未读扇出用，未命中时从 MySQL 回填）
+    # unread:{user_id}    Hash  r:{room_id} / u:{对方用户ID} -> 未读数，_loaded 表示已合并 MySQL 中的持久化值
+    # unread:dirty        Set   有变化、待批量写回 MySQL 的用户
+
+    UNREAD_DIRTY_KEY = "unread:dirty"
+
+    # KEYS[1] 为待写集合，KEYS[2..] 为各成员的计数 Hash，ARGV[3..] 为对应的成员 ID
+    _UNREAD_ROOM_LUA = """
+    for i = 2, #KEYS do
+        redis.call('HINCRBY', KEYS[i], ARGV[1], 1)
+        redis.call('EXPIRE', KEYS[i], ARGV[2])
+        redis.call('SADD', KEYS[1], ARGV[i + 1])
+    end
+    return #KEYS - 1
+    """
+
+    _UNREAD_LOAD_LUA = """
+    if redis.call('HEXISTS', KEYS[1], '_loaded') == 1 then
+        return 0
+    end
+    for i = 2, #ARGV, 2 do
+        redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+    redis.call('HSET', KEYS[1], '_loaded', 1)
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+    return 1
+    """
+
+    _UNREAD_CLEAR_LUA = """
+    local count = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+    if count > 0 then
+        redis.call('HSET', KEYS[1], ARGV[1], 0)
+        redis.call('SADD', KEYS[2], ARGV[2])
+    end
+    return count
+    """
+
+    # 成员集合的回填按版本号比较后写入（与房间历史缓存的回填相同）：加入房间时版本号 +1，
+    # 读取 MySQL 期间有人加入的回填被放弃，旧成员列表不会覆盖新成员
+    _ROOM_MEMBERS_FILL_LUA = """
+    if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+        return 0
+    end
+    redis.call('DEL', KEYS[1])
+    for i = 3, #ARGV do
+        redis.call('SADD', KEYS[1], ARGV[i])
+    end
+    if #ARGV > 2 then
+        redis.call('EXPIRE', KEYS[1], ARGV[2])
+    end
+    return 1
+    """
+
+    # 加入房间：版本号 +1；集合已缓存时直接加入新成员，返回是否已缓存
+    _ROOM_MEMBERS_ADD_LUA = """
+    redis.call('INCR', KEYS[2])
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return 0
+    end
+    redis.call('SADD', KEYS[1], ARGV[1])
+    return 1
+    """
+
+    # 集合未缓存时被推迟的房间消息扇出（JSON 消息字典），由后台任务回填成员后处理
+    ROOM_FANOUT_KEY = "room:fanout:pending"
+
+    @staticmethod
+    def _room_members_keys(room_id):
+        return [f"room:{room_id}:members", f"room:{room_id}:members:version"]
+
+    def get_room_members_version(self, room_id):
+        """回填前读取的版本号（回填时原样传回 set_room_members）"""
+        return self._redis_client.get(self._room_members_keys(room_id)[1]) or ''
+
+    def set_room_members(self, room_id, user_ids, version, ttl=86400):
+        """回填房间成员集合，期间版本号变化（有人加入）时放弃，返回是否写入"""
+        return bool(self._script('_ROOM_MEMBERS_FILL_LUA')(
+            keys=self._room_members_keys(room_id), args=[version, ttl] + list(user_ids)
+        ))
+
+    def add_room_member(self, room_id, user_id, ttl=86400):
+        """成员加入：集合已缓存时加入新成员并返回 True，未缓存时返回 False（由调用方回填）"""
+        return bool(self._script('_ROOM_MEMBERS_ADD_LUA')(
+            keys=self._room_members_keys(room_id), args=[user_id, ttl]
+        ))
+
+    def get_room_members(self, room_id):
+        """房间成员 ID 列表，集合未缓存时返回空列表"""
+        return [int(uid) for uid in self._redis_client.smembers(self._room_members_keys(room_id)[0])]
+
+    def defer_room_fanout(self, message_json):
+        self._redis_client.rpush(self.ROOM_FANOUT_KEY, message_json)
+
+    def pop_room_fanouts(self, count):
+        """取出一批被推迟的房间消息扇出（JSON 字符串列表）"""
+        return self._redis_client.lpop(self.ROOM_FANOUT_KEY, count) or []
+
+    def incr_room_unread(self, room_id, sender_id, member_ids, ttl):
+        """房间新消息：除发送者外每个成员的未读数 +1（单次往返），返回被 +1 的成员数"""
+        receivers = [uid for uid in member_ids if int(uid) != int(sender_id)]
+        if not receivers:
+            return 0
+        return int(self._script('_UNREAD_ROOM_LUA')(
+            keys=[self.UNREAD_DIRTY_KEY] + [f"unread:{uid}" for uid in receivers],
+            args=[f"r:{room_id}", ttl] + receivers
+        ))
+
+    def incr_private_unread(self, receiver_id, sender_id, ttl):
+        """私聊新消息：接收者与发送者会话的未读数 +1"""
+        key = f"unread:{receiver_id}"
+        pipe = self._redis_client.pipeline(transaction=False)
+        pipe.hincrby(key, f"u:{sender_id}", 1)
+        pipe.expire(key, ttl)
+        pipe.sadd(self.UNREAD_DIRTY_KEY, receiver_id)
+        pipe.execute()
+
+    def get_unread(self, user_id):
+        """用户全部未读计数（含 _loaded 标记字段）"""
+        return self._redis_client.hgetall(f"unread:{user_id}")
+
+    def get_unread_many(self, user_ids):
+        """批量读取多个用户的未读计数，返回与 user_ids 对应的列表"""
+        pipe = self._redis_client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.hgetall(f"unread:{user_id}")
+        return pipe.execute()
+
+    def load_unread_many(self, persisted, ttl):
+        """
+        批量合并多个用户的持久化未读数并读回合并结果（单次往返），persisted 为 {user_id: {字段: 未读数}}，
+        返回与 persisted 键顺序对应的计数 Hash 列表
+        """
+        pipe = self._redis_client.pipeline(transaction=False)
+        for user_id, counters in persisted.items():
+            args = [ttl]
+            for field, count in counters.items():
+                args.extend([field, count])
+            self._script('_UNREAD_LOAD_LUA')(keys=[f"unread:{user_id}"], args=args, client=pipe)
+            pipe.hgetall(f"unread:{user_id}")
+        return pipe.execute()[1::2]
+
+    def clear_unread(self, user_id, field):
+        """标记已读：未读数清零（字段不存在时不创建），返回清零前的未读数"""
+        return int(self._script('_UNREAD_CLEAR_LUA')(
+            keys=[f"unread:{user_id}", self.UNREAD_DIRTY_KEY],
+            args=[field, user_id]
+        ))
+
+    def pop_unread_dirty(self, count):
+        """取出一批待写回的用户 ID"""
+        return [int(uid) for uid in self._redis_client.spop(self.UNREAD_DIRTY_KEY, count) or []]
+
+    def mark_unread_dirty(self, user_ids):
+        if user_ids:
+            self._redis_client.sadd(self.UNREAD_DIRTY_KEY, *user_ids)
+
+    def count_unread_dirty(self):
+        return self._redis_client.scard(self.UNREAD_DIRTY_KEY)
+
+    # =========================
+    # 已读游标
+    # =========================
+    # read:{user_id}    Hash  r:{room_id} / u:{对方用户ID} -> 最近已读的消息 ID（只增不减）
+    # read:dirty        Set   游标有推进、待批量写回 MySQL 的用户
+
+    READ_DIRTY_KEY = "read:dirty"
+
+    _READ_ADVANCE_LUA = """
+    local current = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+    local message_id = tonumber(ARGV[2])
+    if message_id <= current then
+        return 0
+    end
+    redis.call('HSET', KEYS[1], ARGV[1], message_id)
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    redis.call('SADD', KEYS[2], ARGV[4])
+    return 1
+    """
+
+    def advance_read_cursor(self, user_id, field, message_id, ttl):
+        """推进已读游标（只接受更大的消息 ID），返回是否推进；同一会话的频繁确认在这里合并为一个值"""
+        return bool(self._script('_READ_ADVANCE_LUA')(
+            keys=[f"read:{user_id}", self.READ_DIRTY_KEY],
+            args=[field, int(message_id), ttl, user_id]
+        ))
+
+    def get_read_cursor(self, user_id, field):
+        """读取一个会话的已读游标，未缓存时返回 None"""
+        value = self._redis_client.hget(f"read:{user_id}", field)
+        return int(value) if value is not None else None
+
+    def get_read_cursors_many(self, user_ids):
+        """批量读取多个用户的全部已读游标，返回与 user_ids 对应的列表"""
+        pipe = self._redis_client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.hgetall(f"read:{user_id}")
+        return pipe.execute()
+
+    def get_read_cursor_many(self, user_ids, field):
+        """批量读取多个用户在同一会话的已读游标，未缓存的为 None"""
+        pipe = self._redis_client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.hget(f"read:{user_id}", field)
+        return [int(value) if value is not None else None for value in pipe.execute()]
+
+    def pop_read_dirty(self, count):
+        """取出一批待写回的用户 ID"""
+        return [int(uid) for uid in self._redis_client.spop(self.READ_DIRTY_KEY, count) or []]
+
+    def mark_read_dirty(self, user_ids):
+        if user_ids:
+            self._redis_client.sadd(self.READ_DIRTY_KEY, *user_ids)
+
+    def count_read_dirty(self):
+        return self._redis_client.scard(self.READ_DIRTY_KEY)
+
+    # =========================
+    # 会话列表（收件箱）
+    # =========================
+    # inbox:{user_id}          ZSet  r:{room_id} / u:{对方用户ID} -> 最后活跃时间（毫秒），只增不减
+    # inbox:{user_id}:ready    String 已从 MySQL 重建过，与 ZSet 同时过期
+    # inbox:preview:{会话}      Hash  r:{room_id} / c:{conversation_key} 的最后一条消息预览（同会话成员共享）：
+    #                               score 消息时间（毫秒）、id 消息 ID、json 预览，只接受 (score, id) 更大的消息，
+    #                               与会话列表使用同一 TTL，会话有新消息时续期；没有消息的房间为空预览占位（score = id = 0）
+    # inbox:rebuild            Set   待后台重建会话列表的用户
+
+    INBOX_REBUILD_KEY = "inbox:rebuild"
+
+    # KEYS[i] 为各会话的预览 Hash，ARGV[1] 为 TTL，ARGV[2..] 为对应的 (时间, 消息ID, 预览JSON)
+    _INBOX_PREVIEW_LUA = """
+    local updated = 0
+    for i = 1, #KEYS do
+        local base = 2 + (i - 1) * 3
+        local score, id = tonumber(ARGV[base]), tonumber(ARGV[base + 1])
+        local current = redis.call('HMGET', KEYS[i], 'score', 'id')
+        local current_score, current_id = tonumber(current[1] or '-1'), tonumber(current[2] or '-1')
+        if score > current_score or (score == current_score and id > current_id) then
+            redis.call('HSET', KEYS[i], 'score', score, 'id', id, 'json', ARGV[base + 2])
+            updated = updated + 1
+        end
+        redis.call('EXPIRE', KEYS[i], ARGV[1])
+    end
+    return updated
+    """
+
+    # KEYS 为成对的 (会话列表 ZSet, 重建标记)，每个用户的列表合并同一组 {成员: 时间}
+    _INBOX_MERGE_LUA = """
+    for k = 1, #KEYS, 2 do
+        for i = 3, #ARGV, 2 do
+            local current = redis.call('ZSCORE', KEYS[k], ARGV[i])
+            if not current or tonumber(current) < tonumber(ARGV[i + 1]) then
+                redis.call('ZADD', KEYS[k], ARGV[i + 1], ARGV[i])
+            end
+        end
+        redis.call('ZREMRANGEBYRANK', KEYS[k], 0, -tonumber(ARGV[2]) - 1)
+        redis.call('EXPIRE', KEYS[k], ARGV[1])
+        redis.call('EXPIRE', KEYS[k + 1], ARGV[1])
+    end
+    return #KEYS / 2
+    """
+
+    @staticmethod
+    def _inbox_keys(user_ids):
+        keys = []
+        for user_id in user_ids:
+            keys.extend([f"inbox:{user_id}", f"inbox:{user_id}:ready"])
+        return keys
+
+    @staticmethod
+    def _inbox_preview_key(field):
+        return f"inbox:preview:{field}"
+
+    def set_inbox_previews(self, previews, ttl, client=None):
+        """写入会话最后一条消息预览，previews 为 [(字段, 消息时间毫秒, 消息ID, 预览JSON)]，比已有预览旧的忽略"""
+        keys, args = [], [ttl]
+        for field, score, message_id, preview_json in previews:
+            keys.append(self._inbox_preview_key(field))
+            args.extend([score, message_id, preview_json])
+        if keys:
+            return self._script('_INBOX_PREVIEW_LUA')(keys=keys, args=args, client=client)
+
+    def merge_inbox(self, user_ids, scores, ttl, size, client=None):
+        """合并一组用户的会话列表，scores 为 {成员: 最后活跃时间}，每个成员只取更大的时间"""
+        if not user_ids:
+            return 0
+        args = [ttl, size]
+        for member, score in scores.items():
+            args.extend([member, score])
+        return self._script('_INBOX_MERGE_LUA')(keys=self._inbox_keys(user_ids), args=args, client=client)
+
+    def touch_room_inbox(self, room_id, member_ids, score, ttl, size, preview):
+        """房间新消息：更新共享预览并把房间移到所有成员会话列表的最前（单次往返），preview 为 (字段, 消息ID, 预览JSON)"""
+        field, message_id, preview_json = preview
+        pipe = self._redis_client.pipeline(transaction=False)
+        self.set_inbox_previews([(field, score, message_id, preview_json)], ttl, client=pipe)
+        self.merge_inbox(list(member_ids), {f"r:{room_id}": score}, ttl, size, client=pipe)
+        pipe.execute()
+
+    def touch_private_inbox(self, sender_id, receiver_id, score, ttl, size, preview):
+        """私聊新消息：更新双方会话列表与共享预览（单次往返），preview 为 (字段, 消息ID, 预览JSON)"""
+        field, message_id, preview_json = preview
+        pipe = self._redis_client.pipeline(transaction=False)
+        self.set_inbox_previews([(field, score, message_id, preview_json)], ttl, client=pipe)
+        self.merge_inbox([sender_id], {f"u:{receiver_id}": score}, ttl, size, client=pipe)
+        if int(sender_id) != int(receiver_id):
+            self.merge_inbox([receiver_id], {f"u:{sender_id}": score}, ttl, size, client=pipe)
+        pipe.execute()
+
+    def mark_inbox_ready(self, user_id, ttl):
+        self._redis_client.set(f"inbox:{user_id}:ready", 1, ex=ttl)
+
+    def is_inbox_ready(self, user_id):
+        return bool(self._redis_client.exists(f"inbox:{user_id}:ready"))
+
+    def get_inbox_page(self, user_id, offset, limit):
+        """
+        按最后活跃时间倒序取一页会话（ZREVRANGE，O(log n + limit)），同一往返取回总数、重建标记与未读计数，
+        返回 (是否已重建, 总数, [(成员, 时间)], 未读计数 Hash)
+        """
+        key = f"inbox:{user_id}"
+        pipe = self._redis_client.pipeline(transaction=False)
+        pipe.exists(f"{key}:ready")
+        pipe.zcard(key)
+        pipe.zrevrange(key, offset, offset + limit - 1, withscores=True)
+        pipe.hgetall(f"unread:{user_id}")
+        ready, total, entries, unread = pipe.execute()
+        return bool(ready), total, entries, unread
+
+    def get_inbox_previews(self, fields):
+        """批量读取会话预览，返回与 fields 对应的 JSON 字符串列表（没有或已过期的为 None）"""
+        if not fields:
+            return []
+        pipe = self._redis_client.pipeline(transaction=False)
+        for field in fields:
+            pipe.hget(self._inbox_preview_key(field), 'json')
+        return pipe.execute()
+
+    def request_inbox_rebuild(self, user_id):
+        """登记待后台重建的用户（集合去重，多次请求只重建一次）"""
+        self._redis_client.sadd(self.INBOX_REBUILD_KEY, user_id)
+
+    def pop_inbox_rebuilds(self, count):
+        """取出一批待重建的用户 ID（SPOP 保证同一用户只被一个 worker 取出）"""
+        return [int(uid) for uid in self._redis_client.spop(self.INBOX_REBUILD_KEY, count) or []]
+
+    def count_inbox_rebuilds(self):
+        return self._redis_client.scard(self.INBOX_REBUILD_KEY)
+
 
 # 全局 Redis 客户端实例，单例模式
 # 之所以是"单例模式”，是因为 redis_client = RedisClient() 只在本文件执行一次，
@@ -0,0 +1,186 @@
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import jwt
+from flask import g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+
+from config import SETTINGS
+from utils.redis_client import redis_client
+
+
+class RoutingSession(Session):
+    """
+    读写分离的 Session：标记为只读的请求（ReplicaRouter.read_only）把 SELECT 路由到从库，
+    flush 和批量 UPDATE / DELETE 以及其他所有请求、后台任务始终走主库
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and getattr(clause, 'is_select', False) and has_app_context():
+            replica = g.get('_read_replica')
+            if replica is not None:
+                return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    """
+    从库路由与延迟检测
+
+    - 从库以 SQLALCHEMY_BINDS 中 replica_0、replica_1 … 的形式注册，与主库共用连接池参数
+    - 延迟：后台任务定期在主库 replica_heartbeat 表写入当前时间，再从各从库读回，
+      差值即复制延迟；超过 max_lag、读取失败或尚未检测过的从库不参与路由，全部不可用时回落主库
+    - 读己之写：用户写入后在 Redis 中标记 pin_seconds 秒，期间该用户的只读请求仍走主库
+    - 缓存回填：写入共享缓存的数据在 primary() 块中从主库读取
+    """
+
+    def __init__(self, urls=(), max_lag=5.0, check_interval=2.0, pin_seconds=10):
+        self.names = [f'replica_{i}' for i in range(len(urls))]
+        self.urls = list(urls)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.pin_seconds = pin_seconds
+        self._lag = {}  # {从库名: 最近一次测得的延迟（秒），不可用为 None}
+        self._healthy = []
+        self._next = 0
+        self._started = False
+        self.routed = 0
+        self.fallbacks = 0
+
+    @property
+    def enabled(self):
+        return bool(self.names)
+
+    def binds(self):
+        """供 app.config['SQLALCHEMY_BINDS'] 使用的从库连接串"""
+        return dict(zip(self.names, self.urls))
+
+    def choose(self, user_id=None):
+        """为一次只读请求挑选从库（轮询），不可用或用户处于读己之写窗口时返回 None（走主库）"""
+        if not self.enabled:
+            return None
+        if not self._healthy or (user_id is not None and self.is_pinned(user_id)):
+            self.fallbacks += 1
+            return None
+        self._next = (self._next + 1) % len(self._healthy)
+        self.routed += 1
+        return self._healthy[self._next]
+
+    def read_only(self, fn):
+        """只读路由装饰器（放在 @bp.route 下方）：本次请求内的查询走同一个从库"""
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if self.enabled:
+                g._read_replica = self.choose(self._request_user_id())
+            return fn(*args, **kwargs)
+        return wrapper
+
+    @contextmanager
+    def primary(self):
+        """块内的查询走主库：回填共享缓存时使用，从库上的旧数据一旦进入缓存，版本校验无法发现"""
+        replica = g.get('_read_replica') if has_app_context() else None
+        if replica is None:
+            yield
+            return
+        g._read_replica = None
+        try:
+            yield
+        finally:
+            g._read_replica = replica
+
+    @staticmethod
+    def _request_user_id():
+        """从请求头的 JWT 中取用户 ID（只解码不查库，认证仍由路由自己完成）"""
+        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        if not token:
+            return None
+        try:
+            payload = jwt.decode(token, SETTINGS['jwt']['secret_key'], algorithms=[SETTINGS['jwt']['algorithm']])
+            return payload.get('user_id')
+        except Exception:
+            return None
+
+    # =========================
+    # 读己之写
+    # =========================
+    def pin_primary(self, *user_ids):
+        """用户刚写入数据：pin_seconds 秒内其只读请求走主库，避免读到复制延迟前的旧数据"""
+        if not self.enabled:
+            return
+        try:
+            redis_client.pin_users(user_ids, self.pin_seconds)
+        except Exception as e:
+            print(f'标记读己之写失败: {str(e)}')
+
+    def is_pinned(self, user_id):
+        try:
+            return redis_client.is_user_pinned(user_id)
+        except Exception:
+            # 无法确认时保守地走主库
+            return True
+
+    # =========================
+    # 延迟检测
+    # =========================
+    def check(self, db):
+        """写一次主库心跳并读取各从库的心跳，更新可用从库列表（需在 app_context 中调用）"""
+        if not self.enabled:
+            return
+        now_ms = int(time.time() * 1000)
+        with db.engines[None].begin() as conn:
+            updated = conn.execute(text('UPDATE replica_heartbeat SET beat_ms = :now WHERE id = 1'), {'now': now_ms})
+            if updated.rowcount == 0:
+                conn.execute(text('INSERT INTO replica_heartbeat (id, beat_ms) VALUES (1, :now)'), {'now': now_ms})
+
+        healthy = []
+        for name in self.names:
+            try:
+                with db.engines[name].connect() as conn:
+                    beat_ms = conn.execute(text('SELECT beat_ms FROM replica_heartbeat WHERE id = 1')).scalar()
+                lag = max(0.0, time.time() - beat_ms / 1000) if beat_ms is not None else None
+            except Exception as e:
+                print(f'从库 {name} 延迟检测失败: {str(e)}')
+                lag = None
+            self._lag[name] = lag
+            if lag is not None and lag <= self.max_lag:
+                healthy.append(name)
+        self._healthy = healthy
+
+    def start(self, sio, app, db):
+        """启动延迟检测后台任务（每个 worker 调用一次）"""
+        if not self.enabled or self._started:
+            return
+        self._started = True
+        sio.start_background_task(self._check_loop, sio, app, db)
+
+    def _check_loop(self, sio, app, db):
+        while True:
+            try:
+                with app.app_context():
+                    self.check(db)
+            except Exception as e:
+                self._healthy = []
+                print(f'从库延迟检测失败: {str(e)}')
+            sio.sleep(self.check_interval)
+
+    def status(self):
+        return {
+            'enabled': self.enabled,
+            'healthy': list(self._healthy),
+            'lag_seconds': {name: (round(lag, 3) if lag is not None else None) for name, lag in self._lag.items()},
+            'routed': self.routed,
+            'fallbacks': self.fallbacks
+        }
+
+
+_replica_config = SETTINGS['database']['replicas']
+
+# 全局从库路由实例
+replica_router = ReplicaRouter(
+    urls=_replica_config['urls'],
+    max_lag=_replica_config['max_lag'],
+    check_interval=_replica_config['check_interval'],
+    pin_seconds=_replica_config['pin_seconds']
+)
@@ -0,0 +1,82 @@
+import threading
+
+
+def user_room(user_id):
+    """用户的个人 Socket.IO 房间：该用户的所有连接（可能分布在不同 worker）都会加入"""
+    return f'user:{user_id}'
+
+
+class SocketSession:
+    """单个 Socket.IO 连接的会话状态：认证用户快照 + 所在房间集合"""
+
+    def __init__(self, sid, user, room_ids=()):
+        self.sid = sid
+        self.user_id = user['id']
+        self.user = user  # User.to_dict() 快照，发送消息时直接作为 sender 使用
+        self.room_ids = set(int(rid) for rid in room_ids)
+
+    @property
+    def username(self):
+        return self.user.get('username')
+
+    def is_member(self, room_id):
+        return int(room_id) in self.room_ids
+
+
+class SocketSessionRegistry:
+    """
+    进程内的连接会话表 {socket_id: SocketSession}
+    连接时填充一次，之后加入/发送消息都只读内存；
+    房间成员关系变化时（routes/rooms.py）按 user_id 同步到该用户的所有连接。
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    def add(self, session):
+        with self._lock:
+            self._sessions[session.sid] = session
+            self._by_user.setdefault(session.user_id, set()).add(session.sid)
+
+    def remove(self, sid):
+        """移除连接会话，返回被移除的会话（不存在返回 None）"""
+        with self._lock:
+            session = self._sessions.pop(sid, None)
+            if session:
+                sids = self._by_user.get(session.user_id)
+                if sids:
+                    sids.discard(sid)
+                    if not sids:
+                        del self._by_user[session.user_id]
+            return session
+
+    def get(self, sid):
+        return self._sessions.get(sid)
+
+    def sessions_for_user(self, user_id):
+        with self._lock:
+            return [self._sessions[sid] for sid in self._by_user.get(user_id, ())]
+
+    def add_room(self, user_id, room_id):
+        """用户加入/创建房间后同步到其所有连接"""
+        for session in self.sessions_for_user(user_id):
+            session.room_ids.add(int(room_id))
+
+    def items(self):
+        """[(socket_id, user_id)]"""
+        return [(sid, session.user_id) for sid, session in list(self._sessions.items())]
+
+    def user_ids(self):
+        return [session.user_id for session in list(self._sessions.values())]
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, sid):
+        return sid in self._sessions
+
+
+# 全局连接会话表
+socket_sessions = SocketSessionRegistry()
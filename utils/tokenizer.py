@@ -0,0 +1,49 @@
+import re
+import unicodedata
+from collections import Counter
+
+# 单个词元最大长度（与 message_tokens.token 列一致）
+MAX_TOKEN_LENGTH = 32
+# 用户名 / 邮箱子串搜索的 n-gram 长度（与 user_search_grams.gram 列一致）
+GRAM_SIZE = 3
+
+# 中日韩字符：统一表意文字（含扩展 A）、平假名/片假名、韩文音节
+_CJK = '\u3400-\u4dbf\u4e00-\u9fff\u3040-\u30ff\uac00-\ud7af'
+_TOKEN_RE = re.compile(f'[{_CJK}]+|[0-9a-z]+')
+_CJK_RE = re.compile(f'[{_CJK}]')
+
+
+def is_cjk(text):
+    return bool(_CJK_RE.match(text))
+
+
+def tokenize(text):
+    """
+    切分为词元并统计词频，返回 Counter {词元: 次数}
+    - 中日韩文字没有空格分词，按相邻两字（bigram）切分，单字片段保留单字
+    - 拉丁字母和数字按连续片段切分，统一小写（NFKC 规范化，全角转半角）
+    """
+    if not text:
+        return Counter()
+    text = unicodedata.normalize('NFKC', text).lower()
+    tokens = Counter()
+    for run in _TOKEN_RE.findall(text):
+        if is_cjk(run):
+            if len(run) == 1:
+                tokens[run] += 1
+            else:
+                for i in range(len(run) - 1):
+                    tokens[run[i:i + 2]] += 1
+        else:
+            tokens[run[:MAX_TOKEN_LENGTH]] += 1
+    return tokens
+
+
+def make_grams(*texts):
+    """小写后按 GRAM_SIZE 个字符滑动切分，返回 gram 集合（用于用户名 / 邮箱子串搜索）"""
+    grams = set()
+    for text in texts:
+        text = (text or '').lower()
+        for i in range(len(text) - GRAM_SIZE + 1):
+            grams.add(text[i:i + GRAM_SIZE])
+    return grams
@@ -0,0 +1,183 @@
+from datetime import datetime
+
+from config import SETTINGS
+from utils.redis_client import redis_client
+
+
+def room_field(room_id):
+    return f'r:{int(room_id)}'
+
+
+def private_field(peer_id):
+    return f'u:{int(peer_id)}'
+
+
+def room_member_ids(room_id):
+    """
+    房间成员 ID 列表（Redis 集合缓存，未命中时从 MySQL 回填），供未读计数和会话列表扇出共用
+    回填会查询 MySQL，只在加入房间和后台任务中调用；发送消息只读 Redis，未命中时推迟扇出（见 Inbox.defer_room_fanout）
+    """
+    member_ids = redis_client.get_room_members(room_id)
+    if not member_ids:
+        from models.room import RoomMember
+        version = redis_client.get_room_members_version(room_id)
+        member_ids = [uid for (uid,) in RoomMember.query.with_entities(RoomMember.user_id).filter_by(room_id=room_id)]
+        redis_client.set_room_members(room_id, member_ids, version)
+    return member_ids
+
+
+class UnreadCounters:
+    """
+    未读计数（Redis Hash 实时计数 + MySQL 批量持久化）
+
+    - 发送：房间消息一次 Lua 调用为除发送者外的所有成员 +1（成员集合缓存在 Redis，未命中时从 MySQL 回填，
+      每个成员的计数 key 都经 KEYS 传入脚本）；
+      私聊消息为接收者 +1。变化的用户记入 unread:dirty
+    - 已读：mark_read 把对应会话清零
+    - 读取：一次 HGETALL 取回用户全部会话的未读数，与消息量无关
+    - 持久化：后台任务每 flush_interval 秒取出一批变化的用户，整份计数批量 upsert 到 unread_counters；
+      Redis 中的计数过期或丢失后，首次访问时把 MySQL 中的值合并回来（_loaded 标记只合并一次）
+    """
+
+    def __init__(self, ttl=604800, flush_interval=5, flush_batch=500):
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._started = False
+        self.flushes = 0
+        self.persisted = 0
+
+    # =========================
+    # 计数
+    # =========================
+    def on_room_message(self, room_id, sender_id, member_ids=None):
+        """房间新消息扇出，返回被 +1 的成员数（member_ids 为调用方已取得的房间成员）"""
+        if member_ids is None:
+            member_ids = room_member_ids(room_id)
+        return redis_client.incr_room_unread(room_id, sender_id, member_ids, self.ttl)
+
+    def on_join(self, room_id, user_id):
+        """成员加入 / 创建房间（提交之后调用）：把新成员加入扇出用的成员集合，未缓存时立即回填"""
+        if not redis_client.add_room_member(room_id, user_id):
+            room_member_ids(room_id)
+
+    def on_private_message(self, sender_id, receiver_id):
+        if int(sender_id) != int(receiver_id):
+            redis_client.incr_private_unread(receiver_id, sender_id, self.ttl)
+
+    def mark_read(self, user_id, room_id=None, peer_id=None):
+        """会话标记为已读，返回清零前的未读数"""
+        self.ensure_loaded(user_id)
+        field = room_field(room_id) if room_id else private_field(peer_id)
+        return redis_client.clear_unread(user_id, field)
+
+    # =========================
+    # 读取
+    # =========================
+    def ensure_loaded(self, user_id, counters=None):
+        """Redis 中尚未合并 MySQL 持久化值时合并一次，返回合并后的计数 Hash"""
+        if counters is None:
+            counters = redis_client.get_unread(user_id)
+        return self.ensure_loaded_many([user_id], [counters])[0]
+
+    def ensure_loaded_many(self, user_ids, counters_list):
+        """
+        批量版 ensure_loaded：尚未合并持久化值的用户用一条 IN 查询取回 MySQL 中的计数，
+        一次 Redis 往返合并并重新读取，返回与 user_ids 对应的计数 Hash 列表
+        """
+        missing = [user_id for user_id, counters in zip(user_ids, counters_list) if '_loaded' not in counters]
+        if not missing:
+            return counters_list
+        from models.unread_counter import UnreadCounter
+        persisted = {user_id: {} for user_id in missing}
+        for row in UnreadCounter.query.filter(UnreadCounter.user_id.in_(missing), UnreadCounter.count > 0):
+            persisted[row.user_id][row.conversation] = row.count
+        reloaded = dict(zip(missing, redis_client.load_unread_many(persisted, self.ttl)))
+        return [reloaded.get(user_id, counters) for user_id, counters in zip(user_ids, counters_list)]
+
+    def get_badges(self, user_id):
+        """用户全部未读计数：{'rooms': {room_id: n}, 'private': {user_id: n}, 'total': n}，只返回未读数大于 0 的会话"""
+        counters = self.ensure_loaded(user_id)
+        rooms, private = {}, {}
+        for field, value in counters.items():
+            count = int(value)
+            if field == '_loaded' or count <= 0:
+                continue
+            kind, _, target = field.partition(':')
+            if kind == 'r':
+                rooms[int(target)] = count
+            elif kind == 'u':
+                private[int(target)] = count
+        return {
+            'rooms': rooms,
+            'private': private,
+            'total': sum(rooms.values()) + sum(private.values())
+        }
+
+    # =========================
+    # 批量持久化
+    # =========================
+    def flush(self):
+        """把一批有变化的用户的计数写回 MySQL，返回写入行数（需在 app_context 中调用）"""
+        from models import db
+        from models.unread_counter import UnreadCounter
+        from utils.bulk import bulk_upsert
+
+        user_ids = redis_client.pop_unread_dirty(self.flush_batch)
+        if not user_ids:
+            return 0
+        try:
+            now = datetime.utcnow()
+            rows = []
+            # 尚未合并持久化值的计数只是增量，先（批量）合并再写回，避免覆盖 MySQL 中的旧值
+            counters_list = self.ensure_loaded_many(user_ids, redis_client.get_unread_many(user_ids))
+            for user_id, counters in zip(user_ids, counters_list):
+                rows.extend(
+                    {'user_id': user_id, 'conversation': field, 'count': int(value), 'updated_at': now}
+                    for field, value in counters.items() if field != '_loaded'
+                )
+            bulk_upsert(db.session, UnreadCounter, rows, ('count', 'updated_at'))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # 写回失败的用户放回待写集合，下一轮重试
+            redis_client.mark_unread_dirty(user_ids)
+            raise
+        self.flushes += 1
+        self.persisted += len(rows)
+        return len(rows)
+
+    def start(self, sio, app):
+        """启动批量持久化后台任务（每个 worker 调用一次，SPOP 保证同一用户不会被多个 worker 同时写回）"""
+        if self._started:
+            return
+        self._started = True
+        sio.start_background_task(self._flush_loop, sio, app)
+
+    def _flush_loop(self, sio, app):
+        while True:
+            sio.sleep(self.flush_interval)
+            try:
+                with app.app_context():
+                    # 一轮写完所有积压，每批之间让出协程
+                    while self.flush() and redis_client.count_unread_dirty():
+                        sio.sleep(0)
+            except Exception as e:
+                print(f'未读计数写回失败: {str(e)}')
+
+    def stats(self):
+        return {
+            'flushes': self.flushes,
+            'persisted_rows': self.persisted,
+            'pending_users': redis_client.count_unread_dirty()
+        }
+
+
+_unread_config = SETTINGS['unread']
+
+# 全局未读计数实例
+unread_counters = UnreadCounters(
+    ttl=_unread_config['ttl'],
+    flush_interval=_unread_config['flush_interval'],
+    flush_batch=_unread_config['flush_batch']
+)